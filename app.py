@@ -1,68 +1,145 @@
+import asyncio
 import os
+import threading
 from dotenv import load_dotenv
 import chainlit as cl
 from typing import TypedDict, Optional, List, Dict, Any
-from graph.graph_setup import build_graph
-from tools.weather import obter_previsao_tempo_weatherapi
+from graph.graph_setup import get_compiled_graph, warmup
+from tools.weather import weather_provider
 from graph.state_types import IcarusState
 from tools.email import send_email
+from tools.runtime import tool_runtime
+from utils.history import conversation_history
+from utils.session_store import get_session_store
 
 load_dotenv()
 
-#histórico por sessão
-chat_histories = {}
+#estado de cada sessão fora do processo (SESSION_STORE): sobrevive a reinícios e é visto por todos os workers
+session_store = get_session_store()
+#resumo do histórico rodando em background, por sessão
+history_compactions = {}
 
-@cl.on_chat_start
-async def start():
-    session = cl.user_session.get("id")
-    initial_state = {
+#aquece grafo, embeddings e LLM em background assim que o servidor sobe
+threading.Thread(target=warmup, daemon=True).start()
+
+#tarefas de previsão do tempo em andamento (referência para não serem coletadas antes de terminar)
+_weather_tasks = set()
+
+async def completar_boas_vindas(mensagem: cl.Message):
+    #a previsão chega depois: a mensagem de boas-vindas não espera a WeatherAPI
+    previsao = await weather_provider.previsao()
+    mensagem.content += "\n\n" + previsao
+    await mensagem.update()
+
+def get_session_key():
+    #o id da conversa (thread) continua o mesmo quando o navegador reconecta, inclusive depois de um reinício
+    thread_id = getattr(cl.context.session, "thread_id", None)
+    return thread_id or cl.user_session.get("id")
+
+def novo_estado():
+    return {
+        "user_id": get_memory_user_id(),
         "user_input": "",
         "decision": None,
         "messages": [],
+        "history_summary": "",
+        "history_recorded": 0,
         "agenda": {},
         "email": {},
         "invocation": None,
         "invocations_list": [],
+        "invocations_shown": 0,
+        "retrieval": {},
     }
-    chat_histories[session] = initial_state
-    compiled_graph = build_graph(IcarusState)
-    chat_histories[session + "_graph"] = compiled_graph
-    previsao = obter_previsao_tempo_weatherapi()
+
+async def compactar_historico(session, state):
+    await conversation_history.compact_stored(session_store, session, state)
+
+async def esperar_compactacao(session):
+    #no mesmo worker espera o resumo do turno anterior (senão os mesmos turnos seriam resumidos de
+    #novo); entre workers, compact_stored aplica o resumo ao estado gravado sem perder turnos
+    pendente = history_compactions.pop(session, None)
+    if pendente is not None:
+        await pendente
+
+def get_memory_user_id():
+    #usuário autenticado tem memória própria; sem login, cada conversa tem a sua (a mesma ao reconectar).
+    #a memória compartilhada entre todos os anônimos só com MEMORY_ANONYMOUS_SHARD=shared
+    user = cl.user_session.get("user")
+    if user:
+        return user.identifier
+    if os.environ.get("MEMORY_ANONYMOUS_SHARD", "session") == "shared":
+        return None
+    return f"anonimo:{get_session_key()}"
+
+@cl.on_chat_start
+async def start():
+    session = get_session_key()
+    #reconexão de uma conversa já existente (ex.: depois de reiniciar o servidor) mantém o estado
+    if await session_store.aget(session) is None:
+        await session_store.aset(session, novo_estado())
     mensagem_inicial = (
-        "Olá! Sou Icarus, seu assistente pessoal. Posso ajudar com conversas, agendar eventos na sua agenda e ler seus e-mails do Gmail! Como posso ajudar?\n\n" + previsao
+        "Olá! Sou Icarus, seu assistente pessoal. Posso ajudar com conversas, agendar eventos na sua agenda e ler seus e-mails do Gmail! Como posso ajudar?"
     )
-    await cl.Message(content=mensagem_inicial).send()
+    previsao = weather_provider.cached()
+    if previsao is not None:
+        #previsão em cache (se vencida, é atualizada em background): sai junto com as boas-vindas
+        await cl.Message(content=mensagem_inicial + "\n\n" + previsao).send()
+        return
+    mensagem = cl.Message(content=mensagem_inicial)
+    await mensagem.send()
+    task = asyncio.create_task(completar_boas_vindas(mensagem))
+    _weather_tasks.add(task)
+    task.add_done_callback(_weather_tasks.discard)
 
 @cl.on_message
 async def main(message: cl.Message):
-    session = cl.user_session.get("id")
-    state = chat_histories.get(session)
-    compiled_graph = chat_histories.get(session + "_graph") #varias usaruarios
+    session = get_session_key()
+    compiled_graph = get_compiled_graph()
+    await esperar_compactacao(session)
+    #sessão expirada ou aberta antes de existir o store: começa do zero em vez de falhar
+    state = await session_store.aget(session) or novo_estado()
     state["user_input"] = message.content
-    # Limpa a lista de respostas antes de processar nova mensagem
+    # Limpa a lista de respostas e a busca de memória do turno anterior antes de processar nova mensagem
     state["invocations_list"] = []
+    state["invocations_shown"] = 0
+    state["history_recorded"] = 0
+    state["retrieval"] = {}
     result_state = await compiled_graph.ainvoke(state)
-    chat_histories[session] = result_state
-    respostas = result_state.get("invocations_list", [])
-    resposta_final = "\n\n".join(respostas) if respostas else result_state.get("invocation", "")
-    await cl.Message(content=resposta_final).send()
+    await session_store.aset(session, result_state)
+    # respostas transmitidas durante o grafo (conversa_node) já estão na tela
+    shown = result_state.get("invocations_shown", 0)
+    respostas = result_state.get("invocations_list", [])[shown:]
+    if respostas or not shown:
+        resposta_final = "\n\n".join(respostas) if respostas else result_state.get("invocation", "")
+        await cl.Message(content=resposta_final).send()
+    #turnos antigos viram resumo depois da resposta, fora do caminho do usuário
+    history_compactions[session] = asyncio.create_task(compactar_historico(session, result_state))
 
 @cl.action_callback("send_email")
 async def on_send_email(action):
-    session = cl.user_session.get("id")
-    state = chat_histories.get(session)
+    session = get_session_key()
+    await esperar_compactacao(session)
+    state = await session_store.aget(session)
     
     if state and state.get("email", {}).get("pending_email"):
         pending_email = state["email"]["pending_email"]
         
-        #envia o eail
-        result = send_email(
-            to_email=pending_email['to_email'],
-            subject=pending_email['subject'],
-            body=pending_email['body'],
-            cc=pending_email.get('cc'),
-            bcc=pending_email.get('bcc')
-        )
+        #envia o eail (sem novas tentativas: um envio que estourou o tempo pode ter saído)
+        try:
+            result = await tool_runtime.run(
+                "gmail",
+                send_email,
+                to_email=pending_email['to_email'],
+                subject=pending_email['subject'],
+                body=pending_email['body'],
+                cc=pending_email.get('cc'),
+                bcc=pending_email.get('bcc'),
+                user_id=state.get("user_id"),
+                retries=0,
+            )
+        except Exception as e:
+            result = {"success": False, "message": f"Erro ao enviar e-mail: {e}"}
         
         if result['success']:
             await cl.Message(
@@ -73,19 +150,20 @@ async def on_send_email(action):
         
         #remove o email pendente
         state["email"].pop("pending_email", None)
-        chat_histories[session] = state
+        await session_store.aset(session, state)
     else:
         await cl.Message(content="❌ Não há e-mail pendente para enviar.").send()
 
 @cl.action_callback("cancel_email")
 async def on_cancel_email(action):
-    session = cl.user_session.get("id")
-    state = chat_histories.get(session)
+    session = get_session_key()
+    await esperar_compactacao(session)
+    state = await session_store.aget(session)
     
     if state and state.get("email", {}).get("pending_email"):
         #remove o email pendente
         state["email"].pop("pending_email", None)
-        chat_histories[session] = state
+        await session_store.aset(session, state)
         await cl.Message(content="❌ Envio de e-mail cancelado.").send()
     else:
         await cl.Message(content="❌ Não há e-mail pendente para cancelar.").send()
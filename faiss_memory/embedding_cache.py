@@ -0,0 +1,93 @@
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    # o all-MiniLM-L6-v2 não diferencia maiúsculas, então normalizar não muda o embedding
+    text = unicodedata.normalize("NFC", text)
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class EmbeddingCache:
+    """
+    Cache LRU de embeddings, chaveado por hash do texto normalizado + nome do modelo.
+
+    Opcionalmente persistido em disco (`persist_path`, formato .npz) para sobreviver
+    a reinícios.
+    """
+
+    def __init__(self, model_name: str, max_entries: int = 4096, persist_path: Optional[str] = None):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.persist_path = persist_path
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if persist_path:
+            self.load()
+
+    def key(self, text: str) -> str:
+        return hashlib.sha1(f"{self.model_name}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        key = self.key(text)
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def put(self, text: str, embedding: np.ndarray):
+        key = self.key(text)
+        embedding = np.array(embedding, dtype=np.float32)
+        # o mesmo array é devolvido a vários chamadores; impede alterações in-place
+        embedding.flags.writeable = False
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def save(self):
+        if not self.persist_path:
+            return
+        with self._lock:
+            keys = list(self._entries.keys())
+            vectors = np.stack(list(self._entries.values())) if keys else np.empty((0, 0), dtype=np.float32)
+        os.makedirs(os.path.dirname(self.persist_path) or ".", exist_ok=True)
+        tmp_path = self.persist_path + ".tmp.npz"
+        np.savez(tmp_path, keys=np.array(keys), vectors=vectors)
+        os.replace(tmp_path, self.persist_path)
+
+    def load(self):
+        if not os.path.exists(self.persist_path):
+            return
+        try:
+            with np.load(self.persist_path) as data:
+                keys, vectors = data["keys"], data["vectors"]
+        except Exception as e:
+            print(f"Erro ao carregar o cache de embeddings: {e}")
+            return
+        with self._lock:
+            for key, vector in zip(keys[-self.max_entries:], vectors[-self.max_entries:]):
+                self._entries[str(key)] = vector
+
+    def get_stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
@@ -0,0 +1,158 @@
+import asyncio
+import atexit
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from faiss_memory.embedding_cache import EmbeddingCache
+
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+
+
+class EmbeddingService:
+    """
+    Gera embeddings fora do event loop, agrupando pedidos concorrentes em lotes.
+
+    Os pedidos assíncronos (`aencode`) entram numa fila; um coletor junta até
+    `max_batch_size` textos ou espera no máximo `max_wait_ms` desde o primeiro pedido
+    e faz uma única chamada `encode` num pool de threads. Assim várias sessões
+    compartilham o mesmo forward do modelo e o event loop do Chainlit nunca bloqueia.
+
+    Textos já vistos são servidos pelo EmbeddingCache, sem passar pelo modelo.
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME, max_batch_size: Optional[int] = None,
+                 max_wait_ms: Optional[float] = None, workers: Optional[int] = None,
+                 cache_size: Optional[int] = None, cache_path: Optional[str] = None):
+        """
+        Args:
+            model_name: Modelo do Sentence Transformers
+            max_batch_size: Máximo de textos por chamada encode (padrão: EMBEDDING_MAX_BATCH ou 32)
+            max_wait_ms: Espera máxima para completar um lote (padrão: EMBEDDING_MAX_WAIT_MS ou 10)
+            workers: Threads de encode (padrão: EMBEDDING_WORKERS ou 1)
+            cache_size: Entradas do cache de embeddings; 0 desativa (padrão: EMBEDDING_CACHE_SIZE ou 4096)
+            cache_path: Arquivo .npz para persistir o cache (padrão: EMBEDDING_CACHE_PATH, opcional)
+        """
+        self.model_name = model_name
+        self.max_batch_size = max_batch_size or int(os.environ.get("EMBEDDING_MAX_BATCH", 32))
+        if max_wait_ms is None:
+            max_wait_ms = float(os.environ.get("EMBEDDING_MAX_WAIT_MS", 10))
+        self.max_wait = max_wait_ms / 1000
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers or int(os.environ.get("EMBEDDING_WORKERS", 1)),
+            thread_name_prefix="embedding"
+        )
+        if cache_size is None:
+            cache_size = int(os.environ.get("EMBEDDING_CACHE_SIZE", 4096))
+        cache_path = cache_path or os.environ.get("EMBEDDING_CACHE_PATH") or None
+        self.cache = EmbeddingCache(model_name, cache_size, cache_path) if cache_size > 0 else None
+        if self.cache and cache_path:
+            atexit.register(self.cache.save)
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._queue = None
+        self._queue_loop = None
+        self.batches = 0
+        self.encoded_texts = 0
+
+    @property
+    def model(self) -> SentenceTransformer:
+        with self._model_lock:
+            if self._model is None:
+                self._model = SentenceTransformer(self.model_name)
+            return self._model
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode(self, text: str) -> np.ndarray:
+        """Versão síncrona, para quem já está fora do event loop."""
+        cached = self.cache.get(text) if self.cache else None
+        if cached is not None:
+            return cached
+        embedding = self.encode_batch([text])[0]
+        if self.cache:
+            self.cache.put(text, embedding)
+        return embedding
+
+    def encode_batch(self, texts: List[str]) -> np.ndarray:
+        embeddings = self.model.encode(texts, batch_size=self.max_batch_size)
+        self.batches += 1
+        self.encoded_texts += len(texts)
+        return np.asarray(embeddings, dtype=np.float32)
+
+    async def aencode(self, text: str) -> np.ndarray:
+        cached = self.cache.get(text) if self.cache else None
+        if cached is not None:
+            return cached
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._get_queue(loop).put_nowait((text, future))
+        return await future
+
+    def warmup(self):
+        """Carrega o modelo e faz um encode de aquecimento."""
+        self.encode("aquecimento")
+
+    def _get_queue(self, loop) -> asyncio.Queue:
+        # a fila e o coletor pertencem ao loop em execução (um por processo no Chainlit)
+        if self._queue is None or self._queue_loop is not loop:
+            self._queue = asyncio.Queue()
+            self._queue_loop = loop
+            loop.create_task(self._collector(self._queue))
+        return self._queue
+
+    async def _collector(self, queue: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # o mesmo texto pedido por várias sessões no mesmo lote é codificado uma vez só
+            texts = list(dict.fromkeys(text for text, _ in batch))
+            try:
+                embeddings = await loop.run_in_executor(self._executor, self.encode_batch, texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            by_text = dict(zip(texts, embeddings))
+            if self.cache:
+                for text, embedding in by_text.items():
+                    self.cache.put(text, embedding)
+            for text, future in batch:
+                if not future.done():
+                    future.set_result(by_text[text])
+
+    def get_stats(self):
+        return {
+            "batches": self.batches,
+            "encoded_texts": self.encoded_texts,
+            "avg_batch_size": self.encoded_texts / self.batches if self.batches else 0.0,
+            "cache": self.cache.get_stats() if self.cache else None
+        }
+
+
+_embedding_service = None
+_embedding_service_lock = threading.Lock()
+
+def get_embedding_service() -> EmbeddingService:
+    """Serviço de embeddings compartilhado por todas as instâncias de memória."""
+    global _embedding_service
+    with _embedding_service_lock:
+        if _embedding_service is None:
+            _embedding_service = EmbeddingService()
+        return _embedding_service
@@ -0,0 +1,156 @@
+import math
+import os
+from typing import Optional
+
+import faiss
+import numpy as np
+
+INDEX_BACKENDS = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+INDEX_METRICS = ("cosine", "l2")
+
+
+class IndexConfig:
+    """
+    Configuração do índice vetorial da memória de longo prazo.
+
+    A memória começa sempre com um índice flat (busca exata). Quando o número de
+    vetores passa de `promote_at`, ela é promovida em background para `backend`.
+
+    Com a métrica "cosine" os vetores são normalizados e o índice usa produto interno,
+    então a distância retornada pelo FAISS já é a similaridade de cosseno (-1 a 1).
+    "l2" mantém o comportamento antigo (IndexFlatL2 sobre vetores crus).
+
+    Args:
+        backend: "flat", "ivf_flat", "ivf_pq" ou "hnsw"
+        metric: "cosine" ou "l2"
+        promote_at: Número de vetores a partir do qual o índice ANN é treinado
+        nlist: Número de listas do IVF (None = calculado a partir do tamanho)
+        pq_m: Número de subquantizadores do IVF-PQ (deve dividir a dimensão)
+        pq_nbits: Bits por subquantizador do IVF-PQ
+        hnsw_m: Vizinhos por nó do HNSW
+        ef_construction: efConstruction do HNSW
+        nprobe: Listas visitadas por busca no IVF (mais = mais recall, mais latência)
+        ef_search: efSearch do HNSW (mais = mais recall, mais latência)
+        retrain_growth: Fator de crescimento que dispara o retreino do IVF
+    """
+
+    def __init__(self, backend: str = "flat", metric: str = "cosine", promote_at: int = 20000, nlist: Optional[int] = None,
+                 pq_m: int = 8, pq_nbits: int = 8, hnsw_m: int = 32, ef_construction: int = 200,
+                 nprobe: int = 16, ef_search: int = 64, retrain_growth: float = 4.0):
+        if backend not in INDEX_BACKENDS:
+            raise ValueError(f"Backend de índice desconhecido: {backend}. Use um de {INDEX_BACKENDS}")
+        if metric not in INDEX_METRICS:
+            raise ValueError(f"Métrica desconhecida: {metric}. Use uma de {INDEX_METRICS}")
+        self.backend = backend
+        self.metric = metric
+        self.promote_at = promote_at
+        self.nlist = nlist
+        self.pq_m = pq_m
+        self.pq_nbits = pq_nbits
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.retrain_growth = retrain_growth
+
+    @classmethod
+    def from_env(cls) -> "IndexConfig":
+        """Lê a configuração das variáveis MEMORY_INDEX_* do ambiente."""
+        nlist = os.environ.get("MEMORY_INDEX_NLIST")
+        return cls(
+            backend=os.environ.get("MEMORY_INDEX_BACKEND", "flat"),
+            metric=os.environ.get("MEMORY_INDEX_METRIC", "cosine"),
+            promote_at=int(os.environ.get("MEMORY_INDEX_PROMOTE_AT", 20000)),
+            nlist=int(nlist) if nlist else None,
+            nprobe=int(os.environ.get("MEMORY_INDEX_NPROBE", 16)),
+            ef_search=int(os.environ.get("MEMORY_INDEX_EF_SEARCH", 64)),
+        )
+
+    def desired_backend(self, ntotal: int) -> str:
+        if self.backend == "flat" or ntotal < self.promote_at:
+            return "flat"
+        return self.backend
+
+    @property
+    def faiss_metric(self) -> int:
+        return faiss.METRIC_INNER_PRODUCT if self.metric == "cosine" else faiss.METRIC_L2
+
+
+def create_flat_index(dimension: int, config: IndexConfig) -> faiss.Index:
+    if config.metric == "cosine":
+        return faiss.IndexFlatIP(dimension)
+    return faiss.IndexFlatL2(dimension)
+
+
+def index_matches_metric(index: faiss.Index, config: IndexConfig) -> bool:
+    return index.metric_type == config.faiss_metric
+
+
+def normalize_vectors(vectors: np.ndarray) -> np.ndarray:
+    """Cópia dos vetores com norma L2 unitária."""
+    vectors = np.array(vectors, dtype=np.float32).reshape(-1, np.shape(vectors)[-1])
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def similarity_from_distance(config: IndexConfig, distance: float) -> float:
+    if config.metric == "cosine":
+        return float(distance)
+    # métrica antiga: mantém a fórmula original sobre a distância L2 ao quadrado
+    return float(1 - distance)
+
+
+def index_backend_name(index: faiss.Index) -> str:
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    ivf = _extract_ivf(index)
+    if ivf is not None:
+        return "ivf_pq" if isinstance(faiss.downcast_index(ivf), faiss.IndexIVFPQ) else "ivf_flat"
+    return "flat"
+
+
+def build_index(config: IndexConfig, backend: str, dimension: int, vectors: np.ndarray) -> faiss.Index:
+    """Cria, treina (se necessário) e popula um índice com os vetores na ordem dada."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n = len(vectors)
+    if backend == "flat":
+        index = create_flat_index(dimension, config)
+    elif backend == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, config.hnsw_m, config.faiss_metric)
+        index.hnsw.efConstruction = config.ef_construction
+    else:
+        nlist = config.nlist or _default_nlist(n)
+        quantizer = create_flat_index(dimension, config)
+        if backend == "ivf_pq":
+            # o PQ precisa de ~39 pontos por código; reduz os bits em bases pequenas
+            nbits = max(1, min(config.pq_nbits, int(math.log2(max(n // 39, 2)))))
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, config.pq_m, nbits, config.faiss_metric)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist, config.faiss_metric)
+        index.train(vectors)
+    if n:
+        index.add(vectors)
+    apply_search_params(index, config)
+    return index
+
+
+def apply_search_params(index: faiss.Index, config: IndexConfig,
+                        nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """Ajusta os parâmetros de recall/latência do índice (nprobe e efSearch)."""
+    ivf = _extract_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(nprobe or config.nprobe, ivf.nlist)
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search or config.ef_search
+
+
+def _default_nlist(n: int) -> int:
+    # ~4*sqrt(n) listas, garantindo ao menos 39 pontos de treino por centróide
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def _extract_ivf(index: faiss.Index):
+    try:
+        return faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return None
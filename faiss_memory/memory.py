@@ -1,90 +1,243 @@
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
 from typing import List, Dict, Any, Optional
 from datetime import datetime
+import asyncio
+import threading
+import atexit
 import uuid
 import os
 import pickle
+import shutil
+import time
+
+from faiss_memory.wal import WriteAheadLog
+from faiss_memory.metadata_store import ColumnarMetadataStore
+from faiss_memory.turn_records import build_turn_record
+from faiss_memory.retention import RetentionPolicy, expired_rows, near_duplicate_rows, over_cap_rows
+from faiss_memory.index_backends import (
+    IndexConfig, apply_search_params, build_index, create_flat_index, index_backend_name,
+    index_matches_metric, normalize_vectors, similarity_from_distance
+)
+from faiss_memory.embedding_service import EmbeddingService, get_embedding_service
+
+# arquivos do snapshot, na ordem em que o vacuum os troca (o manifesto por último)
+SNAPSHOT_FILES = (
+    "vectors.f32", "ids.bin", "documents.bin", "documents.off",
+    "metadata.bin", "metadata.off", "index.faiss", "columns.json"
+)
 
 class LongTermMemory:
-    def __init__(self, persist_directory: str = "./memory_faiss"):
+    def __init__(self, persist_directory: str = "./memory_faiss",
+                 checkpoint_every: int = 200, checkpoint_interval: float = 300.0,
+                 index_config: Optional[IndexConfig] = None,
+                 embedding_service: Optional[EmbeddingService] = None,
+                 min_similarity: Optional[float] = None, context_results: Optional[int] = None,
+                 retention: Optional[RetentionPolicy] = None):
         """
         Inicializa a memória de longo prazo baseada em FAISS
-        
+
         Args:
             persist_directory: Diretório onde os dados serão persistidos
+            checkpoint_every: Número de escritas no log que dispara um checkpoint
+            checkpoint_interval: Intervalo (segundos) entre checkpoints periódicos em background
+            index_config: Backend do índice e parâmetros de recall/latência (padrão: variáveis MEMORY_INDEX_*)
+            embedding_service: Serviço de embeddings (padrão: serviço compartilhado)
+            min_similarity: Similaridade de cosseno mínima de uma memória relevante (padrão: MEMORY_MIN_SIMILARITY ou 0.35)
+            context_results: Máximo de memórias no contexto do prompt (padrão: MEMORY_CONTEXT_RESULTS ou 5)
+            retention: TTL, limite de entradas e deduplicação (padrão: variáveis MEMORY_TTL_DAYS etc.)
         """
         self.persist_directory = persist_directory
         os.makedirs(persist_directory, exist_ok=True)
 
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        self.dimension = self.embedding_model.get_sentence_embedding_dimension()
+        self.embedding_service = embedding_service or get_embedding_service()
+        self.dimension = self.embedding_service.dimension
+        self.index_config = index_config or IndexConfig.from_env()
+        # calibrado para o all-MiniLM-L6-v2: abaixo de ~0.35 as frases raramente tratam do mesmo assunto
+        if min_similarity is None:
+            min_similarity = float(os.environ.get("MEMORY_MIN_SIMILARITY", 0.35))
+        self.min_similarity = min_similarity
+        self.context_results = context_results or int(os.environ.get("MEMORY_CONTEXT_RESULTS", 5))
+        self.retention = retention or RetentionPolicy.from_env()
 
-        self.index = faiss.IndexFlatL2(self.dimension)
-        self.documents = []
-        self.metadatas = []
-        self.ids = []
+        self.index = create_flat_index(self.dimension, self.index_config)
+        # documentos, metadados e ids em colunas memory-mapped (ver ColumnarMetadataStore)
+        self.records = ColumnarMetadataStore(self.persist_directory)
+        # vetores originais: os já persistidos em vectors.f32 (memmap) e os novos desde o último checkpoint;
+        # são a fonte para treinar/reconstruir o índice sem perda de precisão
+        self._base_vectors = np.empty((0, self.dimension), dtype=np.float32)
+        self._new_vectors = []
+        self._trained_size = 0
+        # posições removidas pela retenção: ficam fora das buscas até o vacuum reescrever o snapshot
+        self._deleted = set()
 
         self.index_file = os.path.join(self.persist_directory, "index.faiss")
-        self.meta_file = os.path.join(self.persist_directory, "metadata.pkl")
+        # formato antigo (pickle), só lido uma vez para migrar para as colunas
+        self.legacy_meta_file = os.path.join(self.persist_directory, "metadata.pkl")
+        self.vectors_file = os.path.join(self.persist_directory, "vectors.f32")
+        self.wal_file = os.path.join(self.persist_directory, "memory.wal")
+        self.vacuum_dir = os.path.join(self.persist_directory, "vacuum.tmp")
+
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_interval = checkpoint_interval
+        # _lock protege índice e listas; _checkpoint_lock serializa checkpoints
+        self._lock = threading.RLock()
+        self._checkpoint_lock = threading.Lock()
+        self._pending_writes = 0
+        self._wake = threading.Event()
+        self._closed = False
+        self._rebuilding = False
+        # incrementado sempre que o conteúdo é descartado; invalida reconstruções em andamento
+        self._generation = 0
+        self._last_retention = time.monotonic()
 
         self._load_memory()
+        self.wal = WriteAheadLog(self.wal_file)
+        self._replay_wal()
+
+        self._checkpoint_thread = threading.Thread(target=self._checkpoint_loop, daemon=True)
+        self._checkpoint_thread.start()
+        atexit.register(self.close)
 
     def _generate_embedding(self, text: str) -> List[float]:
-        embedding = self.embedding_model.encode(text)
+        embedding = self.embedding_service.encode(text)
         return embedding.tolist()
 
-    def store_conversation(self, user_input: str, assistant_response: str, 
-                           context: Optional[str] = None, metadata: Optional[Dict] = None):
-        entry_id = str(uuid.uuid4())
-        combined_text = f"Usuário: {user_input}\nAssistente: {assistant_response}"
-        if context:
-            combined_text = f"Contexto: {context}\n{combined_text}"
+    def store_conversation(self, user_input: str, assistant_response: str,
+                           source_ids: Optional[List[str]] = None, metadata: Optional[Dict] = None):
+        """
+        Armazena um turno como registro compacto (ver build_turn_record).
 
+        Args:
+            user_input: Mensagem do usuário
+            assistant_response: Resposta do assistente
+            source_ids: Ids das memórias usadas como contexto para gerar a resposta
+            metadata: Metadados extras
+        """
+        combined_text, entry_metadata = build_turn_record(user_input, assistant_response, source_ids, metadata)
         embedding = np.array(self._generate_embedding(combined_text), dtype=np.float32)
-        entry_metadata = {
-            "timestamp": datetime.now().isoformat(),
-            "user_input": user_input,
-            "assistant_response": assistant_response,
-            "context": context or "",
-            **(metadata or {})
-        }
+        return self._store_entry(combined_text, entry_metadata, embedding)
 
-        self.index.add(np.expand_dims(embedding, axis=0))
-        self.documents.append(combined_text)
-        self.metadatas.append(entry_metadata)
-        self.ids.append(entry_id)
+    async def astore_conversation(self, user_input: str, assistant_response: str,
+                                  source_ids: Optional[List[str]] = None, metadata: Optional[Dict] = None):
+        """Versão assíncrona: o embedding e a escrita no log rodam fora do event loop."""
+        combined_text, entry_metadata = build_turn_record(user_input, assistant_response, source_ids, metadata)
+        embedding = await self.embedding_service.aencode(combined_text)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._store_entry, combined_text, entry_metadata, embedding)
+
+    def bulk_import(self, ids: List[str], documents: List[str], metadatas: List[Dict], embeddings: np.ndarray):
+        """
+        Carrega entradas em lote, sem passar pelo log, e grava um checkpoint no final.
+        Para ferramentas offline (migrações) rodando sobre um diretório que ninguém mais usa.
+        """
+        with self._lock:
+            for entry_id, document, metadata, embedding in zip(ids, documents, metadatas, embeddings):
+                self._apply_add(entry_id, document, metadata, embedding)
+            self._pending_writes += len(ids)
+        self.checkpoint()
+        with self._lock:
+            self._maybe_rebuild_index()
+
+    def _store_entry(self, combined_text: str, entry_metadata: Dict, embedding: np.ndarray) -> str:
+        entry_id = str(uuid.uuid4())
+        embedding = self._prepare_vector(embedding)
+        with self._lock:
+            # grava no log antes de aplicar em memória: uma queda não perde a entrada
+            self.wal.append({
+                "op": "add",
+                "id": entry_id,
+                "document": combined_text,
+                "metadata": entry_metadata,
+                "embedding": WriteAheadLog.encode_vector(embedding),
+            })
+            self._apply_add(entry_id, combined_text, entry_metadata, embedding)
+            self._pending_writes += 1
+            if self._pending_writes >= self.checkpoint_every:
+                self._wake.set()
+            self._maybe_rebuild_index()
 
-        self._save_memory()
         return entry_id
 
-    def retrieve_relevant_memory(self, query: str, n_results: int = 5, threshold: float = 0.0) -> List[Dict[str, Any]]:
-        if not self.documents or not query.strip():
+    def _prepare_vector(self, embedding: np.ndarray) -> np.ndarray:
+        if self.index_config.metric == "cosine":
+            return normalize_vectors(embedding)[0]
+        return np.asarray(embedding, dtype=np.float32)
+
+    def _apply_add(self, entry_id: str, document: str, metadata: Dict, embedding: np.ndarray):
+        # normalizar é idempotente; cobre registros antigos do log gravados sem normalização
+        embedding = self._prepare_vector(embedding)
+        self.index.add(np.expand_dims(embedding, axis=0))
+        self._new_vectors.append(embedding)
+        self.records.append(entry_id, document, metadata)
+
+    def retrieve_relevant_memory(self, query: str, n_results: int = 5, threshold: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Busca as memórias mais parecidas com a consulta.
+
+        Args:
+            query: Texto da consulta
+            n_results: Máximo de resultados
+            threshold: Similaridade mínima (None = min_similarity calibrado)
+        """
+        if not len(self.records) or not query.strip():
             return []
 
-        query_embedding = np.array(self._generate_embedding(query), dtype=np.float32).reshape(1, -1)
-        distances, indices = self.index.search(query_embedding, n_results)
+        query_embedding = np.array(self._generate_embedding(query), dtype=np.float32)
+        return self._search(query_embedding, n_results, threshold)
 
-        results = []
-        for i, idx in enumerate(indices[0]):
-            if idx == -1:
-                continue
-            similarity = 1 - distances[0][i]
-            if similarity >= threshold:
-                results.append({
-                    "similarity": similarity,
-                    "document": self.documents[idx],
-                    "metadata": self.metadatas[idx],
-                    "id": self.ids[idx]
-                })
+    async def aretrieve_relevant_memory(self, query: str, n_results: int = 5, threshold: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Versão assíncrona: o embedding vai para o serviço em lote e a busca roda numa thread."""
+        if not len(self.records) or not query.strip():
+            return []
+
+        query_embedding = await self.embedding_service.aencode(query)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._search, query_embedding, n_results, threshold)
+
+    def _search(self, query_embedding: np.ndarray, n_results: int, threshold: Optional[float]) -> List[Dict[str, Any]]:
+        query_embedding = self._prepare_vector(query_embedding).reshape(1, -1)
+        if threshold is None:
+            threshold = self.default_threshold()
+        with self._lock:
+            # busca mais vizinhos para compensar os removidos que ainda estão no índice
+            k = min(self.index.ntotal, n_results + len(self._deleted))
+            if not k:
+                return []
+            distances, indices = self.index.search(query_embedding, k)
+
+            results = []
+            for i, idx in enumerate(indices[0]):
+                if idx == -1 or idx in self._deleted:
+                    continue
+                if len(results) >= n_results:
+                    break
+                similarity = similarity_from_distance(self.index_config, distances[0][i])
+                if similarity >= threshold:
+                    results.append({
+                        "similarity": similarity,
+                        "document": self.records.document(idx),
+                        "metadata": self.records.metadata(idx),
+                        "id": self.records.id(idx)
+                    })
 
         results.sort(key=lambda x: x["similarity"], reverse=True)
         return results
 
+    def default_threshold(self) -> float:
+        # na métrica antiga (L2) a "similaridade" não tem escala definida; mantém o corte original
+        return self.min_similarity if self.index_config.metric == "cosine" else 0.0
+
     def get_conversation_context(self, query: str, max_context_length: int = 2000) -> str:
-        memories = self.retrieve_relevant_memory(query, n_results=15, threshold=0.0)
+        memories = self.retrieve_relevant_memory(query, n_results=self.context_results)
+        return self.format_context(memories, max_context_length)
+
+    async def aget_conversation_context(self, query: str, max_context_length: int = 2000) -> str:
+        memories = await self.aretrieve_relevant_memory(query, n_results=self.context_results)
+        return self.format_context(memories, max_context_length)
 
+    @staticmethod
+    def format_context(memories: List[Dict[str, Any]], max_context_length: int = 2000) -> str:
         if not memories:
             return ""
 
@@ -100,36 +253,429 @@ class LongTermMemory:
 
         return "\n".join(context_parts)
 
+    def set_search_params(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+        """
+        Ajusta o compromisso recall/latência das buscas.
+
+        Args:
+            nprobe: Listas visitadas por busca nos índices IVF
+            ef_search: Tamanho da fila de candidatos do HNSW
+        """
+        with self._lock:
+            if nprobe:
+                self.index_config.nprobe = nprobe
+            if ef_search:
+                self.index_config.ef_search = ef_search
+            apply_search_params(self.index, self.index_config)
+
     def clear_memory(self):
-        self.index.reset()
-        self.documents.clear()
-        self.metadatas.clear()
-        self.ids.clear()
-        self._save_memory()
+        with self._checkpoint_lock, self._lock:
+            self._generation += 1
+            self.index = create_flat_index(self.dimension, self.index_config)
+            self.records.clear()
+            self._base_vectors = np.empty((0, self.dimension), dtype=np.float32)
+            self._new_vectors = []
+            self._trained_size = 0
+            self._deleted = set()
+            open(self.vectors_file, 'wb').close()
+            self._write_snapshot(faiss.serialize_index(self.index), {"count": 0, "trained_size": 0})
+            self.wal.truncate()
+            self._pending_writes = 0
 
     def get_memory_stats(self) -> Dict[str, Any]:
         return {
-            "total_entries": len(self.documents),
-            "persist_directory": self.persist_directory
+            "total_entries": len(self.records) - len(self._deleted),
+            "deleted_entries": len(self._deleted),
+            "persist_directory": self.persist_directory,
+            "pending_writes": self._pending_writes,
+            "wal_bytes": self.wal.size(),
+            "index_backend": index_backend_name(self.index),
+            "index_rebuilding": self._rebuilding,
+            "resident_bytes": self.estimate_memory_bytes()
         }
 
-    def _save_memory(self):
-        faiss.write_index(self.index, self.index_file)
-        with open(self.meta_file, 'wb') as f:
-            pickle.dump({
-                "documents": self.documents,
-                "metadatas": self.metadatas,
-                "ids": self.ids
-            }, f)
+    def estimate_memory_bytes(self) -> int:
+        """Estimativa da RAM ocupada por este shard (índice, vetores novos e textos ainda não gravados)."""
+        vector_bytes = self.dimension * 4
+        return (self.index.ntotal * vector_bytes
+                + len(self._new_vectors) * vector_bytes
+                + self.records.resident_bytes())
+
+    def checkpoint(self):
+        """
+        Compacta o log em um novo snapshot (vectors.f32 + colunas de metadados + index.faiss).
+
+        A cópia do estado é feita sob lock; a escrita em disco acontece fora dele,
+        então buscas e novas escritas não ficam bloqueadas durante o checkpoint.
+        """
+        with self._checkpoint_lock:
+            self._checkpoint()
+
+    def _checkpoint(self):
+        # chamado com self._checkpoint_lock adquirido
+        with self._lock:
+            if not self._pending_writes:
+                return
+            self.wal.rotate()
+            index_bytes = faiss.serialize_index(self.index)
+            base_count = self.records.base_count
+            flushed = self.records.pending_count
+            rows = self.records.pending_rows()
+            new_vectors = list(self._new_vectors)
+            count = base_count + flushed
+            manifest = {
+                "count": count,
+                "trained_size": self._trained_size,
+                "deleted": sorted(int(p) for p in self._deleted if p < count)
+            }
+            self._pending_writes = 0
+        # vectors.f32 e as colunas são append-only: o checkpoint só grava as entradas novas
+        if new_vectors:
+            with open(self.vectors_file, 'ab') as f:
+                f.truncate(base_count * self.dimension * 4)
+                f.write(np.stack(new_vectors).astype(np.float32).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        self.records.write_rows(base_count, rows)
+        self._write_snapshot(index_bytes, manifest)
+        with self._lock:
+            self._base_vectors = self._open_vectors(count)
+            self._new_vectors = self._new_vectors[flushed:]
+            self.records.commit(count, flushed)
+        self.wal.discard_rotated()
+
+    def delete_entries(self, ids: List[str]) -> int:
+        """Remove entradas pelo id. Elas somem das buscas na hora; o espaço volta no próximo vacuum."""
+        wanted = set(ids)
+        with self._lock:
+            rows = [i for i in range(len(self.records)) if self.records.id(i) in wanted]
+        return self._delete_rows(rows)
+
+    def _delete_rows(self, rows: List[int]) -> int:
+        with self._lock:
+            rows = [int(r) for r in rows if r not in self._deleted and r < len(self.records)]
+            if not rows:
+                return 0
+            self.wal.append({"op": "delete", "ids": [self.records.id(r) for r in rows]})
+            self._deleted.update(rows)
+            self._pending_writes += 1
+        return len(rows)
+
+    def enforce_retention(self, now: Optional[datetime] = None) -> int:
+        """
+        Aplica a política de retenção: expira entradas antigas (TTL), colapsa quase-duplicatas
+        (fica a mais recente) e corta as mais antigas acima do limite. Devolve quantas saíram.
+        """
+        policy = self.retention
+        removed = 0
+        # as posições só mudam no vacuum e no clear_memory, que também pegam _checkpoint_lock
+        with self._checkpoint_lock:
+            with self._lock:
+                count = len(self.records)
+                live = [i for i in range(count) if i not in self._deleted]
+            if policy.ttl_days and live:
+                timestamps = (self.records.metadata(i).get("timestamp") for i in live)
+                removed += self._delete_rows(expired_rows(live, timestamps, policy.ttl_days, now))
+            if policy.dedup_similarity and self.index_config.metric == "cosine":
+                live = [i for i in live if i not in self._deleted]
+                duplicates = self._near_duplicates(live, policy.dedup_similarity)
+                if policy.dedup_dry_run:
+                    if duplicates:
+                        print(f"[MEMORY] Deduplicação (simulação): {len(duplicates)} entradas de "
+                              f"{self.persist_directory} seriam removidas")
+                else:
+                    removed += self._delete_rows(duplicates)
+            if policy.max_entries:
+                live = [i for i in live if i not in self._deleted]
+                removed += self._delete_rows(over_cap_rows(live, policy.max_entries))
+        if removed:
+            print(f"[MEMORY] Retenção removeu {removed} entradas de {self.persist_directory}")
+        return removed
+
+    def _near_duplicates(self, rows: List[int], threshold: float, chunk_size: int = 1024) -> List[int]:
+        if len(rows) < 2:
+            return []
+        k = min(self.retention.dedup_neighbors + 1, len(rows))
+        neighbor_rows, neighbor_sims = [], []
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            # lock por bloco: buscas concorrentes só esperam por um bloco de cada vez
+            with self._lock:
+                sims, idx = self.index.search(self._vectors_at(chunk), k)
+            neighbor_rows.append(idx)
+            neighbor_sims.append(sims)
+        return near_duplicate_rows(rows, np.vstack(neighbor_rows), np.vstack(neighbor_sims), threshold, set(rows))
+
+    def _vectors_at(self, rows: List[int]) -> np.ndarray:
+        base_count = len(self._base_vectors)
+        return np.stack([
+            np.asarray(self._base_vectors[r]) if r < base_count else self._new_vectors[r - base_count]
+            for r in rows
+        ]).astype(np.float32)
+
+    def vacuum(self) -> int:
+        """
+        Reescreve o snapshot sem as entradas removidas e troca o índice por um reconstruído.
+
+        A cópia e a construção do índice rodam fora de self._lock, então buscas e escritas
+        continuam durante o vacuum; só a troca final dos arquivos acontece sob o lock. Os
+        arquivos novos são montados em `vacuum.tmp/` e, se o processo cair no meio da
+        troca, ela é concluída no próximo carregamento.
+        """
+        with self._checkpoint_lock:
+            # grava tudo no snapshot antes: o vacuum trabalha só com linhas já no disco
+            self._checkpoint()
+            with self._lock:
+                count = self.records.base_count
+                removed = np.array(sorted(p for p in self._deleted if p < count), dtype=np.int64)
+                base_vectors = self._base_vectors
+                generation = self._generation
+            if not len(removed):
+                return 0
+
+            keep = np.setdiff1d(np.arange(count, dtype=np.int64), removed)
+            vectors = np.asarray(base_vectors[keep], dtype=np.float32).reshape(-1, self.dimension)
+            rows = [(self.records.id(i), self.records.document(i), self.records.metadata(i)) for i in keep]
+            backend = self.index_config.desired_backend(len(keep))
+            new_index = build_index(self.index_config, backend, self.dimension, vectors)
+
+            shutil.rmtree(self.vacuum_dir, ignore_errors=True)
+            os.makedirs(self.vacuum_dir)
+            with open(os.path.join(self.vacuum_dir, "vectors.f32"), 'wb') as f:
+                f.write(vectors.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            staged = ColumnarMetadataStore(self.vacuum_dir)
+            staged.write_rows(0, rows)
+            if not rows:
+                staged.clear()
+            with open(os.path.join(self.vacuum_dir, "index.faiss"), 'wb') as f:
+                f.write(faiss.serialize_index(new_index).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            trained_size = len(keep) if backend.startswith("ivf") else 0
+            staged.write_manifest({"count": len(keep), "trained_size": trained_size, "deleted": []})
+            # marca o diretório como completo: a partir daqui a troca é concluída mesmo após uma queda
+            open(os.path.join(self.vacuum_dir, "READY"), 'wb').close()
+
+            with self._lock:
+                if generation != self._generation:
+                    shutil.rmtree(self.vacuum_dir, ignore_errors=True)
+                    return 0
+                # entradas gravadas durante a construção entram no índice novo antes da troca
+                if self.index.ntotal > count:
+                    new_index.add(self._vector_matrix(count))
+                self._finish_vacuum()
+                # remapeia as remoções feitas durante a construção para as novas posições
+                removed_set = set(removed.tolist())
+                self._deleted = {
+                    int(np.searchsorted(keep, p)) if p < count else p - len(removed)
+                    for p in self._deleted if p not in removed_set
+                }
+                self.index = new_index
+                self._trained_size = trained_size
+                self._base_vectors = self._open_vectors(len(keep))
+                self.records.commit(len(keep), 0)
+                # reconstruções em andamento usam as posições antigas
+                self._generation += 1
+        print(f"[MEMORY] Vacuum removeu {len(removed)} entradas de {self.persist_directory}")
+        return len(removed)
+
+    def run_maintenance(self):
+        """Retenção + vacuum quando a fração de entradas removidas passa de `retention.vacuum_ratio`."""
+        self._last_retention = time.monotonic()
+        if self.retention.enabled:
+            self.enforce_retention()
+        total = len(self.records)
+        if self._deleted and len(self._deleted) >= total * self.retention.vacuum_ratio:
+            self.vacuum()
+
+    def _finish_vacuum(self):
+        """Move os arquivos montados pelo vacuum para o snapshot (o manifesto por último)."""
+        if not os.path.exists(os.path.join(self.vacuum_dir, "READY")):
+            shutil.rmtree(self.vacuum_dir, ignore_errors=True)
+            return
+        for name in SNAPSHOT_FILES:
+            staged = os.path.join(self.vacuum_dir, name)
+            if os.path.exists(staged):
+                os.replace(staged, os.path.join(self.persist_directory, name))
+        shutil.rmtree(self.vacuum_dir, ignore_errors=True)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        atexit.unregister(self.close)
+        self._wake.set()
+        try:
+            self.checkpoint()
+        except Exception as e:
+            print(f"Erro no checkpoint final da memória: {e}")
+        self.wal.close()
+
+    def _checkpoint_loop(self):
+        while not self._closed:
+            self._wake.wait(self.checkpoint_interval)
+            self._wake.clear()
+            if self._closed:
+                break
+            try:
+                self.checkpoint()
+            except Exception as e:
+                print(f"Erro no checkpoint da memória: {e}")
+            if time.monotonic() - self._last_retention >= self.retention.interval:
+                try:
+                    self.run_maintenance()
+                except Exception as e:
+                    print(f"Erro na retenção da memória: {e}")
+
+    def _vector_matrix(self, start: int = 0) -> np.ndarray:
+        """Vetores originais a partir da posição `start`, na ordem do índice."""
+        base_count = len(self._base_vectors)
+        parts = []
+        if start < base_count:
+            parts.append(np.asarray(self._base_vectors[start:]))
+        parts.extend(self._new_vectors[max(0, start - base_count):])
+        if not parts:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        return np.vstack(parts).astype(np.float32)
+
+    def _open_vectors(self, count: int) -> np.ndarray:
+        if not count:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        return np.memmap(self.vectors_file, dtype=np.float32, mode='r', shape=(count, self.dimension))
+
+    def _maybe_rebuild_index(self):
+        """Promove o índice para o backend ANN configurado (ou retreina o IVF) em background."""
+        if self._rebuilding:
+            return
+        ntotal = self.index.ntotal
+        desired = self.index_config.desired_backend(ntotal)
+        current = index_backend_name(self.index)
+        stale_ivf = (current.startswith("ivf") and self._trained_size
+                     and ntotal >= self._trained_size * self.index_config.retrain_growth)
+        if desired == current and not stale_ivf:
+            return
+        self._rebuilding = True
+        threading.Thread(target=self._rebuild_index, args=(desired, self._generation), daemon=True).start()
+
+    def _rebuild_index(self, backend: str, generation: int):
+        try:
+            with self._lock:
+                vectors = self._vector_matrix()
+            print(f"[MEMORY] Construindo índice '{backend}' com {len(vectors)} vetores")
+            new_index = build_index(self.index_config, backend, self.dimension, vectors)
+            with self._lock:
+                if generation != self._generation:
+                    return
+                # vetores adicionados durante o treino entram no novo índice antes da troca
+                if self.index.ntotal > len(vectors):
+                    new_index.add(self._vector_matrix(len(vectors)))
+                self.index = new_index
+                self._trained_size = len(vectors) if backend.startswith("ivf") else 0
+                self._pending_writes += 1
+        except Exception as e:
+            print(f"Erro ao reconstruir o índice da memória: {e}")
+        finally:
+            self._rebuilding = False
+
+    def _write_snapshot(self, index_bytes, manifest: Dict[str, Any]):
+        # o índice é trocado atomicamente; o manifesto vai por último e define quantas
+        # entradas (linhas das colunas e vetores) o snapshot tem
+        index_tmp = self.index_file + ".tmp"
+        with open(index_tmp, 'wb') as f:
+            f.write(index_bytes.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(index_tmp, self.index_file)
+        self.records.write_manifest(manifest)
 
     def _load_memory(self):
-        if os.path.exists(self.index_file) and os.path.exists(self.meta_file):
+        if os.path.isdir(self.vacuum_dir):
+            # vacuum interrompido: conclui a troca se os arquivos novos estavam completos
+            self._finish_vacuum()
+        if not self.records.exists() and os.path.exists(self.legacy_meta_file):
+            self._migrate_legacy_metadata()
+        if self.records.exists() and os.path.exists(self.index_file):
             self.index = faiss.read_index(self.index_file)
-            with open(self.meta_file, 'rb') as f:
-                data = pickle.load(f)
-                self.documents = data.get("documents", [])
-                self.metadatas = data.get("metadatas", [])
-                self.ids = data.get("ids", [])
+            manifest = self.records.load()
+            self._trained_size = manifest.get("trained_size", 0)
+            self._deleted = set(manifest.get("deleted", []))
+            count = len(self.records)
+
+            stored = os.path.getsize(self.vectors_file) // (self.dimension * 4) if os.path.exists(self.vectors_file) else 0
+            if stored >= count:
+                self._base_vectors = self._open_vectors(count)
+            else:
+                # memória criada antes de vectors.f32 existir: recupera os vetores do índice flat
+                vectors = self.index.reconstruct_n(0, count)
+                with open(self.vectors_file, 'wb') as f:
+                    f.write(np.asarray(vectors, dtype=np.float32).tobytes())
+                self._base_vectors = self._open_vectors(count)
 
+            if not index_matches_metric(self.index, self.index_config):
+                self._migrate_metric(count)
+            elif self.index.ntotal != count:
+                # queda entre a troca do índice e a dos metadados: reconstrói a partir dos vetores
+                backend = self.index_config.desired_backend(count)
+                self.index = build_index(self.index_config, backend, self.dimension, self._vector_matrix())
+            apply_search_params(self.index, self.index_config)
 
-long_term_memory = LongTermMemory() 
\ No newline at end of file
+    def _migrate_metric(self, count: int):
+        """
+        Converte uma memória gravada com outra métrica (ex.: o IndexFlatL2 antigo) para a
+        métrica configurada: normaliza os vetores, regrava vectors.f32 e reconstrói o índice.
+        O snapshot novo é gravado no primeiro checkpoint.
+        """
+        print(f"[MEMORY] Migrando {count} vetores para a métrica '{self.index_config.metric}'")
+        vectors = self._vector_matrix()
+        if self.index_config.metric == "cosine" and len(vectors):
+            vectors = normalize_vectors(vectors)
+        tmp_path = self.vectors_file + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(vectors.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.vectors_file)
+        self._base_vectors = self._open_vectors(count)
+        backend = self.index_config.desired_backend(count)
+        self.index = build_index(self.index_config, backend, self.dimension, vectors)
+        self._trained_size = count if backend.startswith("ivf") else 0
+        self._pending_writes += 1
+
+    def _migrate_legacy_metadata(self):
+        """Converte o metadata.pkl antigo para as colunas; o pickle é mantido como .migrated."""
+        with open(self.legacy_meta_file, 'rb') as f:
+            data = pickle.load(f)
+        rows = list(zip(data.get("ids", []), data.get("documents", []), data.get("metadatas", [])))
+        print(f"[MEMORY] Migrando {len(rows)} entradas de metadata.pkl para o formato colunar")
+        self.records.write_rows(0, rows)
+        self.records.write_manifest({"count": len(rows), "trained_size": data.get("trained_size", 0)})
+        os.replace(self.legacy_meta_file, self.legacy_meta_file + ".migrated")
+
+    def _replay_wal(self):
+        positions = None
+        replayed = 0
+        for record in self.wal.replay():
+            if positions is None:
+                # só monta o mapa de ids (que lê a coluna inteira) se houver algo no log
+                positions = {self.records.id(i): i for i in range(len(self.records))}
+            if record.get("op") == "delete":
+                rows = [positions[i] for i in record["ids"] if i in positions]
+                replayed += len(set(rows) - self._deleted)
+                self._deleted.update(rows)
+                continue
+            if record.get("op") != "add" or record["id"] in positions:
+                continue
+            embedding = WriteAheadLog.decode_vector(record["embedding"])
+            positions[record["id"]] = len(self.records)
+            self._apply_add(record["id"], record["document"], record["metadata"], embedding)
+            replayed += 1
+        if replayed:
+            print(f"[MEMORY] {replayed} entradas reaplicadas a partir do log")
+        # o log pode conter registros já presentes no snapshot; compacta na inicialização
+        self._pending_writes += replayed
+        if self._pending_writes or self.wal.size():
+            self._pending_writes = max(self._pending_writes, 1)
+            self.checkpoint()
+        self._maybe_rebuild_index()
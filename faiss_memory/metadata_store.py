@@ -0,0 +1,170 @@
+import json
+import os
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+ID_WIDTH = 36  # uuid4 em texto
+
+
+class _TextColumn:
+    """Coluna de textos: blob UTF-8 (`<nome>.bin`) + offsets uint64 (`<nome>.off`, n+1 posições)."""
+
+    def __init__(self, directory: str, name: str):
+        self.blob_file = os.path.join(directory, f"{name}.bin")
+        self.offsets_file = os.path.join(directory, f"{name}.off")
+        self._blob = None
+        self._offsets = np.zeros(1, dtype=np.uint64)
+
+    def open(self, count: int):
+        if not count:
+            self._blob, self._offsets = None, np.zeros(1, dtype=np.uint64)
+            return
+        self._offsets = np.memmap(self.offsets_file, dtype=np.uint64, mode='r', shape=(count + 1,))
+        size = int(self._offsets[count])
+        self._blob = np.memmap(self.blob_file, dtype=np.uint8, mode='r', shape=(size,)) if size else None
+
+    def get(self, i: int) -> str:
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        if start == end:
+            return ""
+        return self._blob[start:end].tobytes().decode("utf-8")
+
+    def append(self, count: int, values: List[str]):
+        """Grava `values` depois das `count` linhas já confirmadas (descarta restos de escritas interrompidas)."""
+        end = int(self._offsets[count]) if count else 0
+        encoded = [v.encode("utf-8") for v in values]
+        offsets = end + np.cumsum([len(b) for b in encoded], dtype=np.uint64)
+        if not count:
+            offsets = np.concatenate([np.zeros(1, dtype=np.uint64), offsets])
+        _append_file(self.blob_file, end, b"".join(encoded))
+        _append_file(self.offsets_file, (count + 1) * 8 if count else 0, offsets.astype(np.uint64).tobytes())
+
+    def truncate(self):
+        for path in (self.blob_file, self.offsets_file):
+            open(path, "wb").close()
+        self.open(0)
+
+
+class ColumnarMetadataStore:
+    """
+    Metadados da memória em formato colunar, sem pickle.
+
+    - documents.bin/.off: textos dos documentos (blob UTF-8 + offsets)
+    - metadata.bin/.off: metadados de cada entrada em JSON (blob + offsets)
+    - ids.bin: ids de largura fixa (36 bytes)
+    - columns.json: manifesto com o número de linhas confirmadas
+
+    Os arquivos são append-only e abertos com memory-mapping: a carga é quase instantânea
+    e só as linhas devolvidas pela busca são decodificadas. Linhas novas ficam em RAM
+    até o próximo checkpoint, que as anexa às colunas (`write_rows` + `commit`).
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.manifest_file = os.path.join(directory, "columns.json")
+        self.ids_file = os.path.join(directory, "ids.bin")
+        self._documents = _TextColumn(directory, "documents")
+        self._metadatas = _TextColumn(directory, "metadata")
+        self._ids = np.empty(0, dtype=f"S{ID_WIDTH}")
+        self._base_count = 0
+        self._pending: List[Tuple[str, str, Dict[str, Any]]] = []
+
+    def exists(self) -> bool:
+        return os.path.exists(self.manifest_file)
+
+    def load(self) -> Dict[str, Any]:
+        """Abre as colunas no tamanho do manifesto e devolve o manifesto."""
+        with open(self.manifest_file, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        self._open(manifest.get("count", 0))
+        return manifest
+
+    def __len__(self) -> int:
+        return self._base_count + len(self._pending)
+
+    @property
+    def base_count(self) -> int:
+        return self._base_count
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def append(self, entry_id: str, document: str, metadata: Dict[str, Any]):
+        if len(entry_id.encode("ascii")) > ID_WIDTH:
+            raise ValueError(f"Id maior que {ID_WIDTH} bytes: {entry_id}")
+        self._pending.append((entry_id, document, metadata))
+
+    def id(self, i: int) -> str:
+        if i < self._base_count:
+            return self._ids[i].decode("ascii")
+        return self._pending[i - self._base_count][0]
+
+    def document(self, i: int) -> str:
+        if i < self._base_count:
+            return self._documents.get(i)
+        return self._pending[i - self._base_count][1]
+
+    def metadata(self, i: int) -> Dict[str, Any]:
+        if i < self._base_count:
+            return json.loads(self._metadatas.get(i))
+        return self._pending[i - self._base_count][2]
+
+    def ids(self) -> Set[str]:
+        return {self.id(i) for i in range(len(self))}
+
+    def pending_rows(self, count: Optional[int] = None) -> List[Tuple[str, str, Dict[str, Any]]]:
+        return list(self._pending[:count])
+
+    def write_rows(self, base_count: int, rows: List[Tuple[str, str, Dict[str, Any]]]):
+        """Anexa linhas às colunas no disco (sem confirmar no manifesto nem mexer no estado em RAM)."""
+        if not rows:
+            return
+        ids = np.array([r[0].encode("ascii") for r in rows], dtype=f"S{ID_WIDTH}")
+        _append_file(self.ids_file, base_count * ID_WIDTH, ids.tobytes())
+        self._documents.append(base_count, [r[1] for r in rows])
+        self._metadatas.append(base_count, [json.dumps(r[2], ensure_ascii=False) for r in rows])
+
+    def commit(self, count: int, flushed: int):
+        """Passa a ler as primeiras `count` linhas do disco e descarta as `flushed` primeiras pendentes."""
+        self._pending = self._pending[flushed:]
+        self._open(count)
+
+    def write_manifest(self, manifest: Dict[str, Any]):
+        tmp_path = self.manifest_file + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_file)
+
+    def clear(self):
+        self._pending = []
+        open(self.ids_file, "wb").close()
+        self._documents.truncate()
+        self._metadatas.truncate()
+        self._open(0)
+
+    def resident_bytes(self) -> int:
+        pending = sum(len(r[1]) + sum(len(v) for v in r[2].values() if isinstance(v, str)) for r in self._pending)
+        return pending + len(self._pending) * ID_WIDTH
+
+    def _open(self, count: int):
+        self._base_count = count
+        self._documents.open(count)
+        self._metadatas.open(count)
+        if count:
+            self._ids = np.memmap(self.ids_file, dtype=f"S{ID_WIDTH}", mode='r', shape=(count,))
+        else:
+            self._ids = np.empty(0, dtype=f"S{ID_WIDTH}")
+
+
+def _append_file(path: str, offset: int, data: bytes):
+    mode = "r+b" if os.path.exists(path) else "wb"
+    with open(path, mode) as f:
+        f.truncate(offset)
+        f.seek(offset)
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
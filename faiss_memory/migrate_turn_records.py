@@ -0,0 +1,144 @@
+"""
+Reescreve memórias antigas no formato de registro compacto (ver turn_records).
+
+As entradas gravadas antes do formato compacto embutiam todo o contexto do prompt
+(memórias recuperadas + histórico) no documento. Esta ferramenta regrava cada entrada
+só com pergunta e resposta, recalcula os embeddings que mudaram e informa quanto espaço
+foi recuperado. Rode com o assistente parado:
+
+    python -m faiss_memory.migrate_turn_records [--dir ./memory_faiss] [--keep-backup] [--dry-run]
+"""
+import argparse
+import os
+import shutil
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from faiss_memory.memory import LongTermMemory
+from faiss_memory.turn_records import compact_legacy_record
+
+STORE_FILES = (
+    "index.faiss", "vectors.f32", "ids.bin", "documents.bin", "documents.off",
+    "metadata.bin", "metadata.off", "memory.wal", "memory.wal.1", "columns.json"
+)
+# formato antigo: convertido ao abrir a memória e descartado junto com o snapshot antigo
+LEGACY_FILES = ("metadata.pkl", "metadata.pkl.migrated")
+ENCODE_CHUNK = 64
+
+
+def store_size(directory: str) -> int:
+    return sum(os.path.getsize(os.path.join(directory, name))
+               for name in STORE_FILES + LEGACY_FILES if os.path.exists(os.path.join(directory, name)))
+
+
+def find_stores(base_directory: str) -> List[str]:
+    stores = [base_directory]
+    users_dir = os.path.join(base_directory, "users")
+    if os.path.isdir(users_dir):
+        stores.extend(os.path.join(users_dir, name) for name in sorted(os.listdir(users_dir)))
+    return [d for d in stores if os.path.exists(os.path.join(d, "index.faiss"))]
+
+
+def work_directory_for(directory: str) -> str:
+    """`.migrations/` na raiz da memória (ao lado de `users/`), fora dos diretórios de shard."""
+    directory = os.path.abspath(directory)
+    parent = os.path.dirname(directory)
+    base = os.path.dirname(parent) if os.path.basename(parent) == "users" else directory
+    return os.path.join(base, ".migrations")
+
+
+def _store_label(directory: str, work_directory: str) -> str:
+    relative = os.path.relpath(os.path.abspath(directory), os.path.dirname(work_directory))
+    return "raiz" if relative == os.curdir else relative.replace(os.sep, "-")
+
+
+def migrate_store(directory: str, keep_backup: bool = False, dry_run: bool = False,
+                  work_directory: Optional[str] = None) -> Dict[str, int]:
+    """
+    Migra um store. A cópia compactada e o backup ficam em `work_directory` (padrão:
+    `.migrations/` na raiz da memória), nunca dentro de `users/` nem do próprio store.
+    """
+    before = store_size(directory)
+    source = LongTermMemory(persist_directory=directory)
+    try:
+        ids, documents, metadatas, changed = [], [], [], []
+        # entradas removidas pela retenção não são copiadas
+        rows = [i for i in range(len(source.records)) if i not in source._deleted]
+        for i in rows:
+            document = source.records.document(i)
+            compact, metadata = compact_legacy_record(document, source.records.metadata(i))
+            if compact != document:
+                changed.append(len(ids))
+            ids.append(source.records.id(i))
+            documents.append(compact)
+            metadatas.append(metadata)
+        embeddings = source._vector_matrix()[rows]
+    finally:
+        source.close()
+
+    report = {"entries": len(ids), "rewritten": len(changed), "bytes_before": before, "bytes_after": before}
+    if dry_run or not changed:
+        return report
+
+    for start in range(0, len(changed), ENCODE_CHUNK):
+        chunk = changed[start:start + ENCODE_CHUNK]
+        embeddings[chunk] = source.embedding_service.encode_batch([documents[i] for i in chunk])
+
+    work_directory = work_directory or work_directory_for(directory)
+    label = _store_label(directory, work_directory)
+    tmp_dir = os.path.join(work_directory, label + ".compacting")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(work_directory, exist_ok=True)
+    target = LongTermMemory(persist_directory=tmp_dir, index_config=source.index_config)
+    target.bulk_import(ids, documents, metadatas, np.asarray(embeddings, dtype=np.float32))
+    target.close()
+
+    backup_dir = os.path.join(work_directory, f"backup-{int(time.time())}", label)
+    os.makedirs(backup_dir)
+    # columns.json por último: até ele ser trocado, o diretório ainda descreve o snapshot antigo
+    for name in LEGACY_FILES + STORE_FILES:
+        old_path = os.path.join(directory, name)
+        if os.path.exists(old_path):
+            os.replace(old_path, os.path.join(backup_dir, name))
+        new_path = os.path.join(tmp_dir, name)
+        if os.path.exists(new_path):
+            os.replace(new_path, old_path)
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    if not keep_backup:
+        shutil.rmtree(backup_dir, ignore_errors=True)
+        #remove backup-<timestamp>/ e .migrations/ se ficaram vazios
+        for empty in (os.path.dirname(backup_dir), work_directory):
+            try:
+                os.rmdir(empty)
+            except OSError:
+                pass
+
+    report["bytes_after"] = store_size(directory)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migra a memória de longo prazo para registros compactos.")
+    parser.add_argument("--dir", default="./memory_faiss", help="Diretório raiz da memória")
+    parser.add_argument("--keep-backup", action="store_true",
+                        help="Mantém os arquivos antigos em <dir>/.migrations/backup-<timestamp>/")
+    parser.add_argument("--dry-run", action="store_true", help="Só informa quantas entradas seriam reescritas")
+    args = parser.parse_args()
+
+    total_before = total_after = 0
+    work_directory = os.path.join(args.dir, ".migrations")
+    for directory in find_stores(args.dir):
+        report = migrate_store(directory, keep_backup=args.keep_backup, dry_run=args.dry_run,
+                               work_directory=work_directory)
+        total_before += report["bytes_before"]
+        total_after += report["bytes_after"]
+        print(f"{directory}: {report['rewritten']}/{report['entries']} entradas reescritas, "
+              f"{report['bytes_before']} -> {report['bytes_after']} bytes")
+    print(f"Espaço recuperado: {total_before - total_after} bytes "
+          f"({total_before} -> {total_after})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import os
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Sequence, Set
+
+import numpy as np
+
+
+class RetentionPolicy:
+    """
+    Regras de retenção da memória de longo prazo, aplicadas em background por shard
+    (cada usuário tem o seu, então `max_entries` é um limite por usuário).
+
+    As entradas removidas viram tombstones: somem das buscas na hora e só saem do
+    disco e do índice no próximo vacuum, que roda quando a fração de removidas passa
+    de `vacuum_ratio`.
+
+    Args:
+        ttl_days: Idade máxima de uma entrada, em dias (None = sem expiração)
+        max_entries: Máximo de entradas por shard; as mais antigas saem primeiro (None = sem limite)
+        dedup_similarity: Similaridade de cosseno a partir da qual duas entradas são consideradas
+            repetidas; fica só a mais recente (None = sem deduplicação, o padrão)
+        dedup_dry_run: Só informa quantas quase-duplicatas sairiam, sem remover nada
+        interval: Intervalo (segundos) entre execuções da retenção
+        vacuum_ratio: Fração de entradas removidas que dispara o vacuum
+        dedup_neighbors: Vizinhos consultados por entrada na deduplicação
+    """
+
+    def __init__(self, ttl_days: Optional[float] = None, max_entries: Optional[int] = None,
+                 dedup_similarity: Optional[float] = None, interval: float = 3600.0,
+                 vacuum_ratio: float = 0.1, dedup_neighbors: int = 8, dedup_dry_run: bool = False):
+        self.ttl_days = ttl_days or None
+        self.max_entries = max_entries or None
+        self.dedup_similarity = dedup_similarity or None
+        self.dedup_dry_run = dedup_dry_run
+        self.interval = interval
+        self.vacuum_ratio = vacuum_ratio
+        self.dedup_neighbors = dedup_neighbors
+
+    @classmethod
+    def from_env(cls) -> "RetentionPolicy":
+        """
+        Lê a política das variáveis MEMORY_TTL_DAYS, MEMORY_MAX_ENTRIES, MEMORY_DEDUP_SIMILARITY etc.
+        A deduplicação apaga memórias do usuário: só liga com MEMORY_DEDUP_SIMILARITY definida, e
+        MEMORY_DEDUP_DRY_RUN=on permite medir antes quantas sairiam.
+        """
+        ttl_days = os.environ.get("MEMORY_TTL_DAYS")
+        max_entries = os.environ.get("MEMORY_MAX_ENTRIES")
+        dedup_similarity = os.environ.get("MEMORY_DEDUP_SIMILARITY")
+        return cls(
+            ttl_days=float(ttl_days) if ttl_days else None,
+            max_entries=int(max_entries) if max_entries else None,
+            dedup_similarity=float(dedup_similarity) if dedup_similarity else None,
+            dedup_dry_run=os.environ.get("MEMORY_DEDUP_DRY_RUN", "off").lower() == "on",
+            interval=float(os.environ.get("MEMORY_RETENTION_INTERVAL", 3600)),
+            vacuum_ratio=float(os.environ.get("MEMORY_VACUUM_RATIO", 0.1)),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.ttl_days or self.max_entries or self.dedup_similarity)
+
+
+def expired_rows(rows: Iterable[int], timestamps: Iterable[Optional[str]], ttl_days: float,
+                 now: Optional[datetime] = None) -> List[int]:
+    """Linhas com timestamp (ISO) mais antigo que `ttl_days`; entradas sem timestamp não expiram."""
+    cutoff = ((now or datetime.now()) - timedelta(days=ttl_days)).isoformat()
+    # timestamps ISO do mesmo formato comparam corretamente como texto
+    return [row for row, ts in zip(rows, timestamps) if ts and ts < cutoff]
+
+
+def over_cap_rows(live_rows: Sequence[int], max_entries: int) -> List[int]:
+    """As linhas mais antigas (posição menor = gravada antes) que passam do limite."""
+    excess = len(live_rows) - max_entries
+    return sorted(live_rows)[:excess] if excess > 0 else []
+
+
+def near_duplicate_rows(rows: Sequence[int], neighbor_rows: np.ndarray, neighbor_sims: np.ndarray,
+                        threshold: float, live: Set[int]) -> List[int]:
+    """
+    Colapsa entradas quase idênticas, mantendo a mais recente de cada grupo.
+
+    `neighbor_rows[i]`/`neighbor_sims[i]` são os vizinhos mais próximos de `rows[i]`.
+    Percorre da mais nova para a mais antiga: uma entrada sai se tiver um vizinho mais
+    novo, ainda vivo, com similaridade >= `threshold`.
+    """
+    removed = set()
+    for i in np.argsort(rows)[::-1]:
+        row = rows[i]
+        for other, similarity in zip(neighbor_rows[i], neighbor_sims[i]):
+            other = int(other)
+            if other > row and similarity >= threshold and other in live and other not in removed:
+                removed.add(row)
+                break
+    return sorted(removed)
@@ -0,0 +1,213 @@
+import asyncio
+import atexit
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict, Optional
+
+from faiss_memory.memory import LongTermMemory
+
+DEFAULT_SHARD = "__default__"
+
+
+class MemoryShardManager:
+    """
+    Particiona a memória de longo prazo por usuário.
+
+    Cada usuário tem seu próprio LongTermMemory (índice, vetores, metadados e log) em
+    `<base_directory>/users/<id>/`. Os shards são carregados na primeira vez que são usados
+    e os que estão ociosos são descarregados da RAM (com checkpoint) quando o total estimado
+    passa do orçamento; na próxima vez que forem usados, são recarregados do disco. Shards em
+    uso (`use`/`ause`, ex.: entre a busca do contexto e a gravação do turno) nunca são
+    descarregados.
+
+    O shard padrão (user_id None) usa o próprio `base_directory`, que é onde a memória
+    global ficava antes do particionamento.
+    """
+
+    def __init__(self, base_directory: str = "./memory_faiss", memory_budget_mb: Optional[float] = None,
+                 min_idle_seconds: Optional[float] = None, **memory_kwargs):
+        """
+        Args:
+            base_directory: Diretório raiz da memória
+            memory_budget_mb: RAM estimada máxima dos shards carregados (padrão: MEMORY_SHARD_BUDGET_MB ou 512)
+            min_idle_seconds: Tempo sem uso para um shard poder ser descarregado (padrão: MEMORY_SHARD_MIN_IDLE ou 60)
+            memory_kwargs: Argumentos repassados para cada LongTermMemory
+        """
+        self.base_directory = base_directory
+        if memory_budget_mb is None:
+            memory_budget_mb = float(os.environ.get("MEMORY_SHARD_BUDGET_MB", 512))
+        if min_idle_seconds is None:
+            min_idle_seconds = float(os.environ.get("MEMORY_SHARD_MIN_IDLE", 60))
+        self.memory_budget_bytes = int(memory_budget_mb * 1024 * 1024)
+        self.min_idle_seconds = min_idle_seconds
+        self.memory_kwargs = memory_kwargs
+
+        self._shards: "OrderedDict[str, LongTermMemory]" = OrderedDict()
+        self._last_access: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._loading: Dict[str, threading.Lock] = {}
+        self._closing: Dict[str, threading.Thread] = {}
+        #quantos usos em andamento cada shard tem; com algum, ele não é descarregado
+        self._pins: Dict[str, int] = {}
+        self.evictions = 0
+
+    def get(self, user_id: Optional[str] = None) -> LongTermMemory:
+        """
+        Retorna o shard do usuário, carregando-o do disco se necessário.
+        Para usar o shard por mais que uma chamada rápida, prefira `use`/`ause`.
+        """
+        return self._get(user_id, pin=False)
+
+    @contextmanager
+    def use(self, user_id: Optional[str] = None):
+        """Shard do usuário, protegido de descarga até o fim do bloco."""
+        shard = self._get(user_id, pin=True)
+        try:
+            yield shard
+        finally:
+            self._release(user_id or DEFAULT_SHARD)
+
+    @asynccontextmanager
+    async def ause(self, user_id: Optional[str] = None):
+        """Versão assíncrona de `use`: a carga do disco roda fora do event loop."""
+        key = user_id or DEFAULT_SHARD
+        with self._lock:
+            shard = self._touch(key, pin=True)
+        if shard is None:
+            loading = asyncio.get_running_loop().run_in_executor(None, self._get, user_id, True)
+            try:
+                shard = await asyncio.shield(loading)
+            except asyncio.CancelledError:
+                # a carga continua na thread e vai reservar o shard: libera quando ela terminar
+                loading.add_done_callback(lambda f: f.cancelled() or f.exception() or self._release(key))
+                raise
+        try:
+            yield shard
+        finally:
+            self._release(key)
+
+    def _get(self, user_id: Optional[str], pin: bool) -> LongTermMemory:
+        key = user_id or DEFAULT_SHARD
+        with self._lock:
+            shard = self._touch(key, pin)
+            if shard is not None:
+                return shard
+            load_lock = self._loading.setdefault(key, threading.Lock())
+
+        # carrega fora do lock global: outros usuários não esperam pela leitura do disco
+        with load_lock:
+            with self._lock:
+                shard = self._touch(key, pin)
+                if shard is not None:
+                    return shard
+                closing = self._closing.pop(key, None)
+            if closing is not None:
+                # o shard acabou de ser descarregado: espera o checkpoint antes de reabrir os arquivos
+                closing.join()
+            shard = LongTermMemory(persist_directory=self.shard_directory(user_id), **self.memory_kwargs)
+            with self._lock:
+                self._shards[key] = shard
+                self._touch(key, pin)
+                self._loading.pop(key, None)
+                self._evict_idle(keep=key)
+        return shard
+
+    async def aget(self, user_id: Optional[str] = None) -> LongTermMemory:
+        """Versão assíncrona de `get`: a carga do disco roda fora do event loop."""
+        with self._lock:
+            shard = self._touch(user_id or DEFAULT_SHARD)
+        if shard is not None:
+            return shard
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.get, user_id)
+
+    def shard_directory(self, user_id: Optional[str]) -> str:
+        if not user_id:
+            return self.base_directory
+        safe = re.sub(r"[^A-Za-z0-9_.-]", "_", user_id)[:48]
+        digest = hashlib.sha1(user_id.encode("utf-8")).hexdigest()[:8]
+        return os.path.join(self.base_directory, "users", f"{safe}-{digest}")
+
+    def evict(self, user_id: Optional[str] = None) -> bool:
+        """Descarrega um shard da RAM (com checkpoint); shards em uso ficam e devolvem False."""
+        key = user_id or DEFAULT_SHARD
+        with self._lock:
+            if self._pins.get(key):
+                return False
+            shard = self._shards.pop(key, None)
+            self._last_access.pop(key, None)
+        if shard is not None:
+            shard.close()
+            self.evictions += 1
+        return shard is not None
+
+    def close(self):
+        with self._lock:
+            shards = list(self._shards.values())
+            closing = list(self._closing.values())
+            self._shards.clear()
+            self._last_access.clear()
+            self._closing.clear()
+        for shard in shards:
+            shard.close()
+        for thread in closing:
+            thread.join()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            loaded = {key: shard.estimate_memory_bytes() for key, shard in self._shards.items()}
+        return {
+            "loaded_shards": len(loaded),
+            "resident_bytes": sum(loaded.values()),
+            "memory_budget_bytes": self.memory_budget_bytes,
+            "evictions": self.evictions
+        }
+
+    def _touch(self, key: str, pin: bool = False) -> Optional[LongTermMemory]:
+        # chamado com self._lock adquirido
+        shard = self._shards.get(key)
+        if shard is not None:
+            self._shards.move_to_end(key)
+            self._last_access[key] = time.monotonic()
+            if pin:
+                self._pins[key] = self._pins.get(key, 0) + 1
+        return shard
+
+    def _release(self, key: str):
+        with self._lock:
+            count = self._pins.get(key, 0) - 1
+            if count > 0:
+                self._pins[key] = count
+            else:
+                self._pins.pop(key, None)
+            # o tempo ocioso conta a partir do fim do uso, não do começo
+            if key in self._shards:
+                self._last_access[key] = time.monotonic()
+
+    def _evict_idle(self, keep: str):
+        # chamado com self._lock adquirido; percorre do menos para o mais recente
+        total = sum(shard.estimate_memory_bytes() for shard in self._shards.values())
+        now = time.monotonic()
+        for key in list(self._shards.keys()):
+            if total <= self.memory_budget_bytes:
+                break
+            if key == keep or self._pins.get(key) or now - self._last_access.get(key, now) < self.min_idle_seconds:
+                continue
+            shard = self._shards.pop(key)
+            self._last_access.pop(key, None)
+            total -= shard.estimate_memory_bytes()
+            # o checkpoint do shard descarregado roda fora do caminho da requisição
+            closing = threading.Thread(target=shard.close, daemon=True)
+            closing.start()
+            self._closing[key] = closing
+            self.evictions += 1
+            print(f"[MEMORY] Shard '{key}' descarregado da RAM")
+
+
+memory_shards = MemoryShardManager()
+atexit.register(memory_shards.close)
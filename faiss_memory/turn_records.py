@@ -0,0 +1,62 @@
+import os
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_MAX_RESPONSE_CHARS = int(os.environ.get("MEMORY_MAX_RESPONSE_CHARS", 600))
+
+
+def summarize_response(text: str, max_chars: int = DEFAULT_MAX_RESPONSE_CHARS) -> str:
+    """
+    Resumo extrativo de uma resposta longa: as primeiras frases que cabem em `max_chars`.
+    Respostas curtas voltam sem alteração.
+    """
+    text = text.strip()
+    if max_chars <= 0 or len(text) <= max_chars:
+        return text
+    summary = ""
+    for sentence in re.split(r"(?<=[.!?])\s+", text):
+        if len(summary) + len(sentence) + 1 > max_chars:
+            break
+        summary = f"{summary} {sentence}".strip()
+    if not summary:
+        summary = text[:max_chars].rsplit(" ", 1)[0]
+    return summary + " […]"
+
+
+def build_turn_record(user_input: str, assistant_response: str, source_ids: Optional[List[str]] = None,
+                      metadata: Optional[Dict[str, Any]] = None,
+                      max_response_chars: int = DEFAULT_MAX_RESPONSE_CHARS) -> Tuple[str, Dict[str, Any]]:
+    """
+    Monta o registro compacto de um turno: documento (o que é embutido e vai para o prompt)
+    e metadados.
+
+    O documento tem só a pergunta e a resposta (resumida se for longa). O contexto usado
+    para gerar a resposta não entra: as memórias de origem ficam referenciadas por id em
+    `source_ids`, o que evita que cada entrada carregue cópias das anteriores.
+    """
+    document = f"Usuário: {user_input}\nAssistente: {summarize_response(assistant_response, max_response_chars)}"
+    entry_metadata = {
+        "timestamp": datetime.now().isoformat(),
+        "user_input": user_input,
+        "assistant_response": assistant_response,
+        "source_ids": list(source_ids or []),
+        **(metadata or {})
+    }
+    return document, entry_metadata
+
+
+def compact_legacy_record(document: str, metadata: Dict[str, Any],
+                          max_response_chars: int = DEFAULT_MAX_RESPONSE_CHARS) -> Tuple[str, Dict[str, Any]]:
+    """Reescreve uma entrada antiga (com o contexto embutido) no formato compacto, preservando o timestamp."""
+    metadata = dict(metadata)
+    metadata.pop("context", None)
+    user_input = metadata.get("user_input")
+    assistant_response = metadata.get("assistant_response")
+    if user_input is None or assistant_response is None:
+        # sem os campos originais: só remove o bloco de contexto do documento
+        start = document.rfind("Usuário: ")
+        return (document[start:] if start >= 0 else document), metadata
+    compact, _ = build_turn_record(user_input, assistant_response, max_response_chars=max_response_chars)
+    metadata.setdefault("source_ids", [])
+    return compact, metadata
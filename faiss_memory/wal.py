@@ -0,0 +1,89 @@
+import base64
+import json
+import os
+import threading
+from typing import Any, Dict, Iterator
+
+import numpy as np
+
+
+class WriteAheadLog:
+    """
+    Log append-only das escritas da memória de longo prazo.
+
+    Cada registro é uma linha JSON (vetor em base64 float32). O arquivo só cresce
+    entre checkpoints: o checkpoint rotaciona o log atual para `<arquivo>.1`, grava o
+    snapshot e então descarta o log rotacionado. Se o processo cair no meio, os dois
+    arquivos continuam no disco e são reaplicados no próximo carregamento.
+    """
+
+    def __init__(self, path: str, fsync: bool = True):
+        self.path = path
+        self.rotated_path = path + ".1"
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._file = open(self.path, "ab")
+
+    @staticmethod
+    def encode_vector(vector: np.ndarray) -> str:
+        return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+
+    @staticmethod
+    def decode_vector(data: str) -> np.ndarray:
+        return np.frombuffer(base64.b64decode(data), dtype=np.float32)
+
+    def append(self, record: Dict[str, Any]):
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+
+    def rotate(self):
+        """Move o log atual para o arquivo rotacionado e abre um log vazio."""
+        with self._lock:
+            self._file.close()
+            if os.path.exists(self.rotated_path):
+                # checkpoint anterior não terminou: concatena para não perder nada
+                with open(self.rotated_path, "ab") as dst, open(self.path, "rb") as src:
+                    dst.write(src.read())
+                os.remove(self.path)
+            else:
+                os.replace(self.path, self.rotated_path)
+            self._file = open(self.path, "ab")
+
+    def discard_rotated(self):
+        if os.path.exists(self.rotated_path):
+            os.remove(self.rotated_path)
+
+    def truncate(self):
+        with self._lock:
+            self._file.close()
+            self.discard_rotated()
+            self._file = open(self.path, "wb")
+
+    def replay(self) -> Iterator[Dict[str, Any]]:
+        """Lê os registros do log rotacionado e do atual, na ordem em que foram gravados."""
+        for path in (self.rotated_path, self.path):
+            if not os.path.exists(path):
+                continue
+            with open(path, "rb") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # última linha incompleta (queda durante a escrita)
+                        print(f"[WAL] Registro corrompido ignorado em {path}")
+
+    def size(self) -> int:
+        total = 0
+        for path in (self.rotated_path, self.path):
+            if os.path.exists(path):
+                total += os.path.getsize(path)
+        return total
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
@@ -0,0 +1,133 @@
+"""
+Avaliação offline do roteador local de intenções (ver intent_router).
+
+Roda o roteador sobre um conjunto rotulado, diferente dos exemplos do prompt, e mostra,
+para cada corte de similaridade, quantas mensagens dispensariam o LLM (cobertura), a
+acurácia nessas mensagens e a latência do roteador. Use para escolher
+INTENT_ROUTER_MIN_SIMILARITY / INTENT_ROUTER_MIN_MARGIN:
+
+    python -m graph.evaluate_intent_router [--cutoffs 0.7,0.75,0.8,0.85,0.9] [--margin 0.05]
+"""
+import argparse
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from graph.intent_router import IntentRouter, is_ambiguous, is_negated
+from graph.prompts import DECISION_PROMPT
+
+# (mensagem, decisões esperadas); None = o roteador deve deixar com o LLM (depende do histórico,
+# tem negação ou só cita a ação num comentário)
+LABELED_MESSAGES: List[Tuple[str, Optional[Tuple[str, ...]]]] = [
+    ("Oi!", ("CONVERSAR",)),
+    ("Olá, Icarus", ("CONVERSAR",)),
+    ("Boa noite", ("CONVERSAR",)),
+    ("Boa tarde, tudo bom?", ("CONVERSAR",)),
+    ("Valeu!", ("CONVERSAR",)),
+    ("Muito obrigado", ("CONVERSAR",)),
+    ("Tchau, até mais", ("CONVERSAR",)),
+    ("Como você está hoje?", ("CONVERSAR",)),
+    ("Meu cachorro se chama Thor", ("CONVERSAR",)),
+    ("Eu trabalho como engenheiro", ("CONVERSAR",)),
+    ("Você lembra qual é o meu nome?", ("CONVERSAR",)),
+    ("Me conte uma curiosidade", ("CONVERSAR",)),
+    ("Estou cansado hoje", ("CONVERSAR",)),
+    ("Amanhã vou ao cinema com a minha irmã", ("CONVERSAR",)),
+    ("Qual é a sua cor favorita?", ("CONVERSAR",)),
+    ("Agende uma reunião com a equipe na quarta às 11h", ("AGENDAR",)),
+    ("Marque médico para dia 20 às 8h", ("AGENDAR",)),
+    ("Me lembre de ligar para a minha mãe hoje às 19h", ("AGENDAR",)),
+    ("Crie um evento de aniversário no sábado às 20h", ("AGENDAR",)),
+    ("Quero marcar academia amanhã às 7h", ("AGENDAR",)),
+    ("Quais são meus compromissos da semana?", ("LISTAR_EVENTOS",)),
+    ("Mostre minha agenda de amanhã", ("LISTAR_EVENTOS",)),
+    ("O que tenho marcado para sexta?", ("LISTAR_EVENTOS",)),
+    ("Liste os eventos de segunda-feira", ("LISTAR_EVENTOS",)),
+    ("Tenho algum compromisso hoje à tarde?", ("LISTAR_EVENTOS",)),
+    ("Leia meus e-mails", ("EMAIL",)),
+    ("Tenho e-mails novos?", ("EMAIL",)),
+    ("Mostre os e-mails de hoje", ("EMAIL",)),
+    ("Cheque minha caixa de entrada", ("EMAIL",)),
+    ("Veja se chegou e-mail do banco", ("EMAIL",)),
+    ("Envie um e-mail para ana@empresa.com dizendo que vou atrasar", ("ENVIAR_EMAIL",)),
+    ("Mande um email pro Carlos sobre a reunião de amanhã", ("ENVIAR_EMAIL",)),
+    ("Escreva um e-mail para o suporte pedindo o reembolso", ("ENVIAR_EMAIL",)),
+    ("Responda ao e-mail do João dizendo que aceito", ("ENVIAR_EMAIL",)),
+    ("Vai chover hoje?", ("BUSCAR_WEB",)),
+    ("Como está o clima em São Paulo?", ("BUSCAR_WEB",)),
+    ("Quais as notícias de hoje?", ("BUSCAR_WEB",)),
+    ("Pesquise o resultado do jogo do Palmeiras", ("BUSCAR_WEB",)),
+    ("Quem ganhou a Copa de 2002?", ("BUSCAR_WEB",)),
+    ("Qual a cotação do dólar hoje?", ("BUSCAR_WEB",)),
+    ("Quanto está a temperatura agora?", ("BUSCAR_WEB",)),
+    ("Mostre minha agenda de hoje e leia meus e-mails", ("LISTAR_EVENTOS", "EMAIL")),
+    ("Marque dentista na terça às 9h e me diga se vai chover", ("AGENDAR", "BUSCAR_WEB")),
+    ("Me diga as notícias e mostre meus compromissos", ("BUSCAR_WEB", "LISTAR_EVENTOS")),
+    ("Bom dia! Quais meus compromissos hoje?", ("CONVERSAR", "LISTAR_EVENTOS")),
+    # pedidos que citam outra ação no meio ("ver meus e-mails", "minha agenda"): vale o verbo do início
+    ("Marque na minha agenda uma reunião amanhã às 15h", ("AGENDAR",)),
+    ("Adicione na minha agenda dentista sexta às 14h", ("AGENDAR",)),
+    ("Me lembre de ver meus e-mails amanhã às 9h", ("AGENDAR",)),
+    ("Agende uma reunião para revisar meus compromissos amanhã às 10h", ("AGENDAR",)),
+    ("Me mostre de novo aqueles links", None),
+    ("Repete o que você disse antes", None),
+    ("Qual foi o último e-mail que você leu?", None),
+    # gatilhos fora de um pedido: comentários, perguntas sobre o assistente, negações, sem data
+    ("Me lembre de comprar pão", None),
+    ("Adicione leite à lista de compras", None),
+    ("Não mostre meus e-mails", None),
+    ("Você gosta de ver meus e-mails?", None),
+    ("Eu adoro ler notícias", None),
+    ("o clima está ótimo hoje", None),
+    ("Não marque nada na sexta", None),
+    ("Enviei um e-mail para o João ontem", None),
+    ("Minha agenda anda cheia demais", None),
+    ("Odeio quando vai chover no fim de semana", None),
+]
+
+
+def evaluate(router: IntentRouter, cutoffs: List[float]):
+    messages = [message for message, _ in LABELED_MESSAGES]
+    expected = [labels for _, labels in LABELED_MESSAGES]
+    router.warmup()
+
+    # regras + embedding são medidos uma vez; o corte só muda quais palpites são aceitos
+    routes, latencies = [], []
+    for message in messages:
+        start = time.perf_counter()
+        routes.append(router.candidate(message))
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    by_rule = [(r, e) for r, e in zip(routes, expected) if r is not None and r.source == "regra"]
+    rule_hits = sum(1 for r, e in by_rule if r.decisions == e)
+    print(f"Mensagens: {len(messages)}")
+    print(f"Latência do roteador: p50 {np.percentile(latencies, 50):.1f} ms, p95 {np.percentile(latencies, 95):.1f} ms")
+    print(f"Regras: cobertura {len(by_rule)}/{len(messages)}, acurácia {rule_hits}/{len(by_rule)}")
+    print(f"Ambíguas ou negadas (ficam com o LLM): {sum(1 for m in messages if is_ambiguous(m) or is_negated(m))}")
+    print()
+    print(f"{'corte':>6} {'sem LLM':>8} {'acurácia':>9} {'erros':>6}")
+    for cutoff in cutoffs:
+        routed = [(r, e) for r, e in zip(routes, expected) if router.accepts(r, cutoff)]
+        hits = sum(1 for r, e in routed if r.decisions == e)
+        print(f"{cutoff:>6.2f} {len(routed) / len(messages):>8.0%} "
+              f"{(hits / len(routed) if routed else 1.0):>9.0%} {len(routed) - hits:>6}")
+    print()
+    print(f"Erros com o corte atual ({router.min_similarity:.2f}, folga {router.min_margin:.2f}):")
+    for message, route, labels in zip(messages, routes, expected):
+        if router.accepts(route) and route.decisions != labels:
+            print(f"  {message!r}: {route.decisions} ({route.source}, {route.score:.2f}), esperado {labels}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Avalia o roteador local de intenções.")
+    parser.add_argument("--cutoffs", default="0.6,0.65,0.7,0.75,0.8,0.85,0.9,0.95",
+                        help="Cortes de similaridade a comparar, separados por vírgula")
+    parser.add_argument("--margin", type=float, default=None, help="Folga mínima para a segunda classe")
+    args = parser.parse_args()
+    router = IntentRouter.from_prompt(DECISION_PROMPT, min_margin=args.margin, enabled=True)
+    evaluate(router, [float(c) for c in args.cutoffs.split(",")])
+
+
+if __name__ == "__main__":
+    main()
@@ -3,134 +3,49 @@ from utils.utils import add_to_history
 from tools.websearch import buscar_na_web_duckduckgo
 from tools.agenda import criar_evento_na_agenda, listar_eventos_periodo, existe_conflito_agenda
 from tools.email import email_handler, send_email_handler
-from tools.weather import obter_previsao_tempo_weatherapi
-from utils.llm_utils import llm_ask
-from typing import Any
+from tools.runtime import tool_runtime, tool_node
+from utils.llm_utils import llm_ask, warmup_llm
+from faiss_memory.embedding_service import get_embedding_service
+from faiss_memory.shards import memory_shards
+from typing import Any, Dict, List
+import asyncio
+import inspect
 import re
-from utils.date_extractor import extrair_datas_periodo_llm
+import threading
+import chainlit as cl
+from utils.date_extractor import extrair_datas_periodo
+from utils.response_cache import response_cache
 from .state_types import IcarusState
-from faiss_memory.memory import long_term_memory
+from .intent_router import IntentRouter, references_history
+from .prompts import DECISION_PROMPT
+
+
+# classificador local montado a partir dos exemplos do prompt; evita a chamada ao LLM em mensagens óbvias
+intent_router = IntentRouter.from_prompt(DECISION_PROMPT)
 
 
 # Nó decisor
 # Nó decisor com múltiplas intenções
 async def decision_node(state: Any) -> Any:
-    decision_prompt = '''
-Você é Icarus, um assistente pessoal inteligente e contextual. Analise a mensagem do usuário e identifique quais ações, se houver, precisam ser realizadas. As ações possíveis são:
-
-- AGENDAR: quando o usuário pede para marcar, adicionar ou alterar um compromisso, evento ou reunião.
-- EMAIL: quando o usuário pede para ler, buscar ou listar e-mails.
-- ENVIAR_EMAIL: quando o usuário pede para enviar, mandar ou escrever um e-mail para alguém.
-- LISTAR_EVENTOS: quando o usuário pede para ver compromissos, agenda, eventos futuros ou passados.
-- BUSCAR_WEB: quando o usuário pede informações externas, como notícias, fatos, pesquisas, previsão do tempo, etc.
-- CONVERSAR: quando o usuário está apenas conversando, fazendo comentários, perguntas retóricas, piadas, ou não faz um pedido de ação claro.
-
-REGRAS:
-- Analise o contexto, o tom e a intenção da mensagem.
-- Considere o histórico recente da conversa: se o usuário pedir para repetir, mostrar novamente, detalhar, relembrar ou referenciar uma ação já realizada (como links buscados, evento agendado, e-mails lidos, etc.), responda com base no histórico, sem acionar a ferramenta novamente.
-- Só acione BUSCAR_WEB, AGENDAR, EMAIL, ENVIAR_EMAIL ou LISTAR_EVENTOS se houver um pedido CLARO e EXPLÍCITO de ação nova.
-- AGENDAR: apenas quando o usuário pedir para "marcar", "agendar", "criar evento", "lembrar de" com data/hora específica.
-- Se a mensagem for apenas um comentário, curiosidade, piada, pergunta retórica, ou compartilhamento de informações pessoais, classifique como CONVERSAR.
-- Se houver múltiplos pedidos, retorne todas as ações relevantes, separadas por vírgula, na ordem em que aparecem na mensagem.
-- Responda apenas com as palavras-chave das ações, separadas por vírgula, sem explicações.
-- Não invente ações. Se não tiver certeza, prefira CONVERSAR.
-
-Exemplos de contexto:
-Usuário: "Me mostre de novo os links dos jogos do Flamengo"
-Resposta: CONVERSAR (responda mostrando os links buscados anteriormente, sem buscar de novo)
-
-Usuário: "Qual foi o último evento que marquei?"
-Resposta: CONVERSAR (responda com o evento agendado mais recente, sem acionar a agenda)
-
-Usuário: "Repita meus e-mails de hoje"
-Resposta: CONVERSAR (responda com os e-mails já lidos, sem buscar de novo)
-
-Usuário: "Me diga quando o Flamengo joga e marque uma reunião às 15h amanhã"
-Resposta: BUSCAR_WEB, AGENDAR
-
-Usuário: "Sabia que o Flamengo vai jogar amanhã?"
-Resposta: CONVERSAR
-
-Usuário: "Liste meus compromissos de hoje e mostre meus e-mails"
-Resposta: LISTAR_EVENTOS, EMAIL
-
-Usuário: "Quero agendar uma reunião"
-Resposta: AGENDAR
-
-Usuário: "Oi, tudo bem?"
-Resposta: CONVERSAR
-
-Usuário: "Traduza esse texto e me diga quem é o presidente do Brasil"
-Resposta: CONVERSAR, BUSCAR_WEB
-
-Usuário: "Me lembre de comprar pão amanhã às 10h"
-Resposta: AGENDAR
-
-Usuário: "Vou comprar pão amanhã"
-Resposta: CONVERSAR
-
-Usuário: "Qual a previsão do tempo para amanhã?"
-Resposta: BUSCAR_WEB
-
-Usuário: "Você gosta de futebol?"
-Resposta: CONVERSAR
-
-Usuário: "Me envie meus e-mails e marque dentista para sexta às 14h"
-Resposta: EMAIL, AGENDAR
-
-Usuário: "Quais meus compromissos amanhã?"
-Resposta: LISTAR_EVENTOS
-
-Usuário: "Me conte uma piada e mostre minha agenda de hoje"
-Resposta: CONVERSAR, LISTAR_EVENTOS
-
-Usuário: "Qual a capital da França?"
-Resposta: BUSCAR_WEB
-
-Usuário: "Me diga o clima e me envie meus e-mails"
-Resposta: BUSCAR_WEB, EMAIL
-
-Usuário: "Bom dia!"
-Resposta: CONVERSAR
-
-Usuário: "Me lembre de estudar amanhã às 9h e me diga as notícias do dia"
-Resposta: AGENDAR, BUSCAR_WEB
-
-Usuário: "Você sabe quando é o próximo feriado?"
-Resposta: BUSCAR_WEB
-
-Usuário: "Marque reunião para amanhã às 15h e me diga se vai chover"
-Resposta: AGENDAR, BUSCAR_WEB
-
-Usuário: "Meus e-mails e compromissos de hoje, por favor"
-Resposta: EMAIL, LISTAR_EVENTOS
-
-Usuário: "Me mostre meus e-mails, minha agenda e pesquise notícias do Flamengo"
-Resposta: EMAIL, LISTAR_EVENTOS, BUSCAR_WEB
-
-Usuário: "Envie um e-mail para joao@exemplo.com com assunto 'Reunião' e mensagem 'Vamos nos encontrar amanhã'"
-Resposta: ENVIAR_EMAIL
-
-Usuário: "Mande um e-mail para maria@empresa.com sobre a proposta"
-Resposta: ENVIAR_EMAIL
-
-Usuário: "Escreva um e-mail para o cliente sobre o projeto"
-Resposta: ENVIAR_EMAIL
-
-Usuário: "Eu nasci em 2001"
-Resposta: CONVERSAR
-
-Usuário: "Meu nome é João"
-Resposta: CONVERSAR
+    rota = await intent_router.route(state["user_input"])
+    if rota is not None:
+        print(f"[decision_node] rota local ({rota.source}, {rota.score:.2f}): {rota.decisions}")
+        state["decisions"] = list(rota.decisions)
+        return state
 
-Usuário: "Gosto de futebol"
-Resposta: CONVERSAR
+    #mesma mensagem (a menos de maiúsculas, acentos e pontuação) já decidida pelo LLM: reaproveita
+    chave_cache = response_cache.key("decisao", state["user_input"])
+    usa_cache = not references_history(state["user_input"])
+    decisoes = response_cache.get(chave_cache) if usa_cache else None
+    if decisoes is not None:
+        print(f"[decision_node] decisão em cache: {decisoes}")
+        state["decisions"] = list(decisoes)
+        return state
 
-Mensagem do usuário: {mensagem_usuario}
-'''.replace('{mensagem_usuario}', state["user_input"])
+    decision_prompt = DECISION_PROMPT.replace('{mensagem_usuario}', state["user_input"])
 
     #faz a chamada ao LLM com memória de longo prazo
-    resposta = (await llm_ask(decision_prompt, state["messages"], store_in_memory=False, user_input=state["user_input"])).strip().upper()
+    resposta = (await llm_ask(decision_prompt, state["messages"], store_in_memory=False, user_input=state["user_input"], user_id=state.get("user_id"), retrieval=state.setdefault("retrieval", {}), summary=state.get("history_summary"), purpose="extraction")).strip().upper()
 
     #limpa e extrai as decisões
     decisoes = [d.strip() for d in re.split(r'[,\n]+', resposta) if d.strip() in {
@@ -139,6 +54,8 @@ Mensagem do usuário: {mensagem_usuario}
 
     #atualiza o estado
     state["decisions"] = decisoes
+    if decisoes and usa_cache:
+        response_cache.put(chave_cache, tuple(decisoes))
 
     print(state)
     return state
@@ -146,21 +63,82 @@ Mensagem do usuário: {mensagem_usuario}
 
 
 
+# ação -> ações anteriores cujo resultado ela precisa ver (ex.: listar a agenda depois de marcar um evento)
+DEPENDENCIAS_ACOES = {
+    "LISTAR_EVENTOS": {"AGENDAR"},
+    "AGENDAR": {"AGENDAR"},
+}
+# ações que falam direto com a interface (streaming, botões) rodam sozinhas, depois das anteriores
+ACOES_EXCLUSIVAS = {"CONVERSAR", "ENVIAR_EMAIL"}
+
+
+def proximo_estagio(decisions: List[str]) -> List[str]:
+    #maior sequência de ações, a partir da próxima, que podem rodar ao mesmo tempo
+    estagio = [decisions[0]]
+    if estagio[0] in ACOES_EXCLUSIVAS:
+        return estagio
+    for acao in decisions[1:]:
+        if acao in ACOES_EXCLUSIVAS or acao in estagio or DEPENDENCIAS_ACOES.get(acao, set()) & set(estagio):
+            break
+        estagio.append(acao)
+    return estagio
+
+
 async def executar_acoes_em_ordem(state: IcarusState) -> IcarusState:
     print(state)
     decisions = state.get("decisions", [])
     print(f"[executar_acoes_em_ordem] decisions: {decisions}, current_action: {state.get('current_action')}")
     if decisions:
-        next_action = decisions.pop(0)
-        state["current_action"] = next_action
-        state["decisions"] = decisions
+        estagio = proximo_estagio(decisions)
+        state["parallel_actions"] = estagio
+        #uma ação só segue pelo nó dela; várias independentes vão juntas para o nó paralelo
+        state["current_action"] = estagio[0] if len(estagio) == 1 else "PARALELO"
+        state["decisions"] = decisions[len(estagio):]
     else:
         state["current_action"] = None
     return state
 
+
+def make_executar_acoes_em_paralelo_node(pipelines: Dict[str, List[Any]]):
+    async def executar_pipeline(state, nos):
+        for no in nos:
+            if inspect.iscoroutinefunction(no):
+                state = await no(state)
+            else:
+                #nós síncronos vão para threads e não travam os outros ramos (ferramentas já são async, ver tool_node)
+                state = await asyncio.to_thread(no, state)
+        return state
+
+    async def executar_acoes_em_paralelo(state: Any) -> Any:
+        acoes = state.get("parallel_actions", [])
+        ramos = []
+        for acao in acoes:
+            #cada ramo trabalha numa cópia: as respostas e os dados de agenda/e-mail não se misturam
+            ramo = dict(state)
+            ramo["invocations_list"] = []
+            ramo["agenda"] = dict(state.get("agenda", {}))
+            ramo["email"] = dict(state.get("email", {}))
+            ramos.append(executar_pipeline(ramo, pipelines[acao]))
+        resultados = await asyncio.gather(*ramos)
+
+        #junta na ordem pedida pelo usuário, como se as ações tivessem rodado uma após a outra
+        for acao, ramo in zip(acoes, resultados):
+            state["invocations_list"].extend(ramo.get("invocations_list", []))
+            for chave in ("agenda", "email", "websearch"):
+                if chave in ramo and ramo[chave] != state.get(chave):
+                    state[chave] = ramo[chave]
+            if ramo.get("invocation") is not None:
+                state["invocation"] = ramo["invocation"]
+        print(f"[executar_acoes_em_paralelo] {acoes} concluídas")
+        return state
+    return executar_acoes_em_paralelo
+
 # Nó de extração e agendamento
 def make_agendar_node():
     from datetime import datetime, timedelta
+    #criar evento não é repetido: uma tentativa que estourou o tempo pode ter criado o evento
+    criar_evento_node = tool_node("calendar", criar_evento_na_agenda, "Erro ao criar evento", retries=0)
+
     async def agendar_node(state: Any) -> Any:
         try:
             data = state["agenda"]
@@ -177,16 +155,37 @@ def make_agendar_node():
             dt_inicio = datetime.fromisoformat(data['data_hora_inicio_str'])
             duracao = data.get('duracao_minutos', 60)
             dt_fim = dt_inicio + timedelta(minutes=duracao)
-            if existe_conflito_agenda(state, dt_inicio, dt_fim):
-                state["invocation"] = "Já existe um compromisso nesse horário. Por favor, escolha outro horário."
+            #chamadas ao Google pelo tool_runtime: timeout, novas tentativas e circuit breaker
+            try:
+                conflito = await tool_runtime.run("calendar", existe_conflito_agenda, state, dt_inicio, dt_fim,
+                                                  user_id=state.get("user_id"))
+            except Exception as e:
+                #sem conseguir consultar a agenda não dá para garantir que o horário está livre
+                resposta = f"Não consegui consultar sua agenda agora, o evento não foi criado. ({e})"
+                state["invocation"] = resposta
+                state.setdefault("invocations_list", []).append(resposta)
+                return state
+            if conflito:
+                resposta = "Já existe um compromisso nesse horário. Por favor, escolha outro horário."
+                state["invocation"] = resposta
+                state.setdefault("invocations_list", []).append(resposta)
             else:
-                state = criar_evento_na_agenda(state)
+                state = await criar_evento_node(state)
         except Exception as e:
             resposta = f"Não consegui extrair as informações do evento. Por favor, detalhe melhor. ({e})"
             state["invocation"] = resposta
+            state.setdefault("invocations_list", []).append(resposta)
         return state
     return agendar_node
 
+async def mostrar_invocacoes_pendentes(state: Any) -> Any:
+    #envia as respostas do turno que ainda não apareceram na interface, mantendo a ordem das ações
+    pendentes = state.get("invocations_list", [])[state.get("invocations_shown", 0):]
+    if pendentes:
+        await cl.Message(content="\n\n".join(pendentes)).send()
+    state["invocations_shown"] = len(state.get("invocations_list", []))
+    return state
+
 # Nó de conversa
 async def conversa_node(state: Any) -> Any:
     prompt_melhorado = f"""
@@ -205,13 +204,18 @@ Responda de forma natural e útil, considerando o contexto das conversas anterio
 Se for a primeira vez que o usuário compartilha uma informação, agradeça ou reconheça normalmente. 
 Se já souber, diga que lembra!
 """
-    resposta = await llm_ask(prompt_melhorado, state["messages"], store_in_memory=True, user_input=state["user_input"])
+    #a resposta é transmitida token a token numa mensagem própria; o que veio antes dela é mostrado primeiro
+    await mostrar_invocacoes_pendentes(state)
+    mensagem = cl.Message(content="")
+    resposta = await llm_ask(prompt_melhorado, state["messages"], store_in_memory=True, user_input=state["user_input"], user_id=state.get("user_id"), retrieval=state.setdefault("retrieval", {}), on_token=mensagem.stream_token, summary=state.get("history_summary"))
+    await mensagem.send()
     state["invocation"] = resposta
 
     # Adiciona à lista de invocações para múltiplas ações
     if "invocations_list" not in state:
         state["invocations_list"] = []
     state["invocations_list"].append(resposta)
+    state["invocations_shown"] = len(state["invocations_list"])
 
     return state
 
@@ -235,33 +239,50 @@ def make_listar_eventos_periodo_node():
     def node(state):
         data_inicial, data_final = parse_datas(state)
         return listar_eventos_periodo(state, data_inicial, data_final)
-    return node
+    return tool_node("calendar", node, "Erro ao buscar eventos")
 
 
 async def extrair_datas_agendamento_llm_node(state):
-    # Pode customizar o prompt se quiser, mas por padrão usa extrair_datas_periodo_llm
-    return await extrair_datas_periodo_llm(state)
+    # interpretador local primeiro; o LLM só entra quando ele não entende o texto (ver date_extractor)
+    return await extrair_datas_periodo(state)
 
 async def extrair_datas_listagem_llm_node(state):
-    return await extrair_datas_periodo_llm(state)
+    return await extrair_datas_periodo(state)
 
 
 def add_all_assistant_history(state):
-    for resposta in state.get("invocations_list", []):
+    #roda depois de cada estágio do turno: só entram as respostas que ainda não estão no histórico
+    respostas = state.get("invocations_list", [])
+    for resposta in respostas[state.get("history_recorded", 0):]:
         add_to_history(state, "assistant", resposta)
+    state["history_recorded"] = len(respostas)
     return state
 
 
 def build_graph(IcarusState):
+    agendar_node = make_agendar_node()
+    listar_eventos_periodo_node = make_listar_eventos_periodo_node()
+    email_node = tool_node("gmail", email_handler, "Erro ao buscar e-mails")
+    #nós de cada ação, na ordem em que rodam; usados pelo nó paralelo
+    pipelines = {
+        "AGENDAR": [extrair_datas_agendamento_llm_node, agendar_node],
+        "EMAIL": [email_node],
+        "ENVIAR_EMAIL": [send_email_handler],
+        "LISTAR_EVENTOS": [extrair_datas_listagem_llm_node, listar_eventos_periodo_node],
+        "CONVERSAR": [conversa_node],
+        "BUSCAR_WEB": [buscar_na_web_duckduckgo],
+    }
+
     graph = StateGraph(IcarusState)
     graph.add_node("add_user_history", lambda state: add_to_history(state, "user", state["user_input"]))
     graph.add_node("decision_node", decision_node)
     graph.add_node("executar_acoes_em_ordem", executar_acoes_em_ordem)
-    graph.add_node("make_appointment", make_agendar_node())
-    graph.add_node("email_handler", email_handler)
+    graph.add_node("executar_acoes_em_paralelo", make_executar_acoes_em_paralelo_node(pipelines))
+    graph.add_node("make_appointment", agendar_node)
+    graph.add_node("email_handler", email_node)
     graph.add_node("send_email_handler", send_email_handler)
     graph.add_node("conversa_node", conversa_node)
-    graph.add_node("listar_eventos_periodo_node", make_listar_eventos_periodo_node())
+    graph.add_node("listar_eventos_periodo_node", listar_eventos_periodo_node)
     graph.add_node("extrair_datas_agendamento_llm_node", extrair_datas_agendamento_llm_node)
     graph.add_node("extrair_datas_listagem_llm_node", extrair_datas_listagem_llm_node)
     graph.add_node("add_assistant_history", add_all_assistant_history)
@@ -285,6 +306,7 @@ def build_graph(IcarusState):
             "LISTAR_EVENTOS": "extrair_datas_listagem_llm_node",
             "CONVERSAR": "conversa_node",
             "BUSCAR_WEB": "buscar_internet",
+            "PARALELO": "executar_acoes_em_paralelo",
             "FIM": END  # Finalização
         }
     )
@@ -303,9 +325,42 @@ def build_graph(IcarusState):
     #buscar na web
 
     graph.add_edge("buscar_internet", "add_assistant_history")
+    graph.add_edge("executar_acoes_em_paralelo", "add_assistant_history")
 
     graph.add_edge("add_assistant_history", "executar_acoes_em_ordem")
 
     
     compiled_graph = graph.compile()
-    return compiled_graph 
\ No newline at end of file
+    return compiled_graph
+
+
+_compiled_graph = None
+_compiled_graph_lock = threading.Lock()
+
+def get_compiled_graph():
+    #o grafo é imutável: compilado uma vez e compartilhado por todas as sessões (o estado fica em cada sessão)
+    global _compiled_graph
+    with _compiled_graph_lock:
+        if _compiled_graph is None:
+            _compiled_graph = build_graph(IcarusState)
+        return _compiled_graph
+
+
+def warmup():
+    """
+    Prepara o que a primeira mensagem usaria a frio: grafo compilado, modelo de embeddings,
+    exemplos do roteador de intenções, memória compartilhada e endpoint do LLM.
+    """
+    etapas = [
+        ("grafo", get_compiled_graph),
+        ("embeddings", get_embedding_service().warmup),
+        ("roteador de intenções", intent_router.warmup),
+        ("memória", memory_shards.get),
+        ("LLM", warmup_llm),
+    ]
+    for nome, etapa in etapas:
+        try:
+            etapa()
+            print(f"[WARMUP] {nome} pronto")
+        except Exception as e:
+            print(f"[WARMUP] Erro ao aquecer {nome}: {e}") 
\ No newline at end of file
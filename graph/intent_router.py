@@ -0,0 +1,232 @@
+import asyncio
+import os
+import re
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from faiss_memory.embedding_service import EmbeddingService, get_embedding_service
+from faiss_memory.index_backends import normalize_vectors
+
+ACTIONS = ("AGENDAR", "EMAIL", "ENVIAR_EMAIL", "LISTAR_EVENTOS", "BUSCAR_WEB", "CONVERSAR")
+
+# exemplos do prompt do decisor: Usuário: "..." / Resposta: AÇÃO, AÇÃO (comentário opcional)
+_EXAMPLE_PATTERN = re.compile(r'Usuário: "(.+?)"\s*\nResposta: ([^\n]+)')
+
+# pedidos que dependem do histórico ("de novo", "o último evento") ficam sempre com o LLM
+_HISTORY_REFERENCE = re.compile(r"\b(de novo|novamente|repit\w*|repet\w*|[úu]ltim[oa]s?|anterior\w*)\b", re.IGNORECASE)
+
+_CLAUSE_SPLIT = re.compile(r"(?<=[!?.])\s+|\s*(?:[,;]|\be\b(?!-)|\btamb[ée]m\b)\s*", re.IGNORECASE)
+
+# orações só de cortesia ("..., por favor") não pedem nada: não contam como oração
+_FILLER = re.compile(r"^(por favor|pf|pfv|icarus)[!.? ]*$", re.IGNORECASE)
+
+# negações ("não mostre meus e-mails") invertem o sentido do gatilho: ficam com o LLM
+_NEGATION = re.compile(r"\b(n[ãa]o|nunca|nem|jamais)\b", re.IGNORECASE)
+
+# palavras que disparavam as regras antigas. Oração que cita uma delas sem casar com nenhuma regra
+# ("você gosta de ver meus e-mails?", "me lembre de comprar pão") é ambígua: fica com o LLM, e não
+# com o classificador por embeddings, até a taxa de falsos positivos em conversas reais ser medida
+_TRIGGERS = re.compile(r"\b(marc\w*|agend\w*|me lembr\w*|lembre-me|adicion\w*|eventos?|compromissos?|agenda|"
+                       r"e-?mails?|not[íi]cias|clima|temperatura|chov\w*|previs[ãa]o|pesquis\w*)\b", re.IGNORECASE)
+
+# as regras só valem para pedidos: imperativo ("mostre...") ou pergunta ("quais...?") no início da
+# oração, opcionalmente depois de uma cortesia ("por favor", "você pode", "quero"). Comentários que só
+# citam a palavra ("eu adoro ler notícias", "o clima está ótimo") não casam com nenhuma
+_LEAD = r"^(?:(?:por favor|icarus|voc[êe] (?:pode|poderia|consegue)|pode|poderia|consegue|quero|queria|gostaria de|preciso)[,\s]+)*"
+
+# AGENDAR exige data ou hora na oração, como no prompt do decisor ("me lembre de comprar pão" não cria evento)
+_WHEN = (r"(?=.*\b(hoje|amanh[ãa]|segunda|ter[çc]a|quarta|quinta|sexta|s[áa]bado|domingo|semana que vem|"
+         r"pr[óo]xim[oa] (semana|m[êe]s)|dia \d{1,2}|\d{1,2}/\d{1,2}|\d{1,2}\s*h\b|\d{1,2}:\d{2}|[àa]s \d{1,2}))")
+
+# regras por oração; cada oração precisa casar com exatamente uma. Se casar com mais de uma,
+# em vez de escolher uma, a mensagem fica com o LLM
+_RULES: Tuple[Tuple[str, "re.Pattern"], ...] = tuple((action, re.compile(pattern, re.IGNORECASE)) for action, pattern in (
+    ("CONVERSAR", r"^(oi+|ol[áa]|e a[íi]|bom dia|boa tarde|boa noite|tudo bem|tudo bom|como vai( voc[êe])?|"
+                  r"obrigad[oa]|muito obrigad[oa]|valeu|tchau|at[ée] mais|at[ée] logo|beleza|ok|blz)"
+                  r"( icarus)?[!.? ]*$"),
+    ("AGENDAR", _LEAD + _WHEN + r"((marque|marcar|agende|agendar|me lembre|lembre-me|me lembrar)\b|"
+                r"(crie|criar|adicione|adicionar)\b.*\b(evento|reuni[ãa]o|compromisso|lembrete|agenda|calend[áa]rio)\b)"),
+    ("ENVIAR_EMAIL", _LEAD + r"(envie|enviar|envia|mande|mandar|manda|escreva|escrever)\s+(um\s+)?e-?mail\s+(para|pra|pro|ao|à)\b"),
+    ("EMAIL", _LEAD + r"((me\s+)?(leia|ler|liste|listar|mostre|mostrar|ver|veja|cheque|checar|confira|busque|abra|mais|"
+              r"pr[óo]ximos)\b[^?!]*\be-?mails?\b|meus e-?mails[!.? ]*$|"
+              r"(tenho|chegou|chegaram|h[áa]|quais|qual)\b[^?!]*\be-?mails?\b[^!]*\?)"),
+    ("LISTAR_EVENTOS", _LEAD + r"((me\s+)?(liste|listar|mostre|mostrar|ver|veja|confira|cheque|checar|abra)\b[^?!]*"
+                       r"\b(compromissos?|agenda|eventos?)\b|(meus compromissos|minha agenda)[!.? ]*$|"
+                       r"(quais|qual|o que|tenho|h[áa])\b[^?!]*\b(compromissos?|agenda|eventos?|marcado)\b[^!]*\?)"),
+    ("BUSCAR_WEB", _LEAD + r"((pesquise|pesquisar)\b|(busque|buscar|procure|procurar)\b[^?!]*\bna (web|internet)\b|"
+                   r"(me\s+)?(diga|fale|conte|mostre|quero saber)\b[^?!]*\b(not[íi]cias|previs[ãa]o do tempo|clima|"
+                   r"temperatura|vai chover)\b|"
+                   r"(como|qual|quais|quanto|vai|ser[áa] que|o que)\b[^?!]*\b(not[íi]cias|previs[ãa]o do tempo|clima|"
+                   r"temperatura|chover)\b[^!]*\?)"),
+))
+
+
+class IntentRoute(NamedTuple):
+    decisions: Tuple[str, ...]
+    source: str  # "regra" ou "embedding"
+    score: float
+    margin: float = 1.0
+
+
+def parse_prompt_examples(prompt: str) -> List[Tuple[str, Tuple[str, ...]]]:
+    """Extrai os pares (mensagem, ações) dos exemplos few-shot do prompt do decisor."""
+    examples = []
+    for message, answer in _EXAMPLE_PATTERN.findall(prompt):
+        decisions = tuple(a for a in re.findall(r"[A-Z_]+", answer.split("(")[0]) if a in ACTIONS)
+        if decisions:
+            examples.append((message, decisions))
+    return examples
+
+
+def references_history(message: str) -> bool:
+    """Pedidos como "de novo" ou "o último e-mail" dependem da conversa, não só do texto."""
+    return bool(_HISTORY_REFERENCE.search(message))
+
+
+def _clauses(message: str) -> List[str]:
+    return [clause for clause in _CLAUSE_SPLIT.split(message.strip())
+            if clause.strip(" !?.") and not _FILLER.match(clause)]
+
+
+def _clause_actions(message: str) -> List[List[str]]:
+    #ações cujas regras casam com cada oração da mensagem
+    return [[action for action, rule in _RULES if rule.search(clause)] for clause in _clauses(message)]
+
+
+def is_negated(message: str) -> bool:
+    """"Não mostre meus e-mails": o gatilho aparece, mas o pedido é o contrário. Decide o LLM."""
+    return bool(_NEGATION.search(message))
+
+
+def is_ambiguous(message: str) -> bool:
+    """
+    Alguma oração casa com mais de uma regra, ou cita uma ação ("e-mails", "agenda") sem ser um
+    pedido que as regras reconheçam ("você gosta de ver meus e-mails?"): decide o LLM.
+    """
+    for clause in _clauses(message):
+        actions = [action for action, rule in _RULES if rule.search(clause)]
+        if len(actions) > 1 or (not actions and _TRIGGERS.search(clause)):
+            return True
+    return False
+
+
+def match_rules(message: str) -> Optional[Tuple[str, ...]]:
+    """
+    Classifica por regras: cada oração da mensagem precisa casar com exatamente uma regra.
+    Se alguma oração não casar ou casar com mais de uma (ou a mensagem citar o histórico ou
+    tiver negação), devolve None.
+    """
+    if references_history(message) or is_negated(message):
+        return None
+    decisions = []
+    for actions in _clause_actions(message):
+        if len(actions) != 1:
+            return None
+        if actions[0] not in decisions:
+            decisions.append(actions[0])
+    return tuple(decisions) or None
+
+
+class IntentRouter:
+    """
+    Roteador local de intenções que roda antes do LLM no decision_node.
+
+    Mensagens com negação, que citam o histórico ou em que uma oração casa com mais de uma
+    regra vão direto para o LLM. Nas outras, primeiro tenta as regras (saudações, pedidos no
+    imperativo como "leia meus e-mails", perguntas como "vai chover hoje?"); depois um
+    classificador por similaridade de embeddings com os exemplos do prompt (vizinho mais
+    próximo). Só responde quando está confiante: similaridade com o melhor exemplo acima de
+    `min_similarity` e folga de `min_margin` para o melhor exemplo de outra classe. Caso
+    contrário devolve None e o decisor chama o LLM como antes.
+
+    Args:
+        examples: Pares (mensagem, ações) usados pelo classificador
+        min_similarity: Similaridade mínima (padrão: INTENT_ROUTER_MIN_SIMILARITY ou 0.82)
+        min_margin: Folga mínima para a segunda classe (padrão: INTENT_ROUTER_MIN_MARGIN ou 0.05)
+        enabled: Liga/desliga o roteador (padrão: INTENT_ROUTER diferente de "off")
+        embedding_service: Serviço de embeddings (padrão: serviço compartilhado)
+    """
+
+    def __init__(self, examples: Sequence[Tuple[str, Tuple[str, ...]]], min_similarity: Optional[float] = None,
+                 min_margin: Optional[float] = None, enabled: Optional[bool] = None,
+                 embedding_service: Optional[EmbeddingService] = None):
+        self.examples = list(examples)
+        if min_similarity is None:
+            min_similarity = float(os.environ.get("INTENT_ROUTER_MIN_SIMILARITY", 0.82))
+        if min_margin is None:
+            min_margin = float(os.environ.get("INTENT_ROUTER_MIN_MARGIN", 0.05))
+        if enabled is None:
+            enabled = os.environ.get("INTENT_ROUTER", "on").lower() != "off"
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self.enabled = enabled
+        self._embedding_service = embedding_service
+        self._example_vectors = None
+
+    @classmethod
+    def from_prompt(cls, prompt: str, **kwargs) -> "IntentRouter":
+        return cls(parse_prompt_examples(prompt), **kwargs)
+
+    @property
+    def embedding_service(self) -> EmbeddingService:
+        if self._embedding_service is None:
+            self._embedding_service = get_embedding_service()
+        return self._embedding_service
+
+    def example_vectors(self) -> np.ndarray:
+        # calculados uma vez, na primeira mensagem (ou no warmup)
+        if self._example_vectors is None:
+            texts = [message for message, _ in self.examples]
+            self._example_vectors = normalize_vectors(self.embedding_service.encode_batch(texts))
+        return self._example_vectors
+
+    def classify(self, vector: np.ndarray) -> Tuple[Tuple[str, ...], float, float]:
+        """Melhor classe pelo vizinho mais próximo: (ações, similaridade, folga para a segunda classe)."""
+        similarities = self.example_vectors() @ normalize_vectors(vector)[0]
+        order = np.argsort(similarities)[::-1]
+        best = order[0]
+        label = self.examples[best][1]
+        runner_up = next((similarities[i] for i in order[1:] if self.examples[i][1] != label), -1.0)
+        return label, float(similarities[best]), float(similarities[best] - runner_up)
+
+    def candidate(self, message: str) -> Optional[IntentRoute]:
+        """Melhor palpite para a mensagem, sem aplicar os cortes de confiança (avaliação offline)."""
+        if not self._routable(message):
+            return None
+        decisions = match_rules(message)
+        if decisions:
+            return IntentRoute(decisions, "regra", 1.0)
+        label, similarity, margin = self.classify(self.embedding_service.encode(message))
+        return IntentRoute(label, "embedding", similarity, margin)
+
+    def accepts(self, route: Optional[IntentRoute], min_similarity: Optional[float] = None) -> bool:
+        if route is None:
+            return False
+        if min_similarity is None:
+            min_similarity = self.min_similarity
+        return route.source == "regra" or (route.score >= min_similarity and route.margin >= self.min_margin)
+
+    async def route(self, message: str) -> Optional[IntentRoute]:
+        """Decisões para a mensagem, ou None quando o LLM deve decidir."""
+        if not self._routable(message):
+            return None
+        decisions = match_rules(message)
+        if decisions:
+            return IntentRoute(decisions, "regra", 1.0)
+        if self._example_vectors is None:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.example_vectors)
+        # mesmo texto que a busca na memória usa: o embedding sai do cache na conversa
+        label, similarity, margin = self.classify(await self.embedding_service.aencode(message))
+        route = IntentRoute(label, "embedding", similarity, margin)
+        return route if self.accepts(route) else None
+
+    def _routable(self, message: str) -> bool:
+        #ambíguas e negadas também não vão ao classificador por embeddings: "não mostre meus e-mails"
+        #fica perto dos exemplos de EMAIL
+        return (self.enabled and bool(self.examples) and bool(message.strip())
+                and not references_history(message) and not is_negated(message) and not is_ambiguous(message))
+
+    def warmup(self):
+        self.example_vectors()
@@ -9,12 +9,26 @@ class EmailData(TypedDict, total=False):
     emails: Optional[List[Dict[str, Any]]]
     email_selecionado: Optional[Dict[str, Any]]
 
+class RetrievalContext(TypedDict, total=False):
+    #busca na memória de longo prazo feita uma vez por mensagem e reaproveitada pelos nós do turno
+    query: str
+    context: str
+    memory_ids: List[str]
+
 class IcarusState(TypedDict):
+    user_id: Optional[str]
     user_input: str
     decision: Optional[str]
     messages: List[Dict[str, Any]]
+    #turnos antigos resumidos; em messages ficam só os últimos (ver utils.history)
+    history_summary: str
+    history_recorded: int
     agenda: AgendaData
     email: EmailData
     invocation: Optional[Any] 
     decisions: List[Optional[str]]
-    invocations_list:List[str]
\ No newline at end of file
+    current_action: Optional[str]
+    parallel_actions: List[str]
+    invocations_list:List[str]
+    invocations_shown: int
+    retrieval: RetrievalContext
\ No newline at end of file
@@ -0,0 +1,70 @@
+import threading
+import time
+
+
+class FakeRedis:
+    """
+    Stand-in em memória do redis-py, com o subconjunto usado pelo RedisSessionStore:
+    get, set(ex=), delete e transaction (WATCH/MULTI/EXEC). Valores voltam como bytes, como
+    no Redis; a transação roda sob um lock, então nunca há conflito a refazer.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.RLock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[1] is not None and entry[1] <= time.monotonic():
+                del self._data[key]
+                return None
+            return entry[0]
+
+    def set(self, key, value, ex=None):
+        if ex is not None and ex <= 0:
+            raise ValueError("invalid expire time in 'set' command")
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ex if ex else None)
+        return True
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(self._data.pop(key, None) is not None for key in keys)
+
+    def transaction(self, func, *watches, value_from_callable=False):
+        with self._lock:
+            pipe = FakePipeline(self)
+            value = func(pipe)
+            results = pipe.execute()
+        return value if value_from_callable else results
+
+
+class FakePipeline:
+    #antes de multi() os comandos rodam na hora (modo WATCH); depois, ficam na fila até execute()
+    def __init__(self, client: FakeRedis):
+        self.client = client
+        self._queue = None
+
+    def multi(self):
+        self._queue = []
+
+    def get(self, key):
+        return self._run("get", key)
+
+    def set(self, key, value, ex=None):
+        return self._run("set", key, value, ex=ex)
+
+    def execute(self):
+        queue, self._queue = self._queue or [], None
+        return [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in queue]
+
+    def _run(self, name, *args, **kwargs):
+        if self._queue is None:
+            return getattr(self.client, name)(*args, **kwargs)
+        self._queue.append((name, args, kwargs))
+        return self
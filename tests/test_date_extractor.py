@@ -0,0 +1,48 @@
+import asyncio
+import sys
+import types
+
+from utils.date_extractor import extrair_datas_periodo, extrair_datas_periodo_llm
+from utils.response_cache import response_cache
+
+
+def agendar(state):
+    #mesma compatibilização de campos do agendar_node (graph.graph_setup)
+    data = state["agenda"]
+    if "data_inicial" in data and "data_hora_inicio_str" not in data:
+        data["data_hora_inicio_str"] = data["data_inicial"]
+    if "duracao_minutos" not in data:
+        data["duracao_minutos"] = 60
+    return data
+
+
+def turno(state, texto):
+    state["user_input"] = texto
+    return agendar(asyncio.run(extrair_datas_periodo(state)))
+
+
+def test_segundo_agendamento_nao_reaproveita_o_horario_do_primeiro():
+    state = {"agenda": {}, "messages": []}
+    primeiro = turno(state, "Agende reunião em 10/08/2030 às 15h por 30 minutos")
+    assert primeiro["data_hora_inicio_str"] == "2030-08-10T15:00:00"
+    assert primeiro["duracao_minutos"] == 30
+
+    segundo = turno(state, "Marque dentista em 12/08/2030 às 9h")
+    assert segundo["data_hora_inicio_str"] == "2030-08-12T09:00:00"
+    assert segundo["duracao_minutos"] == 60
+
+
+def test_cache_do_llm_separa_conversas_diferentes(monkeypatch):
+    #o mesmo "e no dia seguinte?" em duas conversas: cada uma depende do dia citado antes
+    async def llm_ask(prompt, hist=None, **kwargs):
+        dia = "2030-08-11" if "10/08" in hist[-1]["content"] else "2030-09-02"
+        return '{"data_inicial": "%sT00:00:00"}' % dia
+
+    monkeypatch.setitem(sys.modules, "utils.llm_utils", types.SimpleNamespace(llm_ask=llm_ask))
+    response_cache.clear()
+    datas = []
+    for anterior in ("O que tenho em 10/08/2030?", "O que tenho em 01/09/2030?"):
+        state = {"agenda": {}, "user_input": "e no dia seguinte?",
+                 "messages": [{"role": "user", "content": anterior}]}
+        datas.append(asyncio.run(extrair_datas_periodo_llm(state))["agenda"]["data_inicial"])
+    assert datas == ["2030-08-11T00:00:00", "2030-09-02T00:00:00"]
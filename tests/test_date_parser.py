@@ -0,0 +1,18 @@
+from datetime import datetime
+
+from utils.date_parser import parse_period
+
+AGORA = datetime(2025, 7, 14, 10, 0)
+
+
+def test_intervalo_invertido_fica_com_o_llm():
+    assert parse_period("quero ver agenda de 10 a 5 de julho", AGORA) is None
+    assert parse_period("quero ver agenda de 5 a 10 de julho", AGORA).fim == datetime(2025, 7, 10, 23, 59, 59)
+
+
+def test_hora_ambigua_ou_no_passado_fica_com_o_llm():
+    assert parse_period("amanhã às 3", AGORA) is None
+    assert parse_period("marcar às 8", AGORA) is None
+    assert parse_period("marcar às 8h", AGORA) is None
+    assert parse_period("amanhã às 3 da tarde", AGORA).inicio == datetime(2025, 7, 15, 15, 0)
+    assert parse_period("marcar às 17h", AGORA).inicio == datetime(2025, 7, 14, 17, 0)
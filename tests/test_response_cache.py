@@ -0,0 +1,25 @@
+from utils.response_cache import ResponseCache
+
+
+def test_historico_diferente_nao_reaproveita_a_extracao():
+    cache = ResponseCache(ttl=60, max_entries=10, enabled=True)
+    conversa_a = "Usuário: escreva para ana@empresa.com\n"
+    conversa_b = "Usuário: escreva para bruno@empresa.com\n"
+    cache.put(cache.key("email", "manda pra ele também", keep_case=True, contexto=conversa_a),
+              {"to_email": "ana@empresa.com"})
+
+    assert cache.get(cache.key("email", "manda pra ele também", keep_case=True, contexto=conversa_b)) is None
+    assert cache.get(cache.key("email", "manda pra ele também", keep_case=True, contexto=conversa_a)) == {
+        "to_email": "ana@empresa.com"}
+
+
+def test_alterar_o_valor_devolvido_nao_altera_o_cache():
+    cache = ResponseCache(ttl=60, max_entries=10, enabled=True)
+    chave = cache.key("email", "Envie um e-mail para ana@empresa.com", keep_case=True)
+    email = {"to_email": "ana@empresa.com", "body": "Oi"}
+    cache.put(chave, email)
+    email["body"] = "editado depois de guardar"
+
+    pendente = cache.get(chave)
+    pendente["body"] = "editado no e-mail pendente"
+    assert cache.get(chave)["body"] == "Oi"
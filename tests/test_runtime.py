@@ -0,0 +1,64 @@
+import asyncio
+import threading
+
+import pytest
+
+from tools.runtime import ToolPolicy, ToolRuntime, ToolTimeout, ToolUnavailable, is_transient
+
+
+def runtime(**kwargs):
+    policies = {"lenta": ToolPolicy(0.05, 1, 0.01, 0.01), "rapida": ToolPolicy(1, 2, 0.01, 0.01)}
+    return ToolRuntime(policies=policies, **kwargs)
+
+
+def test_erros_de_configuracao_nao_sao_transitorios():
+    assert not is_transient(FileNotFoundError("token.json"))
+    assert not is_transient(PermissionError("credentials.json"))
+    assert is_transient(ConnectionResetError())
+    assert is_transient(TimeoutError())
+
+
+def test_arquivo_ausente_nao_repete_nem_abre_o_circuito():
+    rt = runtime()
+    chamadas = []
+
+    def sem_token():
+        chamadas.append(1)
+        raise FileNotFoundError("token.json")
+
+    for _ in range(10):
+        with pytest.raises(FileNotFoundError):
+            asyncio.run(rt.run("rapida", sem_token))
+    assert len(chamadas) == 10
+    assert rt.breaker("rapida").state == "closed"
+
+
+def test_erro_de_rede_repete_ate_dar_certo():
+    rt = runtime()
+    chamadas = []
+
+    def instavel():
+        chamadas.append(1)
+        if len(chamadas) < 3:
+            raise ConnectionResetError()
+        return "ok"
+
+    assert asyncio.run(rt.run("rapida", instavel)) == "ok"
+    assert len(chamadas) == 3
+
+
+def test_chamadas_presas_nao_esgotam_o_pool():
+    rt = runtime(max_workers=2, max_stuck=1)
+    solta = threading.Event()
+
+    async def main():
+        with pytest.raises(ToolTimeout):
+            await rt.run("lenta", solta.wait, retries=0)
+        #a thread presa conta: a próxima chamada falha na hora, sem ocupar outra thread
+        with pytest.raises(ToolUnavailable):
+            await rt.run("lenta", lambda: "ok", retries=0)
+        solta.set()
+        await asyncio.sleep(0.05)
+        return await rt.run("lenta", lambda: "ok", retries=0)
+
+    assert asyncio.run(main()) == "ok"
@@ -0,0 +1,112 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from utils.history import ConversationHistory
+from utils.session_store import InMemorySessionStore, RedisSessionStore, SessionStore, SQLiteSessionStore
+
+from .fake_redis import FakeRedis
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return InMemorySessionStore(ttl=60)
+    if request.param == "sqlite":
+        return SQLiteSessionStore(str(tmp_path / "sessions.sqlite3"), ttl=60)
+    return RedisSessionStore(FakeRedis(), ttl=60)
+
+
+def estado(*conteudos, resumo=""):
+    return {"messages": [{"role": "user", "content": c} for c in conteudos], "history_summary": resumo}
+
+
+def test_store_base_e_abstrato():
+    with pytest.raises(TypeError):
+        SessionStore()
+
+
+def test_grava_le_e_apaga(store):
+    asyncio.run(store.aset("s1", estado("oi")))
+    assert asyncio.run(store.aget("s1")) == estado("oi")
+    assert store.get("outra") is None
+    store.delete("s1")
+    assert store.get("s1") is None
+
+
+def test_update_aplica_sobre_o_estado_gravado(store):
+    store.set("s1", estado("a"))
+
+    def acrescenta(atual):
+        atual["messages"].append({"role": "user", "content": "b"})
+        return atual
+
+    assert store.update("s1", acrescenta) == estado("a", "b")
+    assert store.get("s1") == estado("a", "b")
+    assert store.update("s1", lambda atual: None) is None
+    assert store.get("s1") == estado("a", "b")
+    assert store.update("inexistente", acrescenta) is None
+
+
+@pytest.mark.parametrize("ttl_store", ["memory", "sqlite"])
+def test_sessoes_expiram(ttl_store, tmp_path):
+    if ttl_store == "memory":
+        store = InMemorySessionStore(ttl=0.05)
+    else:
+        store = SQLiteSessionStore(str(tmp_path / "sessions.sqlite3"), ttl=0.05)
+    store.set("s1", estado("oi"))
+    time.sleep(0.1)
+    assert store.get("s1") is None
+
+
+def test_redis_grava_com_expiracao():
+    client = FakeRedis()
+    RedisSessionStore(client, ttl=60, prefix="p:").set("s1", estado("oi"))
+    assert client._data["p:s1"][1] is not None
+
+
+def test_workers_no_mesmo_sqlite_nao_perdem_atualizacoes(tmp_path):
+    #dois stores no mesmo arquivo fazem o papel de dois workers
+    caminho = str(tmp_path / "sessions.sqlite3")
+    workers = [SQLiteSessionStore(caminho, ttl=60), SQLiteSessionStore(caminho, ttl=60)]
+    workers[0].set("s1", {"contador": 0})
+
+    def incrementa(atual):
+        atual["contador"] += 1
+        return atual
+
+    def roda(worker):
+        for _ in range(50):
+            worker.update("s1", incrementa)
+
+    threads = [threading.Thread(target=roda, args=(w,)) for w in workers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert workers[1].get("s1")["contador"] == 100
+
+
+def test_compactacao_nao_sobrescreve_turno_gravado_por_outro_worker(store):
+    history = ConversationHistory(recent_turns=1, summarizer="extract")
+    turno_a = estado("primeiro", "segundo")
+    store.set("s1", turno_a)
+    #outro worker respondeu a mais uma mensagem antes de a compactação do turno A terminar
+    store.set("s1", estado("primeiro", "segundo", "terceiro"))
+
+    asyncio.run(history.compact_stored(store, "s1", turno_a))
+
+    gravado = store.get("s1")
+    assert [m["content"] for m in gravado["messages"]] == ["segundo", "terceiro"]
+    assert "primeiro" in gravado["history_summary"]
+
+
+def test_compactacao_desiste_se_outro_worker_ja_compactou(store):
+    history = ConversationHistory(recent_turns=1, summarizer="extract")
+    turno_a = estado("primeiro", "segundo")
+    store.set("s1", estado("segundo", "terceiro", resumo="resumo de outro worker"))
+
+    assert asyncio.run(history.compact_stored(store, "s1", turno_a)) is None
+    assert store.get("s1") == estado("segundo", "terceiro", resumo="resumo de outro worker")
@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+import pytest
+
+from tools.websearch import SearchResult, WebSearch
+
+RESULTADOS = "".join(
+    f'<div class="result results_links"><div class="links_main result__body">'
+    f'<h2><a class="result__a" href="//duckduckgo.com/l/?uddg=https%3A%2F%2Fexemplo.com%2F{i}&amp;rut=x">'
+    f'Título {i}</a></h2><a class="result__snippet">Resumo   {i}</a></div></div>'
+    for i in range(5)
+)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    #página de resultados no formato do DuckDuckGo; "lento" demora, "erro" devolve 500
+    hits = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query).get("q", [""])[0]
+        StubHandler.hits.append(query)
+        if "erro" in query:
+            self.send_response(500)
+            self.end_headers()
+            return
+        if "lento" in query:
+            time.sleep(0.3)
+        body = RESULTADOS.encode()
+        self.send_response(200)
+        self.send_header("content-type", "text/html; charset=utf-8")
+        self.send_header("content-length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture(scope="module")
+def servidor():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/html/"
+    server.shutdown()
+
+
+@pytest.fixture
+def busca(servidor):
+    StubHandler.hits.clear()
+    return WebSearch(search_url=servidor, max_results=3, timeout=2, fetch_pages=0)
+
+
+def test_interpreta_resultados(busca):
+    resultados = asyncio.run(busca.search("capital da França"))
+    assert resultados == [
+        SearchResult("Título 0", "https://exemplo.com/0", "Resumo 0"),
+        SearchResult("Título 1", "https://exemplo.com/1", "Resumo 1"),
+        SearchResult("Título 2", "https://exemplo.com/2", "Resumo 2"),
+    ]
+
+
+def test_buscas_iguais_compartilham_a_requisicao_e_o_cache(busca):
+    async def main():
+        consultas = ["Vai chover hoje?", "vai  chover HOJE", "vai chover hoje"] * 2
+        resultados = await asyncio.gather(*(busca.search(q) for q in consultas))
+        await busca.search("Vai chover hoje")
+        return resultados
+
+    resultados = asyncio.run(main())
+    assert StubHandler.hits == ["Vai chover hoje?"]
+    assert all(r == resultados[0] for r in resultados)
+
+
+def test_erro_nao_entra_no_cache(busca):
+    for _ in range(2):
+        with pytest.raises(httpx.HTTPStatusError):
+            asyncio.run(busca.search("erro"))
+    assert len(StubHandler.hits) == 2
+
+
+def test_timeout_de_quem_busca_nao_prende_quem_espera(busca):
+    async def main():
+        #a primeira chamada faz a requisição e é cancelada pelo timeout; a segunda esperava por ela
+        lider = asyncio.ensure_future(asyncio.wait_for(busca.search("algo lento"), 0.05))
+        await asyncio.sleep(0)
+        seguidor = asyncio.ensure_future(busca.search("algo lento"))
+        with pytest.raises(asyncio.TimeoutError):
+            await lider
+        return await asyncio.wait_for(seguidor, 2)
+
+    assert len(asyncio.run(main())) == 3
+    assert not busca._pending
@@ -0,0 +1,214 @@
+import bisect
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from zoneinfo import ZoneInfo
+
+from googleapiclient.errors import HttpError
+
+#fuso usado para datas sem fuso (as datas extraídas da mensagem do usuário)
+CALENDAR_TIMEZONE = ZoneInfo(os.environ.get("CALENDAR_TIMEZONE", "America/Sao_Paulo"))
+
+
+def to_timestamp(value: datetime) -> float:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=CALENDAR_TIMEZONE)
+    return value.timestamp()
+
+
+def event_bounds(event: Dict[str, Any]):
+    """Início e fim do evento em timestamp; eventos de dia inteiro vão da meia-noite à meia-noite."""
+    def parse(field):
+        value = event.get(field, {})
+        if "dateTime" in value:
+            return to_timestamp(datetime.fromisoformat(value["dateTime"].replace("Z", "+00:00")))
+        return to_timestamp(datetime.fromisoformat(value["date"]))
+    return parse("start"), parse("end")
+
+
+class IntervalIndex:
+    """
+    Índice de intervalos para consultas de sobreposição.
+
+    Eventos ordenados pelo início, com o maior fim visto até cada posição: a busca
+    encontra por bisect os que começam antes do fim da janela e volta só enquanto
+    ainda pode haver algum terminando depois do início dela.
+    """
+
+    def __init__(self, items=()):
+        self._items = sorted(items, key=lambda item: item[0])
+        self._starts = [start for start, _, _ in self._items]
+        self._max_ends = []
+        max_end = float("-inf")
+        for _, end, _ in self._items:
+            max_end = max(max_end, end)
+            self._max_ends.append(max_end)
+
+    def __len__(self):
+        return len(self._items)
+
+    def overlapping(self, start: float, end: float) -> List[Any]:
+        found = []
+        i = bisect.bisect_left(self._starts, end) - 1
+        while i >= 0 and self._max_ends[i] > start:
+            item_start, item_end, value = self._items[i]
+            if item_end > start:
+                found.append(value)
+            i -= 1
+        found.reverse()
+        return found
+
+
+class CalendarCache:
+    """
+    Cópia local dos eventos da agenda, mantida pelo syncToken do Google Calendar.
+
+    A primeira sincronização baixa todos os eventos; as seguintes pedem só o que mudou
+    (eventos cancelados são removidos). Os eventos ficam em SQLite e num IntervalIndex em
+    memória, então verificar conflitos e listar um período não vão à rede. Eventos criados
+    pelo assistente entram no cache na hora (`put`). Se o syncToken expirar (410), o cache
+    é refeito do zero.
+
+    Args:
+        path: Arquivo SQLite (padrão: CALENDAR_CACHE_PATH ou ./calendar_cache.sqlite3)
+        min_sync_interval: Segundos em que uma sincronização recente é reaproveitada sem ir
+            ao Google (padrão: CALENDAR_CACHE_MIN_SYNC ou 30)
+        calendar_id: Agenda sincronizada
+    """
+
+    def __init__(self, path: Optional[str] = None, min_sync_interval: Optional[float] = None,
+                 calendar_id: str = "primary"):
+        self.path = path or os.environ.get("CALENDAR_CACHE_PATH", "./calendar_cache.sqlite3")
+        if min_sync_interval is None:
+            min_sync_interval = float(os.environ.get("CALENDAR_CACHE_MIN_SYNC", 30))
+        self.min_sync_interval = min_sync_interval
+        self.calendar_id = calendar_id
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._puts_during_sync: Optional[Dict[str, Dict[str, Any]]] = None
+        self._last_sync = 0.0
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS events (id TEXT PRIMARY KEY, start_ts REAL, end_ts REAL, event TEXT);
+            CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        self._conn.commit()
+        self._events: Dict[str, tuple] = {}
+        for event_id, start, end, event in self._conn.execute("SELECT id, start_ts, end_ts, event FROM events"):
+            self._events[event_id] = (start, end, json.loads(event))
+        self._index = IntervalIndex(self._events.values())
+
+    def sync(self, service, force: bool = False, strict: bool = False):
+        """
+        Traz as mudanças da agenda desde a última sincronização.
+
+        A consulta ao Google roda fora do lock do cache, então leituras (`events_between`, `put`)
+        não esperam a rede; só uma sincronização roda por vez, e as mudanças são aplicadas sob o
+        lock no fim. Se o Google falhar e já houver uma cópia local, ela continua sendo usada
+        (com aviso), a não ser com `strict`: aí o erro sobe, como sem cópia local, em vez de
+        responder com dados possivelmente velhos.
+        """
+        with self._sync_lock:
+            if not force and time.monotonic() - self._last_sync < self.min_sync_interval:
+                return
+            with self._lock:
+                sync_token = self._get_state("sync_token")
+                #eventos gravados por `put` enquanto a consulta roda são reaplicados por cima dela
+                self._puts_during_sync = {}
+            try:
+                try:
+                    changes, next_token = self._fetch_pages(service, sync_token)
+                    full = sync_token is None
+                except HttpError as e:
+                    if sync_token is None or e.resp.status != 410:
+                        raise
+                    print("[AGENDA] syncToken expirado, refazendo o cache da agenda")
+                    changes, next_token = self._fetch_pages(service, None)
+                    full = True
+            except Exception as e:
+                with self._lock:
+                    self._puts_during_sync = None
+                if strict or sync_token is None:
+                    raise
+                print(f"[AGENDA] Erro ao sincronizar, usando a cópia local: {e}")
+                return
+            with self._lock:
+                self._store_changes(changes, next_token, full)
+            self._last_sync = time.monotonic()
+
+    def events_between(self, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+        """Eventos que se sobrepõem a [start, end), ordenados pelo início."""
+        with self._lock:
+            index = self._index
+        return index.overlapping(to_timestamp(start), to_timestamp(end))
+
+    def put(self, event: Dict[str, Any]):
+        """Grava um evento recém-criado/alterado, sem esperar a próxima sincronização."""
+        with self._lock:
+            self._apply([event])
+            self._conn.commit()
+            if self._puts_during_sync is not None:
+                self._puts_during_sync[event["id"]] = event
+
+    def _fetch_pages(self, service, sync_token: Optional[str]):
+        #só rede: nada do cache é lido ou alterado aqui
+        request = {"calendarId": self.calendar_id, "singleEvents": True, "maxResults": 2500}
+        if sync_token is not None:
+            request["syncToken"] = sync_token
+        changes = []
+        while True:
+            response = service.events().list(**request).execute()
+            changes.extend(response.get("items", []))
+            if not response.get("nextPageToken"):
+                break
+            request["pageToken"] = response["nextPageToken"]
+        return changes, response.get("nextSyncToken")
+
+    def _store_changes(self, changes: List[Dict[str, Any]], next_token: Optional[str], full: bool):
+        if full:
+            self._events = {}
+            self._conn.execute("DELETE FROM events")
+        puts = list(self._puts_during_sync.values())
+        self._puts_during_sync = None
+        self._apply(changes + puts)
+        self._set_state("sync_token", next_token)
+        self._conn.commit()
+        if changes and not full:
+            print(f"[AGENDA] Cache sincronizado: {len(changes)} eventos alterados")
+
+    def _apply(self, events: List[Dict[str, Any]]):
+        for event in events:
+            if event.get("status") == "cancelled" or "start" not in event:
+                self._events.pop(event["id"], None)
+                self._conn.execute("DELETE FROM events WHERE id = ?", (event["id"],))
+                continue
+            start, end = event_bounds(event)
+            self._events[event["id"]] = (start, end, event)
+            self._conn.execute("INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?)",
+                               (event["id"], start, end, json.dumps(event)))
+        # índice imutável: quem está lendo continua com o anterior até a troca
+        self._index = IntervalIndex(self._events.values())
+
+    def _get_state(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, key: str, value: Optional[str]):
+        self._conn.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?)", (key, value))
+
+
+_calendar_cache = None
+_calendar_cache_lock = threading.Lock()
+
+def get_calendar_cache() -> CalendarCache:
+    """Cache da agenda compartilhado pelo processo (uma conta Google por token.json)."""
+    global _calendar_cache
+    with _calendar_cache_lock:
+        if _calendar_cache is None:
+            _calendar_cache = CalendarCache()
+        return _calendar_cache
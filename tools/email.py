@@ -1,60 +1,54 @@
+import json
+import os
+import re
 from typing import Any
 from .agenda import get_permission_google_service
+from .mailbox_cache import get_mailbox_cache
 import base64
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from utils.llm_utils import llm_ask
+from utils.history import conversation_history
+from utils.response_cache import response_cache
 import chainlit as cl
 
+#tamanho da página da caixa de entrada; "mais e-mails" mostra a página seguinte
+EMAIL_PAGE_SIZE = int(os.environ.get("EMAIL_PAGE_SIZE", 10))
+#só o pedido explícito de outra página, junto do substantivo: "meus e-mails mais importantes" não conta
+NEXT_PAGE = re.compile(
+    r"\b(mais|pr[óo]xim[oa]s|seguintes|outros)\s+(\d+\s+)?e-?mails?\b|\be-?mails?\s+seguintes\b", re.IGNORECASE
+)
+
 def email_handler(state: Any) -> Any:
-    try:
-        service = get_permission_google_service("gmail","v1")
-        results = (
-            service.users().messages().list(userId="me", labelIds=["INBOX"], maxResults=10).execute()
-        )
-        messages = results.get("messages", [])
-        if not messages:
-            resposta = "Nenhum e-mail encontrado na caixa de entrada."
-            resposta = resposta.strip()
-            state["invocation"] = resposta
-            state["invocations_list"].append(resposta)
-            return state
-        emails = []
-        for message in messages:
-            msg = (
-                service.users().messages().get(userId="me", id=message["id"]).execute()
-            )
-            snippet = msg.get("snippet", "(sem assunto)")
-            remetente = "(remetente desconhecido)"
-            emails.append({"assunto": snippet, "remetente": remetente, "id": message["id"]})
-        state["email"]["emails"] = emails
-        resposta = "Assuntos dos e-mails encontrados:\n" + "\n".join(f"- {e['assunto']}" for e in emails)
+    service = get_permission_google_service("gmail","v1")
+    mailbox = get_mailbox_cache()
+    #só o que mudou desde a última vez vem do Gmail; a listagem sai do cache local
+    mailbox.sync(service, EMAIL_PAGE_SIZE)
+    #"mais e-mails", "próximos e-mails": continua de onde a página anterior parou
+    offset = 0
+    if NEXT_PAGE.search(state.get("user_input", "")):
+        offset = state["email"].get("offset", 0) + len(state["email"].get("emails") or [])
+    emails = mailbox.list_inbox(service, EMAIL_PAGE_SIZE, offset)
+    if not emails:
+        resposta = "Nenhum e-mail encontrado na caixa de entrada."
         resposta = resposta.strip()
         state["invocation"] = resposta
         state["invocations_list"].append(resposta)
         return state
-    except Exception as e:
-        resposta = f"Erro ao buscar e-mails: {e}"
-        state["invocation"] = resposta
-        state["invocations_list"].append(resposta)
-        return state
+    state["email"]["emails"] = emails
+    state["email"]["offset"] = offset
+    resposta = "Assuntos dos e-mails encontrados:\n" + "\n".join(f"- {e['assunto']} — {e['remetente']}" for e in emails)
+    if mailbox.has_more(offset + len(emails)):
+        resposta += "\n\nHá mais e-mails na caixa de entrada. Peça \"mais e-mails\" para ver os próximos."
+    resposta = resposta.strip()
+    state["invocation"] = resposta
+    state["invocations_list"].append(resposta)
+    return state
 
 def get_email_by_id(email_id):
     try:
         service = get_permission_google_service("gmail", "v1")
-        msg = service.users().messages().get(userId="me", id=email_id, format="full").execute()
-        headers = msg.get("payload", {}).get("headers", [])
-        subject = next((h["value"] for h in headers if h["name"] == "Subject"), "(sem assunto)")
-        from_ = next((h["value"] for h in headers if h["name"] == "From"), "(remetente desconhecido)")
-        date = next((h["value"] for h in headers if h["name"] == "Date"), "(data desconhecida)")
-        snippet = msg.get("snippet", "")
-        return {
-            "assunto": subject,
-            "remetente": from_,
-            "data": date,
-            "snippet": snippet,
-            "id": email_id
-        }
+        return get_mailbox_cache().get(service, email_id)
     except Exception as e:
         return f"Ocorreu um erro ao buscar o e-mail: {e}"
 
@@ -71,44 +65,39 @@ def send_email(to_email, subject, body, cc=None, bcc=None):
     
     Returns:
         dict: Resultado da operação com status e mensagem
+
+    Erros do Gmail sobem para quem chamou (o app envia pelo tool_runtime, ver tools.runtime).
     """
-    try:
-        service = get_permission_google_service("gmail", "v1")
-        
-        #cria a mensagem
-        message = MIMEMultipart()
-        message['to'] = to_email
-        message['subject'] = subject
-        
-        #cc se fornecido
-        if cc:
-            message['cc'] = cc
-            
-        #bcc se fornecido
-        if bcc:
-            message['bcc'] = bcc
-        
-        #ccorpo do email
-        text_part = MIMEText(body, 'plain', 'utf-8')
-        message.attach(text_part)
-        
-        #mensagem em base64
-        raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
-        
-        #envia o e-mail
-        sent_message = service.users().messages().send(userId="me", body={'raw': raw_message}).execute()
-        
-        return {
-            "success": True,
-            "message": "E-mail enviado com sucesso!",
-            "message_id": sent_message['id']
-        }
+    service = get_permission_google_service("gmail", "v1")
+    
+    #cria a mensagem
+    message = MIMEMultipart()
+    message['to'] = to_email
+    message['subject'] = subject
+    
+    #cc se fornecido
+    if cc:
+        message['cc'] = cc
         
-    except Exception as e:
-        return {
-            "success": False,
-            "message": f"Erro ao enviar e-mail: {str(e)}"
-        }
+    #bcc se fornecido
+    if bcc:
+        message['bcc'] = bcc
+    
+    #ccorpo do email
+    text_part = MIMEText(body, 'plain', 'utf-8')
+    message.attach(text_part)
+    
+    #mensagem em base64
+    raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode('utf-8')
+    
+    #envia o e-mail
+    sent_message = service.users().messages().send(userId="me", body={'raw': raw_message}).execute()
+    
+    return {
+        "success": True,
+        "message": "E-mail enviado com sucesso!",
+        "message_id": sent_message['id']
+    }
 
 async def send_email_handler(state: Any) -> Any:
     """
@@ -137,26 +126,30 @@ Se o texto não for sobre enviar e-mail, retorne null.
 Texto: {state['user_input']}
 """
         
-        llm_response = await llm_ask(prompt, state.get('messages', []))
+        #o mesmo pedido (ignorando espaços) já extraído com o mesmo histórico no prompt: não chama o LLM;
+        #o texto mantém maiúsculas e acentos
+        contexto = conversation_history.prompt_context(state.get('messages', []), state.get('history_summary'))
+        chave_cache = response_cache.key("email", state['user_input'], keep_case=True, contexto=contexto)
+        email_data = response_cache.get(chave_cache)
         
-        #tenta extrair JSON da resposta
-        import json
-        import re
-        
-        match = re.search(r'(\{[\s\S]*?\})', llm_response)
-        if not match:
-            state["invocation"] = "Não consegui extrair as informações do e-mail. Por favor, forneça destinatário, assunto e mensagem."
-            state["invocations_list"].append(state["invocation"])
-            return state
-            
         try:
-            email_data = json.loads(match.group(1))
+            if email_data is None:
+                llm_response = await llm_ask(prompt, state.get('messages', []), summary=state.get('history_summary'), purpose="extraction")
+                
+                #tenta extrair JSON da resposta
+                match = re.search(r'(\{[\s\S]*?\})', llm_response)
+                if not match:
+                    state["invocation"] = "Não consegui extrair as informações do e-mail. Por favor, forneça destinatário, assunto e mensagem."
+                    state["invocations_list"].append(state["invocation"])
+                    return state
+                email_data = json.loads(match.group(1))
             
             #valida campos obrigatórios
             if not email_data.get('to_email') or not email_data.get('subject') or not email_data.get('body'):
                 state["invocation"] = "Informações incompletas. Preciso de destinatário, assunto e mensagem para enviar o e-mail."
                 state["invocations_list"].append(state["invocation"])
                 return state
+            response_cache.put(chave_cache, email_data)
             
             #monta a mensagem de confirmação
             confirmation_message = f"""📧 **E-MAIL PARA REVISÃO**
@@ -0,0 +1,80 @@
+import os
+import threading
+from datetime import datetime, timedelta
+
+import google_auth_httplib2
+import httplib2
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient.discovery import build
+
+SCOPES = ["https://www.googleapis.com/auth/calendar","https://www.googleapis.com/auth/gmail.readonly","https://www.googleapis.com/auth/gmail.send"]
+
+TOKEN_FILE = "token.json"
+CREDENTIALS_FILE = "credentials.json"
+#renova o token antes de expirar, para nenhuma chamada pegar um token vencido no meio do turno
+REFRESH_MARGIN = timedelta(seconds=int(os.environ.get("GOOGLE_TOKEN_REFRESH_MARGIN", 300)))
+HTTP_TIMEOUT = float(os.environ.get("GOOGLE_HTTP_TIMEOUT", 30))
+
+_creds = None
+_creds_lock = threading.Lock()
+#clientes do googleapiclient (httplib2) não são thread-safe: um por thread, reaproveitado entre chamadas
+_local = threading.local()
+
+
+def get_credentials() -> Credentials:
+    """
+    Credenciais do Google compartilhadas pelo processo.
+
+    O token.json é lido uma vez; a renovação acontece sob lock quando faltam menos de
+    REFRESH_MARGIN para expirar, e o token novo é gravado de forma atômica, então sessões
+    concorrentes não disputam o arquivo.
+    """
+    global _creds
+    with _creds_lock:
+        if _creds is None and os.path.exists(TOKEN_FILE):
+            _creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
+        if _creds and _creds.valid and not _expires_soon(_creds):
+            return _creds
+        if _creds and _creds.refresh_token:
+            _creds.refresh(Request())
+        else:
+            flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_FILE, SCOPES)
+            _creds = flow.run_local_server(port=8080)
+        _save_token(_creds)
+        return _creds
+
+
+def get_google_service(tool_type, version):
+    """
+    Cliente da API do Google (ex.: "calendar", "v3"), reaproveitado pela thread atual.
+
+    O documento de descoberta vem da cópia estática do googleapiclient (sem ir à rede) e
+    cada thread mantém a mesma conexão HTTP entre chamadas.
+    """
+    creds = get_credentials()
+    services = getattr(_local, "services", None)
+    if services is None:
+        services = _local.services = {}
+        _local.http = google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+    # as credenciais só são trocadas pelo fluxo de login; renovações alteram o mesmo objeto
+    if _local.http.credentials is not creds:
+        services.clear()
+        _local.http = google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+    key = (tool_type, version)
+    if key not in services:
+        services[key] = build(tool_type, version, http=_local.http, cache_discovery=False, static_discovery=True)
+    return services[key]
+
+
+def _expires_soon(creds) -> bool:
+    # expiry do google-auth é um datetime UTC sem fuso
+    return creds.expiry is not None and creds.expiry - REFRESH_MARGIN <= datetime.utcnow()
+
+
+def _save_token(creds):
+    tmp_path = TOKEN_FILE + ".tmp"
+    with open(tmp_path, "w") as token:
+        token.write(creds.to_json())
+    os.replace(tmp_path, TOKEN_FILE)
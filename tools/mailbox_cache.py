@@ -0,0 +1,302 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from googleapiclient.errors import HttpError
+
+#o Gmail recomenda no máximo 50 chamadas por requisição em lote
+EMAIL_BATCH_SIZE = 50
+#chamadas do lote recusadas com 429/5xx são repetidas sozinhas, com espera crescente
+EMAIL_BATCH_RETRIES = int(os.environ.get("EMAIL_BATCH_RETRIES", 3))
+EMAIL_HEADERS = ["Subject", "From", "Date"]
+METADATA_FIELDS = "id,threadId,labelIds,internalDate,snippet,payload/headers"
+
+
+def email_from_message(msg) -> Dict[str, Any]:
+    headers = {h["name"]: h["value"] for h in msg.get("payload", {}).get("headers", [])}
+    return {
+        "assunto": headers.get("Subject") or msg.get("snippet") or "(sem assunto)",
+        "remetente": headers.get("From", "(remetente desconhecido)"),
+        "data": headers.get("Date", "(data desconhecida)"),
+        "snippet": msg.get("snippet", ""),
+        "id": msg["id"],
+        "thread_id": msg.get("threadId"),
+        "labels": msg.get("labelIds", []),
+        "internal_date": int(msg.get("internalDate", 0)),
+    }
+
+
+def _is_retryable(error) -> bool:
+    status = getattr(getattr(error, "resp", None), "status", None)
+    return status is not None and (int(status) == 429 or int(status) >= 500)
+
+
+def fetch_emails_metadata(service, ids: List[str]) -> List[Dict[str, Any]]:
+    """
+    Busca assunto/remetente/data de vários e-mails em requisições em lote (uma ida ao servidor a cada 50).
+
+    Chamadas do lote que falham com 429/5xx são repetidas (só elas); e-mails apagados no meio
+    do caminho (404) ficam de fora. Se alguma outra falha sobrar, o erro sobe: quem chamou não
+    pode tratar a lista como completa.
+    """
+    found = {}
+    errors = {}
+
+    def callback(request_id, response, exception):
+        if exception is not None:
+            errors[request_id] = exception
+        else:
+            found[response["id"]] = email_from_message(response)
+
+    failed = []
+    pending = list(ids)
+    for attempt in range(EMAIL_BATCH_RETRIES + 1):
+        if attempt:
+            time.sleep(0.5 * 2 ** (attempt - 1))
+        errors.clear()
+        for start in range(0, len(pending), EMAIL_BATCH_SIZE):
+            batch = service.new_batch_http_request(callback=callback)
+            for email_id in pending[start:start + EMAIL_BATCH_SIZE]:
+                batch.add(service.users().messages().get(
+                    userId="me", id=email_id, format="metadata", metadataHeaders=EMAIL_HEADERS,
+                    fields=METADATA_FIELDS
+                ), request_id=email_id)
+            batch.execute()
+        pending = [i for i, e in errors.items() if _is_retryable(e)]
+        failed += [e for e in errors.values()
+                   if not _is_retryable(e) and getattr(getattr(e, "resp", None), "status", None) != 404]
+        if not pending:
+            break
+    else:
+        failed += [errors[i] for i in pending]
+    if failed:
+        raise failed[0]
+    #mantém a ordem pedida
+    return [found[i] for i in ids if i in found]
+
+
+class MailboxCache:
+    """
+    Cópia local (SQLite) dos metadados da caixa de entrada, sincronizada pelo historyId do Gmail.
+
+    A primeira sincronização baixa a primeira página da caixa de entrada e guarda o historyId
+    atual; as seguintes pedem só o que mudou desde então (`users.history.list`) e buscam os
+    metadados apenas das mensagens novas ou alteradas. Páginas mais antigas são baixadas
+    sob demanda quando a listagem passa do que está no cache. Se o historyId ficar velho
+    demais (404), o cache é refeito do zero. Se o Gmail falhar e já houver uma cópia local,
+    ela continua sendo usada (com aviso) e o historyId não avança: nada se perde na próxima.
+
+    Args:
+        path: Arquivo SQLite (padrão: EMAIL_CACHE_PATH ou ./mail_cache.sqlite3)
+        min_sync_interval: Segundos em que uma sincronização recente é reaproveitada sem ir
+            ao Gmail (padrão: EMAIL_CACHE_MIN_SYNC ou 15)
+    """
+
+    def __init__(self, path: Optional[str] = None, min_sync_interval: Optional[float] = None):
+        self.path = path or os.environ.get("EMAIL_CACHE_PATH", "./mail_cache.sqlite3")
+        if min_sync_interval is None:
+            min_sync_interval = float(os.environ.get("EMAIL_CACHE_MIN_SYNC", 15))
+        self.min_sync_interval = min_sync_interval
+        self._lock = threading.RLock()
+        self._last_sync = 0.0
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id TEXT PRIMARY KEY,
+                thread_id TEXT,
+                assunto TEXT,
+                remetente TEXT,
+                data TEXT,
+                snippet TEXT,
+                labels TEXT,
+                internal_date INTEGER,
+                inbox INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS messages_inbox_date ON messages (inbox, internal_date DESC);
+            CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        self._conn.commit()
+
+    def sync(self, service, page_size: int = 10, force: bool = False):
+        """
+        Traz as mudanças da caixa postal desde a última sincronização.
+
+        Se o Gmail falhar e já houver uma cópia local, ela continua sendo usada (com aviso);
+        sem cópia local o erro sobe, em vez de virar "caixa de entrada vazia".
+        """
+        with self._lock:
+            if not force and time.monotonic() - self._last_sync < self.min_sync_interval:
+                return
+            history_id = self._get_state("history_id")
+            try:
+                if history_id is None:
+                    self._full_sync(service, page_size)
+                else:
+                    try:
+                        self._incremental_sync(service, history_id)
+                    except HttpError as e:
+                        if e.resp.status != 404:
+                            raise
+                        print("[EMAIL] historyId expirado, refazendo o cache da caixa de entrada")
+                        self._full_sync(service, page_size)
+            except Exception as e:
+                #desfaz o que ficou pela metade (uma cópia completa apaga o cache antes de baixar)
+                self._conn.rollback()
+                if self._get_state("history_id") is None:
+                    raise
+                print(f"[EMAIL] Erro ao sincronizar, usando a cópia local: {e}")
+                return
+            self._last_sync = time.monotonic()
+
+    def list_inbox(self, service, limit: int, offset: int = 0) -> List[Dict[str, Any]]:
+        """E-mails da caixa de entrada, do mais novo para o mais antigo; baixa páginas antigas se faltar."""
+        with self._lock:
+            while self._inbox_count() < offset + limit and self._get_state("older_page_token"):
+                self._load_older(service, limit)
+            rows = self._conn.execute(
+                "SELECT * FROM messages WHERE inbox = 1 ORDER BY internal_date DESC LIMIT ? OFFSET ?",
+                (limit, offset)
+            ).fetchall()
+        return [self._row_to_email(row) for row in rows]
+
+    def has_more(self, count: int) -> bool:
+        with self._lock:
+            return self._inbox_count() > count or bool(self._get_state("older_page_token"))
+
+    def get(self, service, email_id: str) -> Dict[str, Any]:
+        """Metadados de um e-mail, do cache ou (se ainda não visto) do Gmail."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM messages WHERE id = ?", (email_id,)).fetchone()
+        if row is not None:
+            return self._row_to_email(row)
+        msg = service.users().messages().get(
+            userId="me", id=email_id, format="metadata", metadataHeaders=EMAIL_HEADERS, fields=METADATA_FIELDS
+        ).execute()
+        email = email_from_message(msg)
+        with self._lock:
+            self._store([email])
+        return email
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM messages")
+            self._conn.execute("DELETE FROM sync_state")
+            self._conn.commit()
+            self._last_sync = 0.0
+
+    def _full_sync(self, service, page_size: int):
+        # o historyId é lido antes da listagem: mudanças durante a cópia aparecem na próxima sincronização
+        profile = service.users().getProfile(userId="me").execute()
+        results = service.users().messages().list(userId="me", labelIds=["INBOX"], maxResults=page_size).execute()
+        ids = [m["id"] for m in results.get("messages", [])]
+        emails = fetch_emails_metadata(service, ids)
+        # só troca o cache depois de baixar tudo: uma falha no meio mantém a cópia anterior
+        self._conn.execute("DELETE FROM messages")
+        self._conn.execute("DELETE FROM sync_state")
+        self._set_state("history_id", str(profile["historyId"]))
+        self._set_state("older_page_token", results.get("nextPageToken") or "")
+        self._store(emails)
+
+    def _load_older(self, service, page_size: int):
+        request = {"userId": "me", "labelIds": ["INBOX"], "maxResults": page_size}
+        page_token = self._get_state("older_page_token")
+        if page_token:
+            request["pageToken"] = page_token
+        results = service.users().messages().list(**request).execute()
+        ids = [m["id"] for m in results.get("messages", [])]
+        known = self._known_ids(ids)
+        self._store(fetch_emails_metadata(service, [i for i in ids if i not in known]))
+        self._set_state("older_page_token", results.get("nextPageToken") or "")
+        self._conn.commit()
+
+    def _incremental_sync(self, service, history_id: str):
+        changed, deleted = [], set()
+        request = {
+            "userId": "me",
+            "startHistoryId": history_id,
+            "historyTypes": ["messageAdded", "messageDeleted", "labelAdded", "labelRemoved"],
+        }
+        while True:
+            response = service.users().history().list(**request).execute()
+            for record in response.get("history", []):
+                for item in record.get("messagesAdded", []) + record.get("labelsAdded", []) + record.get("labelsRemoved", []):
+                    changed.append(item["message"]["id"])
+                for item in record.get("messagesDeleted", []):
+                    deleted.add(item["message"]["id"])
+            new_history_id = response.get("historyId", history_id)
+            if not response.get("nextPageToken"):
+                break
+            request["pageToken"] = response["nextPageToken"]
+
+        changed = [i for i in dict.fromkeys(changed) if i not in deleted]
+        # novas ou com rótulos alterados: rebusca só os metadados delas; se algum falhar o erro
+        # sobe antes de gravar o novo historyId, e a próxima sincronização pede tudo de novo
+        emails = fetch_emails_metadata(service, changed) if changed else []
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [self._email_row(e) for e in emails]
+        )
+        if deleted:
+            self._conn.executemany("DELETE FROM messages WHERE id = ?", [(i,) for i in deleted])
+        self._set_state("history_id", str(new_history_id))
+        self._conn.commit()
+        if changed or deleted:
+            print(f"[EMAIL] Cache sincronizado: {len(changed)} novos/alterados, {len(deleted)} removidos")
+
+    def _store(self, emails: List[Dict[str, Any]]):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [self._email_row(e) for e in emails]
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _email_row(e: Dict[str, Any]) -> tuple:
+        return (e["id"], e["thread_id"], e["assunto"], e["remetente"], e["data"], e["snippet"],
+                json.dumps(e["labels"]), e["internal_date"], int("INBOX" in e["labels"]))
+
+    def _known_ids(self, ids: List[str]) -> set:
+        if not ids:
+            return set()
+        placeholders = ",".join("?" * len(ids))
+        rows = self._conn.execute(f"SELECT id FROM messages WHERE id IN ({placeholders})", ids).fetchall()
+        return {row[0] for row in rows}
+
+    def _inbox_count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM messages WHERE inbox = 1").fetchone()[0]
+
+    def _get_state(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, key: str, value: str):
+        self._conn.execute("INSERT OR REPLACE INTO sync_state VALUES (?, ?)", (key, value))
+
+    @staticmethod
+    def _row_to_email(row) -> Dict[str, Any]:
+        return {
+            "id": row[0],
+            "thread_id": row[1],
+            "assunto": row[2],
+            "remetente": row[3],
+            "data": row[4],
+            "snippet": row[5],
+            "labels": json.loads(row[6] or "[]"),
+            "internal_date": row[7],
+        }
+
+
+_mailbox_cache = None
+_mailbox_cache_lock = threading.Lock()
+
+def get_mailbox_cache() -> MailboxCache:
+    """Cache da caixa de entrada compartilhado pelo processo (uma conta Google por token.json)."""
+    global _mailbox_cache
+    with _mailbox_cache_lock:
+        if _mailbox_cache is None:
+            _mailbox_cache = MailboxCache()
+        return _mailbox_cache
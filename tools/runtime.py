@@ -0,0 +1,325 @@
+import asyncio
+import inspect
+import math
+import os
+import random
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+import httpx
+
+
+class ToolError(Exception):
+    """Falha detectada pelo próprio runtime; a mensagem já é legível para o usuário."""
+
+    def __init__(self, tool: str, message: str):
+        super().__init__(message)
+        self.tool = tool
+
+
+class ToolTimeout(ToolError):
+    pass
+
+
+class ToolUnavailable(ToolError):
+    """Circuit breaker aberto: a chamada nem chegou a ser feita."""
+
+
+class ToolPolicy(NamedTuple):
+    timeout: float
+    retries: int
+    backoff: float
+    max_backoff: float
+
+
+def _policy(tool: str, timeout: float, retries: int) -> ToolPolicy:
+    nome = tool.upper()
+    return ToolPolicy(
+        timeout=float(os.environ.get(f"TOOL_TIMEOUT_{nome}", timeout)),
+        retries=int(os.environ.get(f"TOOL_RETRIES_{nome}", retries)),
+        backoff=float(os.environ.get("TOOL_BACKOFF", 0.5)),
+        max_backoff=float(os.environ.get("TOOL_MAX_BACKOFF", 4)),
+    )
+
+
+#timeouts abaixo do GOOGLE_HTTP_TIMEOUT: a resposta ao usuário não espera o socket desistir
+TOOL_POLICIES: Dict[str, ToolPolicy] = {
+    "calendar": _policy("calendar", 15, 2),
+    "gmail": _policy("gmail", 20, 2),
+    "websearch": _policy("websearch", 12, 1),
+    "weather": _policy("weather", 6, 1),
+}
+DEFAULT_POLICY = _policy("default", 15, 1)
+
+SERVICE_NAMES = {
+    "calendar": "o Google Agenda",
+    "gmail": "o Gmail",
+    "websearch": "a busca na web",
+    "weather": "o serviço de previsão do tempo",
+}
+
+
+def is_transient(exc: BaseException) -> bool:
+    """
+    Erros que valem nova tentativa e contam para o circuit breaker: rede, tempo esgotado,
+    408/429/5xx. Outros OSError (token.json ou credentials.json ausentes, sem permissão) são
+    erro de configuração: sobem na hora e não abrem o circuito.
+    """
+    status = getattr(getattr(exc, "resp", None), "status", None)  # HttpError do googleapiclient
+    if status is None and isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+    if status is not None:
+        status = int(status)
+        return status in (408, 429) or status >= 500
+    if isinstance(exc, (ToolTimeout, asyncio.TimeoutError, TimeoutError, ConnectionError, socket.gaierror,
+                        httpx.TransportError)):
+        return True
+    #ServerNotFoundError e afins do httplib2 (cliente HTTP do Google) não herdam de OSError
+    return type(exc).__module__.startswith("httplib2")
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker de um backend. Depois de `failure_threshold` falhas transitórias seguidas o
+    circuito abre e as chamadas falham na hora, sem ir à rede; passados `reset_timeout`
+    segundos uma única chamada de teste é liberada e, se der certo, o circuito fecha.
+
+    Args:
+        failure_threshold: Falhas seguidas até abrir (padrão: TOOL_BREAKER_FAILURES ou 5)
+        reset_timeout: Segundos aberto até a chamada de teste (padrão: TOOL_BREAKER_RESET ou 30)
+    """
+
+    def __init__(self, name: str, failure_threshold: Optional[int] = None, reset_timeout: Optional[float] = None):
+        self.name = name
+        self.failure_threshold = failure_threshold or int(os.environ.get("TOOL_BREAKER_FAILURES", 5))
+        self.reset_timeout = reset_timeout or float(os.environ.get("TOOL_BREAKER_RESET", 30))
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if self.retry_after() == 0 else "open"
+
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        if self.opened_at is not None:
+            print(f"[TOOLS] {self.name}: backend respondeu, circuito fechado")
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self._probing:
+                print(f"[TOOLS] {self.name}: {self.failures} falhas seguidas, circuito aberto por {self.reset_timeout:g} s")
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def release(self):
+        #a chamada terminou sem dizer nada sobre a saúde do backend (erro de dados, cancelamento)
+        self._probing = False
+
+
+class ToolRuntime:
+    """
+    Camada única por onde passam as chamadas das ferramentas (Google Agenda, Gmail, busca na
+    web, previsão do tempo).
+
+    Cada chamada passa pelo circuit breaker do backend (aberto: ToolUnavailable na hora),
+    pelos limites de chamadas simultâneas por usuário e no processo, pelo timeout da política
+    da ferramenta (ToolTimeout) e por novas tentativas com backoff exponencial em erros
+    transitórios. Funções síncronas rodam num pool de threads limitado de cada ferramenta,
+    fora do pool padrão do asyncio: um backend lento ocupa só as próprias threads e não
+    atrasa as outras ferramentas nem as outras sessões.
+
+    O timeout libera quem chamou, mas não interrompe a thread: ela continua ocupada até a
+    chamada de rede desistir (GOOGLE_HTTP_TIMEOUT). Para uma chamada travada não tomar o pool
+    inteiro, com `max_stuck` threads da ferramenta nessa situação as chamadas seguintes
+    falham na hora (ToolUnavailable) até alguma delas terminar.
+
+    Args:
+        max_workers: Threads por ferramenta síncrona (padrão: TOOL_MAX_WORKERS ou 4)
+        max_concurrency: Chamadas simultâneas no processo (padrão: TOOL_MAX_CONCURRENCY ou 16)
+        max_per_user: Chamadas simultâneas por usuário (padrão: TOOL_MAX_PER_USER ou 4)
+        max_stuck: Threads por ferramenta ainda presas em chamadas que estouraram o tempo
+            (padrão: TOOL_MAX_STUCK ou metade de max_workers)
+        policies: Timeout e tentativas por ferramenta (padrão: TOOL_POLICIES, ajustáveis por
+            TOOL_TIMEOUT_<FERRAMENTA> e TOOL_RETRIES_<FERRAMENTA>)
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_concurrency: Optional[int] = None,
+                 max_per_user: Optional[int] = None, max_stuck: Optional[int] = None,
+                 policies: Optional[Dict[str, ToolPolicy]] = None):
+        self.max_workers = max_workers or int(os.environ.get("TOOL_MAX_WORKERS", 4))
+        self.max_concurrency = max_concurrency or int(os.environ.get("TOOL_MAX_CONCURRENCY", 16))
+        self.max_per_user = max_per_user or int(os.environ.get("TOOL_MAX_PER_USER", 4))
+        self.max_stuck = max_stuck or int(os.environ.get("TOOL_MAX_STUCK", max(1, self.max_workers // 2)))
+        self.policies = policies if policies is not None else TOOL_POLICIES
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self._executors: Dict[str, ThreadPoolExecutor] = {}
+        self._executors_lock = threading.Lock()
+        #threads ainda rodando chamadas que já estouraram o tempo; liberadas pela própria thread
+        self._stuck: Dict[str, int] = {}
+        #semáforos do asyncio ficam presos ao loop em que foram usados: recriados se o loop mudar
+        self._loop = None
+        self._global: Optional[asyncio.Semaphore] = None
+        self._users: Dict[str, list] = {}
+
+    def breaker(self, tool: str) -> CircuitBreaker:
+        if tool not in self.breakers:
+            self.breakers[tool] = CircuitBreaker(tool)
+        return self.breakers[tool]
+
+    def executor(self, tool: str) -> ThreadPoolExecutor:
+        with self._executors_lock:
+            if tool not in self._executors:
+                self._executors[tool] = ThreadPoolExecutor(self.max_workers, thread_name_prefix=f"tool-{tool}")
+            return self._executors[tool]
+
+    async def run(self, tool: str, fn: Callable, *args, user_id: Optional[str] = None,
+                  timeout: Optional[float] = None, retries: Optional[int] = None, **kwargs) -> Any:
+        """
+        Executa `fn(*args, **kwargs)` (síncrona ou async) como chamada da ferramenta `tool`.
+        `retries=0` para operações que não podem se repetir (criar evento, enviar e-mail).
+        Erros da função sobem como vieram, depois das tentativas.
+        """
+        policy = self.policies.get(tool, DEFAULT_POLICY)
+        timeout = policy.timeout if timeout is None else timeout
+        retries = policy.retries if retries is None else retries
+        breaker = self.breaker(tool)
+        for attempt in range(retries + 1):
+            if not breaker.allow():
+                raise ToolUnavailable(tool, f"{SERVICE_NAMES.get(tool, tool)} está indisponível no momento, "
+                                            f"tente de novo em {math.ceil(breaker.retry_after()) or 1} s")
+            try:
+                async with self._slots(user_id):
+                    result = await self._call(tool, fn, args, kwargs, timeout)
+            except asyncio.CancelledError:
+                breaker.release()
+                raise
+            except Exception as e:
+                if not is_transient(e):
+                    breaker.release()
+                    raise
+                breaker.record_failure()
+                if attempt == retries:
+                    raise
+                espera = min(policy.max_backoff, policy.backoff * 2 ** attempt) * random.uniform(0.5, 1)
+                #só o tipo do erro: mensagens do httpx trazem a URL, com chaves de API na query
+                print(f"[TOOLS] {tool}: {type(e).__name__}; nova tentativa em {espera:.1f} s")
+                await asyncio.sleep(espera)
+            else:
+                breaker.record_success()
+                return result
+
+    async def _call(self, tool: str, fn: Callable, args, kwargs, timeout: float) -> Any:
+        if inspect.iscoroutinefunction(fn):
+            try:
+                return await asyncio.wait_for(fn(*args, **kwargs), timeout)
+            except asyncio.TimeoutError:
+                raise self._timeout(tool, timeout) from None
+        with self._executors_lock:
+            stuck = self._stuck.get(tool, 0)
+        if stuck >= self.max_stuck:
+            raise ToolUnavailable(tool, f"{SERVICE_NAMES.get(tool, tool)} não está respondendo ({stuck} chamadas "
+                                        f"anteriores ainda presas), tente de novo em instantes")
+        job = self.executor(tool).submit(partial(fn, *args, **kwargs))
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(job), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            #a thread não pode ser interrompida: conta como presa até a chamada terminar sozinha
+            if not job.cancel():
+                self._mark_stuck(tool, job)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise self._timeout(tool, timeout) from None
+
+    def _mark_stuck(self, tool: str, job):
+        with self._executors_lock:
+            self._stuck[tool] = self._stuck.get(tool, 0) + 1
+
+        def done(_):
+            with self._executors_lock:
+                self._stuck[tool] -= 1
+
+        job.add_done_callback(done)
+
+    @staticmethod
+    def _timeout(tool: str, timeout: float) -> ToolTimeout:
+        return ToolTimeout(tool, f"{SERVICE_NAMES.get(tool, tool)} demorou mais de {timeout:g} s para responder")
+
+    @asynccontextmanager
+    async def _slots(self, user_id: Optional[str]):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._global = asyncio.Semaphore(self.max_concurrency)
+            self._users = {}
+        if user_id is None:
+            async with self._global:
+                yield
+            return
+        #o limite do usuário vem primeiro: chamadas dele na fila não seguram vagas globais
+        entry = self._users.get(user_id)
+        if entry is None:
+            entry = self._users[user_id] = [asyncio.Semaphore(self.max_per_user), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._global:
+                    yield
+        finally:
+            entry[1] -= 1
+            if not entry[1] and self._users.get(user_id) is entry:
+                del self._users[user_id]
+
+
+tool_runtime = ToolRuntime()
+
+
+def tool_node(tool: str, fn: Callable[[Any], Any], erro: str, **opcoes) -> Callable:
+    """
+    Nó async do grafo para uma ferramenta síncrona `fn(state) -> state`, executada pelo
+    tool_runtime. Qualquer falha vira a resposta "{erro}: {motivo}" do turno, igual para todas
+    as ferramentas. Cada tentativa roda numa cópia do estado: uma chamada que estourou o tempo
+    e segue na thread não mexe no estado que o grafo já levou adiante.
+    """
+    async def node(state: Any) -> Any:
+        def tentativa():
+            copia = dict(state)
+            copia["invocations_list"] = list(state.get("invocations_list", []))
+            copia["agenda"] = dict(state.get("agenda", {}))
+            copia["email"] = dict(state.get("email", {}))
+            return fn(copia)
+
+        try:
+            return await tool_runtime.run(tool, tentativa, user_id=state.get("user_id"), **opcoes)
+        except Exception as e:
+            resposta = f"{erro}: {e}"
+            state["invocation"] = resposta
+            state["invocations_list"].append(resposta)
+            return state
+    node.__name__ = getattr(fn, "__name__", "tool_node")
+    return node
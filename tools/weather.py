@@ -1,17 +1,137 @@
+import asyncio
 import os
+import time
+from typing import Dict, Optional
+
+import httpx
 import requests
 
-def obter_previsao_tempo_weatherapi(cidade="Feira de Santana", api_key=None):
+from .runtime import tool_runtime
+
+WEATHER_URL = "http://api.weatherapi.com/v1/current.json"
+WEATHER_CITY = os.environ.get("WEATHER_CITY", "Feira de Santana")
+WEATHER_TIMEOUT = float(os.environ.get("WEATHER_TIMEOUT", 3))
+
+
+def formatar_previsao(cidade, data):
+    temp = data['current']['temp_c']
+    condicao = data['current']['condition']['text']
+    return f"Previsão para {cidade}: {temp}°C, {condicao}."
+
+
+def obter_previsao_tempo_weatherapi(cidade=WEATHER_CITY, api_key=None):
     if api_key is None:
         api_key = os.environ.get("WEATHERAPI_KEY", "")
-    url = f"http://api.weatherapi.com/v1/current.json?key={api_key}&q={cidade}&lang=pt"
     try:
-        response = requests.get(url)
+        response = requests.get(WEATHER_URL, params={"key": api_key, "q": cidade, "lang": "pt"}, timeout=WEATHER_TIMEOUT)
         if response.status_code != 200:
             return f"Não foi possível obter a previsão do tempo para {cidade}."
-        data = response.json()
-        temp = data['current']['temp_c']
-        condicao = data['current']['condition']['text']
-        return f"Previsão para {cidade}: {temp}°C, {condicao}."
+        return formatar_previsao(cidade, response.json())
     except Exception as e:
-        return f"Erro ao obter previsão do tempo: {e}" 
\ No newline at end of file
+        return f"Erro ao obter previsão do tempo: {e}"
+
+
+class WeatherProvider:
+    """
+    Previsão do tempo assíncrona, com cache por cidade compartilhado entre as sessões.
+
+    Uma previsão com menos de `ttl` segundos é devolvida direto do cache. Entre `ttl` e
+    `stale_ttl` ela ainda é devolvida na hora, e uma atualização roda em background
+    (stale-while-revalidate). Pedidos simultâneos para a mesma cidade esperam a mesma
+    chamada, e falhas ficam em cache por `error_ttl` segundos: uma rajada de sessões novas
+    custa no máximo uma chamada à WeatherAPI por cidade por intervalo.
+
+    Args:
+        ttl: Validade da previsão em segundos (padrão: WEATHER_CACHE_TTL ou 600)
+        stale_ttl: Até quando a previsão vencida ainda é mostrada (padrão: WEATHER_STALE_TTL ou 3600)
+        error_ttl: Tempo até tentar de novo após uma falha (padrão: WEATHER_ERROR_TTL ou 60)
+        timeout: Timeout da chamada em segundos (padrão: WEATHER_TIMEOUT ou 3)
+    """
+
+    def __init__(self, ttl: Optional[float] = None, stale_ttl: Optional[float] = None,
+                 error_ttl: Optional[float] = None, timeout: Optional[float] = None,
+                 api_key: Optional[str] = None):
+        self.ttl = ttl if ttl is not None else float(os.environ.get("WEATHER_CACHE_TTL", 600))
+        self.stale_ttl = stale_ttl if stale_ttl is not None else float(os.environ.get("WEATHER_STALE_TTL", 3600))
+        self.error_ttl = error_ttl if error_ttl is not None else float(os.environ.get("WEATHER_ERROR_TTL", 60))
+        self.timeout = timeout or WEATHER_TIMEOUT
+        self.api_key = api_key
+        # cidade -> (momento da consulta, texto, deu certo)
+        self._cache: Dict[str, tuple] = {}
+        #última atualização que falhou enquanto havia previsão boa em cache (não tenta de novo antes de error_ttl)
+        self._failed_at: Dict[str, float] = {}
+        self._pending: Dict[str, asyncio.Task] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop = None
+
+    def cached(self, cidade: str = WEATHER_CITY) -> Optional[str]:
+        """
+        Previsão que pode ser mostrada sem esperar a rede, ou None se for preciso consultar.
+        Se ela estiver vencida (mas dentro de stale_ttl), a atualização é agendada em background.
+        """
+        entry = self._cache.get(cidade)
+        if entry is None:
+            return None
+        fetched_at, texto, ok = entry
+        age = time.monotonic() - fetched_at
+        if ok and age < self.ttl or not ok and age < self.error_ttl:
+            return texto
+        if ok and age < self.stale_ttl:
+            if time.monotonic() - self._failed_at.get(cidade, float("-inf")) >= self.error_ttl:
+                self._refresh(cidade)
+            return texto
+        return None
+
+    async def previsao(self, cidade: str = WEATHER_CITY) -> str:
+        texto = self.cached(cidade)
+        if texto is not None:
+            return texto
+        return await asyncio.shield(self._refresh(cidade))
+
+    def _refresh(self, cidade: str) -> asyncio.Task:
+        task = self._pending.get(cidade)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._fetch(cidade))
+            self._pending[cidade] = task
+            task.add_done_callback(lambda _: self._pending.pop(cidade, None))
+        return task
+
+    async def _fetch(self, cidade: str) -> str:
+        api_key = self.api_key if self.api_key is not None else os.environ.get("WEATHERAPI_KEY", "")
+        previous = self._cache.get(cidade)
+        try:
+            #5xx e falhas de rede entram nas novas tentativas e no circuit breaker do tool_runtime
+            response = await tool_runtime.run("weather", self._request, cidade, api_key)
+            if response.status_code != 200:
+                texto, ok = f"Não foi possível obter a previsão do tempo para {cidade}.", False
+            else:
+                texto, ok = formatar_previsao(cidade, response.json()), True
+        except httpx.HTTPStatusError:
+            texto, ok = f"Não foi possível obter a previsão do tempo para {cidade}.", False
+        except Exception as e:
+            texto, ok = f"Erro ao obter previsão do tempo: {e}", False
+        if not ok and previous is not None and previous[2]:
+            # falhou a atualização: continua mostrando a última previsão boa enquanto ela não for velha demais
+            if time.monotonic() - previous[0] < self.stale_ttl:
+                print(f"[WEATHER] Falha ao atualizar {cidade}, mantendo a previsão anterior: {texto}")
+                self._failed_at[cidade] = time.monotonic()
+                return previous[1]
+        self._cache[cidade] = (time.monotonic(), texto, ok)
+        self._failed_at.pop(cidade, None)
+        return texto
+
+    async def _request(self, cidade: str, api_key: str) -> httpx.Response:
+        response = await self.client().get(WEATHER_URL, params={"key": api_key, "q": cidade, "lang": "pt"})
+        if response.status_code >= 500:
+            response.raise_for_status()
+        return response
+
+    def client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+            self._client_loop = loop
+        return self._client
+
+
+weather_provider = WeatherProvider()
@@ -1,29 +1,223 @@
-from urllib.parse import quote, urlparse, parse_qs, unquote
-import requests
-from bs4 import BeautifulSoup
+import asyncio
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional
+from urllib.parse import parse_qs, unquote, urlparse
+
+import httpx
+import lxml.html
+
 from graph.state_types import IcarusState
+from .runtime import tool_runtime
 
-def buscar_na_web_duckduckgo(state: IcarusState) -> IcarusState:
-    query = state["user_input"]  
-    url = f"https://duckduckgo.com/html/?q={quote(query)}"
-    headers = {"User-Agent": "Mozilla/5.0"}
-    try:
-        response = requests.get(url, headers=headers, timeout=5)
-        if response.status_code != 200:
-            resultado = "Não foi possível buscar na web."
+#endereço configurável: permite apontar a busca para um servidor local de teste
+SEARCH_URL = os.environ.get("WEBSEARCH_URL", "https://duckduckgo.com/html/")
+HEADERS = {"User-Agent": "Mozilla/5.0"}
+
+_RESULT_LINKS = '//a[contains(concat(" ", normalize-space(@class), " "), " result__a ")]'
+_RESULT_SNIPPET = ('ancestor::div[contains(concat(" ", normalize-space(@class), " "), " result ")][1]'
+                   '//*[contains(concat(" ", normalize-space(@class), " "), " result__snippet ")]')
+_NOT_CONTENT = "//script|//style|//noscript|//nav|//header|//footer|//aside|//form"
+
+
+class SearchResult(NamedTuple):
+    title: str
+    url: str
+    snippet: str = ""
+
+
+def normalize_query(query: str) -> str:
+    """Chave do cache: "Vai chover hoje?" e "vai  chover hoje" são a mesma busca."""
+    return " ".join(re.sub(r"[^\w\s-]", " ", query.lower()).split())
+
+
+def parse_results(html: str, limit: int) -> List[SearchResult]:
+    """Títulos, links (sem o redirecionamento do DuckDuckGo) e resumos da página de resultados."""
+    if not html.strip():
+        return []
+    doc = lxml.html.fromstring(html)
+    results = []
+    for a in doc.xpath(_RESULT_LINKS):
+        raw_link = a.get("href", "")
+        real_url = unquote(parse_qs(urlparse(raw_link).query).get("uddg", [raw_link])[0])
+        snippet = a.xpath(_RESULT_SNIPPET)
+        results.append(SearchResult(
+            " ".join(a.text_content().split()),
+            real_url,
+            " ".join(snippet[0].text_content().split()) if snippet else "",
+        ))
+        if len(results) >= limit:
+            break
+    return results
+
+
+def extract_text(html: str, max_chars: int) -> str:
+    """Texto legível da página: parágrafos do conteúdo, sem menus, scripts e rodapés."""
+    if not html.strip():
+        return ""
+    doc = lxml.html.fromstring(html)
+    for element in doc.xpath(_NOT_CONTENT):
+        element.drop_tree()
+    paragraphs = [" ".join(p.text_content().split()) for p in doc.xpath("//p")]
+    text = " ".join(p for p in paragraphs if len(p) >= 40) or " ".join(doc.text_content().split())
+    if len(text) > max_chars:
+        text = text[:max_chars].rsplit(" ", 1)[0] + "…"
+    return text
+
+
+class WebSearch:
+    """
+    Busca na web assíncrona com conexões reaproveitadas e cache.
+
+    Um único httpx.AsyncClient (pool de conexões) atende todas as sessões; resultados ficam
+    em cache por `cache_ttl` segundos, pela consulta normalizada, e buscas iguais ao mesmo
+    tempo compartilham a mesma requisição. Com `fetch_pages`, as primeiras páginas dos
+    resultados são baixadas em paralelo e o texto delas substitui o resumo da busca; o que
+    não chegar em `fetch_budget` segundos fica com o resumo original.
+
+    Args:
+        search_url: Página de resultados em HTML (padrão: WEBSEARCH_URL ou DuckDuckGo)
+        max_results: Resultados por busca (padrão: WEBSEARCH_MAX_RESULTS ou 3)
+        timeout: Timeout da busca em segundos (padrão: WEBSEARCH_TIMEOUT ou 5)
+        cache_ttl: Validade do cache em segundos (padrão: WEBSEARCH_CACHE_TTL ou 600)
+        cache_size: Consultas guardadas no cache (padrão: WEBSEARCH_CACHE_SIZE ou 256)
+        fetch_pages: Páginas baixadas por busca; 0 desliga (padrão: WEBSEARCH_FETCH_PAGES ou 0)
+        fetch_budget: Tempo máximo do download das páginas (padrão: WEBSEARCH_FETCH_BUDGET ou 2)
+        snippet_chars: Tamanho máximo do texto extraído (padrão: WEBSEARCH_SNIPPET_CHARS ou 300)
+        max_connections: Conexões simultâneas do pool (padrão: WEBSEARCH_MAX_CONNECTIONS ou 20)
+    """
+
+    #páginas maiores que isso são cortadas: o texto útil costuma estar no começo
+    MAX_PAGE_BYTES = 512 * 1024
+
+    def __init__(self, search_url: Optional[str] = None, max_results: Optional[int] = None,
+                 timeout: Optional[float] = None, cache_ttl: Optional[float] = None,
+                 cache_size: Optional[int] = None, fetch_pages: Optional[int] = None,
+                 fetch_budget: Optional[float] = None, snippet_chars: Optional[int] = None,
+                 max_connections: Optional[int] = None):
+        self.search_url = search_url or SEARCH_URL
+        self.max_results = max_results or int(os.environ.get("WEBSEARCH_MAX_RESULTS", 3))
+        self.timeout = timeout or float(os.environ.get("WEBSEARCH_TIMEOUT", 5))
+        self.cache_ttl = cache_ttl if cache_ttl is not None else float(os.environ.get("WEBSEARCH_CACHE_TTL", 600))
+        self.cache_size = cache_size or int(os.environ.get("WEBSEARCH_CACHE_SIZE", 256))
+        self.fetch_pages = fetch_pages if fetch_pages is not None else int(os.environ.get("WEBSEARCH_FETCH_PAGES", 0))
+        self.fetch_budget = fetch_budget or float(os.environ.get("WEBSEARCH_FETCH_BUDGET", 2))
+        self.snippet_chars = snippet_chars or int(os.environ.get("WEBSEARCH_SNIPPET_CHARS", 300))
+        self.max_connections = max_connections or int(os.environ.get("WEBSEARCH_MAX_CONNECTIONS", 20))
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop = None
+
+    def client(self) -> httpx.AsyncClient:
+        # o cliente pertence ao event loop em que foi criado (scripts com asyncio.run criam outro)
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(
+                headers=HEADERS,
+                timeout=self.timeout,
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections // 2),
+            )
+            self._client_loop = loop
+        return self._client
+
+    async def search(self, query: str) -> List[SearchResult]:
+        key = normalize_query(query)
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            self._cache.move_to_end(key)
+            return cached[1]
+        pending = self._pending.get(key)
+        if pending is not None:
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                #quem fazia a busca foi cancelado (ex.: timeout do tool_runtime): esta chamada assume
+                if not pending.cancelled():
+                    raise
+                return await self.search(query)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            results = await self._search(query)
+            if self.fetch_pages:
+                results = await self.fetch_snippets(results)
+        except asyncio.CancelledError:
+            #quem esperava por esta busca não pode ficar preso num future que nunca termina
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # evita "exception was never retrieved" quando ninguém mais esperava esta busca
+            future.exception()
+            raise
         else:
-            soup = BeautifulSoup(response.text, "html.parser")
-            results = []
-            for a in soup.select('.result__a'):
-                raw_link = a['href']
-                parsed = urlparse(raw_link)
-                real_url = parse_qs(parsed.query).get("uddg", [raw_link])[0]
-                real_url = unquote(real_url)
-                title = a.get_text()
-                results.append(f"{title}\n{real_url}")
-                if len(results) >= 3:
+            future.set_result(results)
+            #erros não entram no cache: a próxima mensagem tenta de novo
+            self._cache[key] = (time.monotonic() + self.cache_ttl, results)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return results
+        finally:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+
+    async def _search(self, query: str) -> List[SearchResult]:
+        response = await self.client().get(self.search_url, params={"q": query})
+        response.raise_for_status()
+        return parse_results(response.text, self.max_results)
+
+    async def fetch_snippets(self, results: List[SearchResult]) -> List[SearchResult]:
+        """Baixa as primeiras páginas em paralelo e troca o resumo pelo texto delas, dentro de fetch_budget."""
+        tasks = [asyncio.ensure_future(self._fetch_text(r.url)) for r in results[:self.fetch_pages]]
+        if not tasks:
+            return results
+        done, pending = await asyncio.wait(tasks, timeout=self.fetch_budget)
+        for task in pending:
+            task.cancel()
+        enriched = list(results)
+        for i, task in enumerate(tasks):
+            if task in done and not task.cancelled() and task.exception() is None and task.result():
+                enriched[i] = enriched[i]._replace(snippet=task.result())
+        return enriched
+
+    async def _fetch_text(self, url: str) -> str:
+        async with self.client().stream("GET", url, timeout=self.fetch_budget) as response:
+            if response.status_code != 200 or "html" not in response.headers.get("content-type", ""):
+                return ""
+            body = bytearray()
+            async for chunk in response.aiter_bytes():
+                body.extend(chunk)
+                if len(body) >= self.MAX_PAGE_BYTES:
                     break
-            resultado = "\n\n".join(results) if results else "Nenhum resultado encontrado."
+        text = body.decode(response.encoding or "utf-8", errors="replace")
+        return extract_text(text, self.snippet_chars)
+
+    def clear_cache(self):
+        self._cache.clear()
+
+
+web_search = WebSearch()
+
+
+def format_results(results: List[SearchResult]) -> str:
+    if not results:
+        return "Nenhum resultado encontrado."
+    return "\n\n".join(f"{r.title}\n{r.url}" + (f"\n{r.snippet}" if r.snippet else "") for r in results)
+
+
+async def buscar_na_web_duckduckgo(state: IcarusState) -> IcarusState:
+    query = state["user_input"]
+    try:
+        resultado = format_results(await tool_runtime.run("websearch", web_search.search, query,
+                                                          user_id=state.get("user_id")))
+    except httpx.HTTPStatusError:
+        resultado = "Não foi possível buscar na web."
     except Exception as e:
         resultado = f"Erro ao buscar: {e}"
     state['invocation'] = resultado
@@ -32,4 +226,4 @@ def buscar_na_web_duckduckgo(state: IcarusState) -> IcarusState:
         "query": query,
         "search_results": resultado
     }
-    return state 
\ No newline at end of file
+    return state
@@ -1,9 +1,19 @@
-from .llm_utils import llm_ask
+from .date_parser import parse_period
+from .history import conversation_history
+from .response_cache import response_cache
 from datetime import datetime, timedelta
+import os
 import re
+import time
 
-def substituir_datas_naturais(texto):
-    hoje = datetime.now()
+#DATE_PARSER=off manda toda extração de datas para o LLM, como antes
+DATE_PARSER_ENABLED = os.environ.get("DATE_PARSER", "on").lower() != "off"
+#campos de state['agenda'] preenchidos pela extração (e o início derivado pelo agendar_node);
+#com a sessão persistida, os de um pedido anterior não podem sobrar para o próximo
+CAMPOS_PERIODO = ("data_inicial", "data_final", "duracao_minutos", "data_hora_inicio_str")
+
+def substituir_datas_naturais(texto, hoje=None):
+    hoje = hoje or datetime.now()
     substituicoes = {
         r'\bhoje\b': hoje.strftime('%Y-%m-%d'),
         r'\bamanhã\b': (hoje + timedelta(days=1)).strftime('%Y-%m-%d'),
@@ -14,13 +24,43 @@ def substituir_datas_naturais(texto):
         texto = re.sub(padrao, valor, texto, flags=re.IGNORECASE)
     return texto
 
-async def extrair_datas_periodo_llm(state):
+def preencher_periodo(state, datas):
+    agenda = {k: v for k, v in state.get('agenda', {}).items() if k not in CAMPOS_PERIODO}
+    agenda.update({k: datas[k] for k in CAMPOS_PERIODO if k in datas})
+    state['agenda'] = agenda
+    return state
+
+async def extrair_datas_periodo(state):
+    """
+    Preenche data_inicial/data_final (e a duração, se dita) em state['agenda'].
+    Tenta o interpretador local (utils.date_parser); o LLM só é chamado quando ele não entende o texto.
+    """
+    if DATE_PARSER_ENABLED:
+        inicio = time.perf_counter()
+        periodo = parse_period(state['user_input'])
+        if periodo is not None:
+            print(f"[DATAS] Interpretado localmente em {(time.perf_counter() - inicio) * 1000:.2f} ms: {periodo.to_agenda()}")
+            return preencher_periodo(state, periodo.to_agenda())
+    return await extrair_datas_periodo_llm(state)
+
+async def extrair_datas_periodo_llm(state, agora=None):
     """
     Usa o LLM para extrair datas de início e fim do texto do usuário e preenche no estado.
     Não altera state['user_input'] nem outros campos além de agenda.
     """
-    texto_processado = substituir_datas_naturais(state['user_input'])
-    ano_atual = datetime.now().year
+    from .llm_utils import llm_ask  # só aqui: o interpretador local não precisa carregar o LLM
+
+    agora = agora or datetime.now()
+    #"amanhã", "sexta" dependem do dia, e "e no dia seguinte?" da conversa: a chave do cache inclui
+    #a data de hoje e o histórico que entra no prompt
+    contexto = conversation_history.prompt_context(state.get('messages', []), state.get('history_summary'))
+    chave_cache = response_cache.key("datas", state['user_input'], agora.date(), contexto=contexto)
+    datas = response_cache.get(chave_cache)
+    if datas is not None:
+        print(f"[DATAS] Em cache: {datas}")
+        return preencher_periodo(state, datas)
+    texto_processado = substituir_datas_naturais(state['user_input'], agora)
+    ano_atual = agora.year
     prompt = f'''
 Extraia do texto abaixo as datas de início e fim (se houver) para um período de eventos. Responda em JSON com as chaves:
 - data_inicial (formato ISO 8601, ex: 2025-07-15T00:00:00)
@@ -39,21 +79,21 @@ Resposta: {{"data_inicial": "2025-07-13T00:00:00", "data_final": "2025-07-18T23:
 
 Texto: {{texto}}
 '''.replace('{texto}', texto_processado)
-    raw = await llm_ask(prompt, state.get('messages', []))
+    raw = await llm_ask(prompt, state.get('messages', []), summary=state.get('history_summary'), purpose="extraction")
     # Extrai JSON da resposta
     match = re.search(r'(\{[\s\S]*?\})', raw)
     if match:
         import json
         try:
             datas = json.loads(match.group(1))
-            agenda = state.get('agenda', {}).copy()
+            preencher_periodo(state, datas)
             if 'data_inicial' in datas:
-                agenda['data_inicial'] = datas['data_inicial']
-            if 'data_final' in datas:
-                agenda['data_final'] = datas['data_final']
-            state['agenda'] = agenda
+                response_cache.put(chave_cache, datas)
         except Exception as e:
             print(f'[DEBUG] Erro ao extrair datas do LLM: {e}')
+            preencher_periodo(state, {})
     else:
         print('[DEBUG] LLM não retornou JSON de datas.')
+        #sem datas novas, as do pedido anterior também não valem
+        preencher_periodo(state, {})
     return state 
\ No newline at end of file
@@ -0,0 +1,304 @@
+"""
+Interpretação local de datas e períodos em português ("amanhã às 15h", "de segunda a sexta",
+"próxima semana", "dia 20 das 14h às 16h").
+
+Só responde quando entende a frase inteira: se sobrar alguma palavra de tempo que nenhuma
+regra consumiu ("antes do almoço", "no último dia útil"), devolve None e quem chamou usa o
+LLM. Anos omitidos são o ano atual, como no prompt do LLM.
+"""
+import calendar
+import re
+import unicodedata
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+WEEKDAYS = {"segunda": 0, "terca": 1, "quarta": 2, "quinta": 3, "sexta": 4, "sabado": 5, "domingo": 6}
+MONTHS = {name: i + 1 for i, name in enumerate((
+    "janeiro", "fevereiro", "marco", "abril", "maio", "junho",
+    "julho", "agosto", "setembro", "outubro", "novembro", "dezembro",
+))}
+NUMBERS = {"um": 1, "uma": 1, "dois": 2, "duas": 2, "tres": 3, "quatro": 4, "cinco": 5,
+           "seis": 6, "sete": 7, "oito": 8, "nove": 9, "dez": 10, "quinze": 15, "trinta": 30}
+DAY_PARTS = {"madrugada": (0, 6), "manha": (6, 12), "tarde": (12, 18), "noite": (18, 24)}
+
+_WEEKDAY = r"(segunda|terca|quarta|quinta|sexta|sabado|domingo)(?:[- ]feira)?"
+_MONTH = r"(" + "|".join(MONTHS) + r")"
+_NUMBER = r"(\d+|" + "|".join(NUMBERS) + r")"
+
+# palavras de tempo que, se sobrarem depois das regras, mandam a frase para o LLM
+_LEFTOVER = re.compile(
+    r"\d|\b(" + "|".join(WEEKDAYS) + "|" + "|".join(MONTHS) + r"|semanas?|mes|meses|anos?|dias?|horas?|"
+    r"minutos?|madrugada|manha|tarde|noite|hoje|amanha|ontem|anteontem|proxim\w*|passad\w*|ultim\w*|"
+    r"daqui|depois|antes|cedo|meio|meia|feriado|util)\b"
+)
+_RANGE_CONNECTOR = re.compile(r"^\s*(a|ao|ate|e|-)\s*(o|a)?\s*$")
+
+
+class Period(NamedTuple):
+    """Resultado da interpretação: início, fim (opcional) e duração explícita em minutos (opcional)."""
+    inicio: datetime
+    fim: Optional[datetime] = None
+    duracao_minutos: Optional[int] = None
+
+    def to_agenda(self) -> Dict:
+        """Campos no formato de state['agenda'] (os mesmos que o LLM devolve)."""
+        agenda = {"data_inicial": self.inicio.isoformat()}
+        if self.fim is not None:
+            agenda["data_final"] = self.fim.isoformat()
+        if self.duracao_minutos is not None:
+            agenda["duracao_minutos"] = self.duracao_minutos
+        return agenda
+
+
+class _Days(NamedTuple):
+    start: date
+    end: date
+    weekday: Optional[int] = None  # dia da semana citado ("sexta"), para fechar intervalos
+    span: bool = False  # período por natureza ("esta semana"), mesmo que caia num dia só
+
+
+def normalize(texto: str) -> str:
+    """Minúsculas e sem acentos, para as regras não precisarem de variantes."""
+    sem_acento = unicodedata.normalize("NFD", texto)
+    return "".join(c for c in sem_acento if unicodedata.category(c) != "Mn").lower()
+
+
+def _number(value: str) -> int:
+    return int(value) if value.isdigit() else NUMBERS[value]
+
+
+def _month_days(year: int, month: int) -> _Days:
+    return _Days(date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1]), span=True)
+
+
+def _shift_month(day: date, months: int) -> Tuple[int, int]:
+    index = day.year * 12 + day.month - 1 + months
+    return index // 12, index % 12 + 1
+
+
+def _weekday(today: date, weekday: int, modifier: str) -> _Days:
+    if modifier == "passada":
+        delta = -((today.weekday() - weekday) % 7 or 7)
+    elif modifier == "proxima":
+        delta = (weekday - today.weekday()) % 7 or 7
+    else:
+        delta = (weekday - today.weekday()) % 7
+    day = today + timedelta(days=delta)
+    return _Days(day, day, weekday)
+
+
+def _date_rules(today: date):
+    """(regex, função) na ordem de prioridade; cada função devolve um _Days."""
+    monday = today - timedelta(days=today.weekday())
+
+    def day(d):
+        return _Days(d, d)
+
+    def safe_date(year, month, dia):
+        try:
+            return day(date(year, month, dia))
+        except ValueError:
+            return None
+
+    def month_range(m):
+        year, month = int(m[4] or today.year), MONTHS[m[3]]
+        start, end = date(year, month, int(m[1])), date(year, month, int(m[2]))
+        # "de 10 a 5 de julho": intervalo invertido, fica com o LLM
+        return _Days(start, end, span=True) if end >= start else None
+
+    def weekend(m):
+        modifier = m[1] or m[2]
+        saturday = today + timedelta(days=(5 - today.weekday()) % 7)
+        if modifier in ("proximo", "que vem") and today.weekday() < 5:
+            saturday += timedelta(days=7)
+        if today.weekday() == 6 and modifier in (None, "este", "esse", "neste", "nesse"):
+            return _Days(today, today, span=True)
+        return _Days(saturday, saturday + timedelta(days=1), span=True)
+
+    return (
+        (r"\b(\d{4})-(\d{2})-(\d{2})\b",
+         lambda m: safe_date(int(m[1]), int(m[2]), int(m[3]))),
+        (r"\b(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\b",
+         lambda m: safe_date(int(m[3]) + (2000 if len(m[3]) == 2 else 0) if m[3] else today.year, int(m[2]), int(m[1]))),
+        (r"\b(?:d?e|entre(?: os dias)?|dos dias)\s+(\d{1,2})\s+(?:a|ao|ate|e)\s+(\d{1,2})\s+de\s+" + _MONTH + r"(?:\s+de\s+(\d{4}))?\b",
+         month_range),
+        (r"\b(?:dia\s+)?(\d{1,2})\s+de\s+" + _MONTH + r"(?:\s+de\s+(\d{4}))?\b",
+         lambda m: safe_date(int(m[3] or today.year), MONTHS[m[2]], int(m[1]))),
+        (r"\bdia\s+(\d{1,2})\b", lambda m: safe_date(today.year, today.month, int(m[1]))),
+        (r"\bdepois de amanha\b", lambda m: day(today + timedelta(days=2))),
+        (r"\banteontem\b", lambda m: day(today - timedelta(days=2))),
+        (r"\bamanha\b", lambda m: day(today + timedelta(days=1))),
+        (r"\bhoje\b", lambda m: day(today)),
+        (r"\bontem\b", lambda m: day(today - timedelta(days=1))),
+        (r"\b(?:daqui a|em|dentro de)\s+" + _NUMBER + r"\s+(dias?|semanas?)\b",
+         lambda m: day(today + timedelta(days=_number(m[1]) * (7 if m[2].startswith("semana") else 1)))),
+        (r"\b(?:nos\s+)?proximos\s+" + _NUMBER + r"\s+dias\b",
+         lambda m: _Days(today, today + timedelta(days=_number(m[1])), span=True)),
+        (r"\b(?:n?esta|n?essa|dessa|desta)\s+semana\b|\bsemana atual\b",
+         lambda m: _Days(today, monday + timedelta(days=6), span=True)),
+        (r"\b(?:(?:n?a|da)\s+)?proxima\s+semana\b|\bsemana que vem\b",
+         lambda m: _Days(monday + timedelta(days=7), monday + timedelta(days=13), span=True)),
+        (r"\b(?:n?a|da)?\s*semana passada\b",
+         lambda m: _Days(monday - timedelta(days=7), monday - timedelta(days=1), span=True)),
+        (r"\b(?:(proximo|este|esse|neste|nesse)\s+)?(?:fim|final) de semana(?:\s+(que vem))?\b",
+         weekend),
+        (r"\b(?:n?este|n?esse|deste|desse)\s+mes\b|\bmes atual\b",
+         lambda m: _month_days(today.year, today.month)),
+        (r"\b(?:(?:n?o|do)\s+)?proximo\s+mes\b|\bmes que vem\b",
+         lambda m: _month_days(*_shift_month(today, 1))),
+        (r"\b(?:(?:n?o|do)\s+)?mes passado\b",
+         lambda m: _month_days(*_shift_month(today, -1))),
+        (r"\b" + _MONTH + r"(?:\s+de\s+(\d{4}))?\b",
+         lambda m: _month_days(int(m[2] or today.year), MONTHS[m[1]])),
+        (r"\b(?:(proxim[oa])\s+)?" + _WEEKDAY + r"(?:\s+(que vem|passad[oa]))?\b",
+         lambda m: _weekday(today, WEEKDAYS[m[2]],
+                            "proxima" if m[1] or m[3] == "que vem" else "passada" if m[3] else "")),
+    )
+
+
+def _time_rules():
+    """(regex, função) de horários; cada função devolve (hora, minuto)."""
+    def with_part(hour, minute, part):
+        if part in ("tarde", "noite") and hour < 12:
+            hour += 12
+        return hour, minute
+
+    return (
+        (r"\b(?:(?:a partir )?(?:d?as|a|ao|ate as)\s+)?(\d{1,2})(?:[:h](\d{2}))?h?\s+(?:horas\s+)?da\s+(manha|tarde|noite|madrugada)\b",
+         lambda m: with_part(int(m[1]), int(m[2] or 0), m[3])),
+        (r"\b(?:(?:a partir )?(?:d?o|d?as|a|ao|ate o)\s+)?meio[- ]dia(?: e meia)?\b",
+         lambda m: (12, 30 if m[0].endswith("meia") else 0)),
+        (r"\b(?:(?:a partir )?(?:d?a|d?as|ate a)\s+)?meia[- ]noite\b", lambda m: (0, 0)),
+        (r"\b(?:(?:a partir )?(?:d?as|a|ao|ate as)\s+)?(\d{1,2})(?:h(\d{2})?|:(\d{2})(?::\d{2})?)(?:min)?\b",
+         lambda m: (int(m[1]), int(m[2] or m[3] or 0))),
+    )
+
+
+# hora sem "h" nem ":" ("às 3", "às 8 horas"): de 1 a 11 pode ser manhã ou tarde, só vale com "de manhã/à tarde"
+_BARE_HOUR = re.compile(r"\b(?:a partir )?(?:d?as|ate as)\s+(\d{1,2})(?:\s+horas?)?\b")
+
+
+_DURATION = re.compile(
+    r"\b(?:por|durante|com duracao de)\s+(\d+|" + "|".join(NUMBERS) + r"|meia)\s*(h|horas?|min|minutos?)"
+    r"(?:\s*(e meia)|\s*(\d{1,2})(?:\s*min(?:utos)?)?)?\b"
+)
+_DAY_PART = re.compile(r"\b(?:de|pela|a|na|durante a)\s+(madrugada|manha|tarde|noite)\b")
+
+
+def _consume(pattern, text: str, handler, found: List[Tuple[int, int, object]]) -> str:
+    """Aplica a regra, anota (posição, fim, valor) e apaga o trecho do texto (mantendo as posições)."""
+    def replace(m):
+        try:
+            value = handler(m)
+        except ValueError:
+            # data inexistente ("31 de fevereiro"): o trecho fica, e a sobra manda para o LLM
+            return m[0]
+        if value is None:
+            return m[0]
+        found.append((m.start(), m.end(), value))
+        return " " * len(m[0])
+    return re.sub(pattern, replace, text)
+
+
+def parse_period(texto: str, agora: Optional[datetime] = None) -> Optional[Period]:
+    """
+    Interpreta a data/período de uma mensagem.
+
+    Um dia sem horário vira só o início (00:00), como nos exemplos do LLM; períodos
+    ("esta semana", "de segunda a sexta") vão da meia-noite do primeiro dia às 23:59:59
+    do último; horários ("às 15h", "das 14h às 16h", "à tarde") ficam no início/fim.
+    Devolve None quando não entende tudo.
+    """
+    agora = agora or datetime.now()
+    today = agora.date()
+    text = re.sub(r"\bbo[am] (dia|tarde|noite)\b", " ", normalize(texto))
+    # ISO com horário (2025-07-14T15:00:00): data e hora viram dois trechos
+    text = re.sub(r"\b(\d{4}-\d{2}-\d{2})t(?=\d)", r"\1 ", text)
+
+    durations, dates, times, parts = [], [], [], []
+    def duration(m):
+        amount = 0.5 if m[1] == "meia" else _number(m[1])
+        minutes = amount * 60 if m[2].startswith("h") else amount
+        if m[3]:
+            minutes += 30
+        elif m[4]:
+            minutes += int(m[4])
+        return int(minutes)
+    text = _consume(_DURATION, text, duration, durations)
+    for pattern, handler in _date_rules(today):
+        text = _consume(pattern, text, handler, dates)
+    for pattern, handler in _time_rules():
+        text = _consume(pattern, text, handler, times)
+    bare = []
+    text = _consume(_BARE_HOUR, text, lambda m: (int(m[1]), 0), bare)
+    text = _consume(_DAY_PART, text, lambda m: DAY_PARTS[m[1]], parts)
+
+    if _LEFTOVER.search(text) or len(durations) > 1 or len(parts) > 1:
+        return None
+    if not parts and any(1 <= h <= 11 for _, _, (h, m) in bare):
+        return None
+    times += bare
+    if any(not (0 <= h < 24 and 0 <= m < 60) for _, _, (h, m) in times):
+        return None
+
+    dates.sort(key=lambda item: item[0])
+    times.sort(key=lambda item: item[0])
+    if not dates:
+        if not times and not parts:
+            return None
+        days = _Days(today, today)
+    elif len(dates) == 1:
+        days = dates[0][2]
+    elif len(dates) == 2 and _RANGE_CONNECTOR.match(text[dates[0][1]:dates[1][0]]):
+        first, last = dates[0][2], dates[1][2]
+        end = last.end
+        if end < first.start and last.weekday is not None:
+            end += timedelta(days=7 * ((first.start - end).days // 7 + 1))
+        if end < first.start:
+            return None
+        days = _Days(first.start, end, span=True)
+    else:
+        return None
+
+    duracao = durations[0][2] if durations else None
+    hours = [value for _, _, value in times]
+    period = _build_period(days, hours, parts[0][2] if parts else None, duracao)
+    if period is not None and not dates and hours and period.inicio < agora:
+        # "marcar às 8h" às 10h, sem dia: hoje já passou, e se é amanhã ou 20h quem decide é o LLM
+        return None
+    return period
+
+
+def _build_period(days: _Days, hours: List[Tuple[int, int]], part: Optional[Tuple[int, int]],
+                  duracao: Optional[int]) -> Optional[Period]:
+    single_day = days.start == days.end
+    if part:
+        part_start, part_end = part
+        if not single_day or len(hours) > 1:
+            return None
+        if hours:
+            # "amanhã de manhã às 9", "à noite às 8"
+            hour, minute = hours[0]
+            if part_start >= 12 and hour < 12:
+                hour += 12
+            return Period(datetime.combine(days.start, time(hour, minute)), None, duracao)
+        fim = datetime.combine(days.start, time(23, 59, 59)) if part_end == 24 else datetime.combine(days.start, time(part_end))
+        return Period(datetime.combine(days.start, time(part_start)), fim, duracao)
+
+    if not hours:
+        inicio = datetime.combine(days.start, time())
+        fim = datetime.combine(days.end, time(23, 59, 59)) if days.span or not single_day else None
+        return Period(inicio, fim, duracao)
+    if len(hours) == 1:
+        if not single_day:
+            return None
+        return Period(datetime.combine(days.start, time(*hours[0])), None, duracao)
+    if len(hours) == 2:
+        inicio = datetime.combine(days.start, time(*hours[0]))
+        fim = datetime.combine(days.end, time(*hours[1]))
+        if fim <= inicio:
+            return None
+        if single_day and duracao is None:
+            duracao = int((fim - inicio).total_seconds() // 60)
+        return Period(inicio, fim, duracao)
+    return None
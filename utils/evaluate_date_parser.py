@@ -0,0 +1,149 @@
+"""
+Avaliação offline do interpretador local de datas (ver date_parser) contra o LLM.
+
+Roda o interpretador sobre um conjunto rotulado, com a data de referência fixa (segunda,
+14/07/2025 às 10h), e mostra cobertura (quantas frases dispensam o LLM), acurácia e
+latência. Com --llm, manda as mesmas frases para extrair_datas_periodo_llm e compara:
+
+    python -m utils.evaluate_date_parser [--llm]
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.date_parser import parse_period
+
+REFERENCIA = datetime(2025, 7, 14, 10, 0)
+
+# (frase, (data_inicial, data_final)); None = o interpretador deve deixar com o LLM
+LABELED_PERIODS: List[Tuple[str, Optional[Tuple[str, Optional[str]]]]] = [
+    ("Quais meus compromissos hoje?", ("2025-07-14T00:00:00", None)),
+    ("Quais meus compromissos amanhã?", ("2025-07-15T00:00:00", None)),
+    ("O que tenho depois de amanhã?", ("2025-07-16T00:00:00", None)),
+    ("O que tive ontem?", ("2025-07-13T00:00:00", None)),
+    ("Mostre minha agenda de sexta", ("2025-07-18T00:00:00", None)),
+    ("O que tenho marcado para quarta-feira?", ("2025-07-16T00:00:00", None)),
+    ("Compromissos da segunda que vem", ("2025-07-21T00:00:00", None)),
+    ("O que tenho na próxima terça?", ("2025-07-15T00:00:00", None)),
+    ("O que fiz no sábado passado?", ("2025-07-12T00:00:00", None)),
+    ("Quais meus compromissos 2025-07-14?", ("2025-07-14T00:00:00", None)),
+    ("Agenda do dia 20", ("2025-07-20T00:00:00", None)),
+    ("Compromissos em 25/07", ("2025-07-25T00:00:00", None)),
+    ("O que tenho em 3 de agosto?", ("2025-08-03T00:00:00", None)),
+    ("Agenda de 10/08/2025", ("2025-08-10T00:00:00", None)),
+    ("Compromissos daqui a 3 dias", ("2025-07-17T00:00:00", None)),
+    ("Quais meus compromissos de segunda a sexta?", ("2025-07-14T00:00:00", "2025-07-18T23:59:59")),
+    ("Quais meus compromissos de 2025-07-13 até 2025-07-18?", ("2025-07-13T00:00:00", "2025-07-18T23:59:59")),
+    ("Eventos de hoje até sexta", ("2025-07-14T00:00:00", "2025-07-18T23:59:59")),
+    ("Eventos entre quinta e domingo", ("2025-07-17T00:00:00", "2025-07-20T23:59:59")),
+    ("Compromissos de 10 a 15 de agosto", ("2025-08-10T00:00:00", "2025-08-15T23:59:59")),
+    ("Agenda desta semana", ("2025-07-14T00:00:00", "2025-07-20T23:59:59")),
+    ("Agenda da próxima semana", ("2025-07-21T00:00:00", "2025-07-27T23:59:59")),
+    ("O que tenho na semana que vem?", ("2025-07-21T00:00:00", "2025-07-27T23:59:59")),
+    ("O que tive na semana passada?", ("2025-07-07T00:00:00", "2025-07-13T23:59:59")),
+    ("O que tenho no fim de semana?", ("2025-07-19T00:00:00", "2025-07-20T23:59:59")),
+    ("Compromissos deste mês", ("2025-07-01T00:00:00", "2025-07-31T23:59:59")),
+    ("Compromissos do mês que vem", ("2025-08-01T00:00:00", "2025-08-31T23:59:59")),
+    ("Agenda de setembro", ("2025-09-01T00:00:00", "2025-09-30T23:59:59")),
+    ("Compromissos nos próximos 3 dias", ("2025-07-14T00:00:00", "2025-07-17T23:59:59")),
+    ("Tenho algo hoje à tarde?", ("2025-07-14T12:00:00", "2025-07-14T18:00:00")),
+    ("Tenho algo amanhã de manhã?", ("2025-07-15T06:00:00", "2025-07-15T12:00:00")),
+    ("Agende uma reunião amanhã às 15h", ("2025-07-15T15:00:00", None)),
+    ("Marque médico para dia 20 às 8h", ("2025-07-20T08:00:00", None)),
+    ("Me lembre de ligar para a minha mãe hoje às 19h", ("2025-07-14T19:00:00", None)),
+    ("Crie um evento de aniversário no sábado às 20h", ("2025-07-19T20:00:00", None)),
+    ("Quero marcar academia amanhã às 7h", ("2025-07-15T07:00:00", None)),
+    ("Marque dentista na terça às 3 da tarde", ("2025-07-15T15:00:00", None)),
+    ("Agende call na sexta às 9h30", ("2025-07-18T09:30:00", None)),
+    ("Almoço com a Ana ao meio-dia de quinta", ("2025-07-17T12:00:00", None)),
+    ("Reunião na quarta das 14h às 16h", ("2025-07-16T14:00:00", "2025-07-16T16:00:00")),
+    ("Marque corrida amanhã às 6:30", ("2025-07-15T06:30:00", None)),
+    ("Agende revisão às 17h", ("2025-07-14T17:00:00", None)),
+    ("Reunião amanhã às 10h por 2 horas", ("2025-07-15T10:00:00", None)),
+    ("Agende o evento para 2025-07-20T15:00:00", ("2025-07-20T15:00:00", None)),
+    ("Quais meus compromissos?", None),
+    ("Marque algo antes do almoço de amanhã", None),
+    ("O que tenho no último dia útil do mês?", None),
+    ("Reunião no feriado de 7 de setembro", None),
+    ("Marque uma reunião depois do trabalho", None),
+    ("Quero ver agenda de 10 a 5 de julho", None),
+    ("Marque dentista amanhã às 3", None),
+    ("Marcar às 8", None),
+    ("Marcar às 8h", None),
+    ("Reunião das 2 às 4", None),
+    ("Marque dentista amanhã às 3 da tarde", ("2025-07-15T15:00:00", None)),
+    ("Reunião amanhã de manhã às 9", ("2025-07-15T09:00:00", None)),
+    ("Jantar sexta às 20 horas", ("2025-07-18T20:00:00", None)),
+]
+
+
+def _expected_agenda(expected: Tuple[str, Optional[str]]) -> Dict[str, str]:
+    inicio, fim = expected
+    return {"data_inicial": inicio, **({"data_final": fim} if fim else {})}
+
+
+def _same_period(agenda: Optional[Dict], expected: Tuple[str, Optional[str]]) -> bool:
+    if not agenda:
+        return False
+    got = {k: agenda[k] for k in ("data_inicial", "data_final") if k in agenda}
+    return got == _expected_agenda(expected)
+
+
+def evaluate_parser():
+    latencies, resultados = [], []
+    for texto, _ in LABELED_PERIODS:
+        start = time.perf_counter()
+        periodo = parse_period(texto, REFERENCIA)
+        latencies.append((time.perf_counter() - start) * 1000)
+        resultados.append(periodo.to_agenda() if periodo else None)
+
+    labeled = [(r, e) for r, (_, e) in zip(resultados, LABELED_PERIODS) if e is not None]
+    parsed = [(r, e) for r, e in labeled if r is not None]
+    hits = sum(1 for r, e in parsed if _same_period(r, e))
+    unsure = sum(1 for r, (_, e) in zip(resultados, LABELED_PERIODS) if e is None and r is None)
+    print(f"Frases: {len(LABELED_PERIODS)} ({len(labeled)} com resposta esperada)")
+    print(f"Interpretador: cobertura {len(parsed)}/{len(labeled)}, acurácia {hits}/{len(parsed)}, "
+          f"deixou com o LLM {unsure}/{len(LABELED_PERIODS) - len(labeled)} frases ambíguas")
+    print(f"Latência: p50 {np.percentile(latencies, 50):.3f} ms, p95 {np.percentile(latencies, 95):.3f} ms")
+    for resultado, (texto, esperado) in zip(resultados, LABELED_PERIODS):
+        if resultado is not None and (esperado is None or not _same_period(resultado, esperado)):
+            print(f"  {texto!r}: {resultado}, esperado {esperado}")
+    return resultados
+
+
+async def evaluate_llm():
+    from utils.date_extractor import extrair_datas_periodo_llm
+
+    latencies, hits, total = [], 0, 0
+    for texto, esperado in LABELED_PERIODS:
+        if esperado is None:
+            continue
+        state = {"user_input": texto, "messages": [], "agenda": {}}
+        start = time.perf_counter()
+        state = await extrair_datas_periodo_llm(state, agora=REFERENCIA)
+        latencies.append((time.perf_counter() - start) * 1000)
+        total += 1
+        if _same_period(state.get("agenda"), esperado):
+            hits += 1
+        else:
+            print(f"  LLM {texto!r}: {state.get('agenda')}, esperado {_expected_agenda(esperado)}")
+    print(f"LLM: acurácia {hits}/{total}, latência p50 {np.percentile(latencies, 50):.0f} ms, "
+          f"p95 {np.percentile(latencies, 95):.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Avalia o interpretador local de datas.")
+    parser.add_argument("--llm", action="store_true", help="Compara com extrair_datas_periodo_llm (chama o endpoint)")
+    args = parser.parse_args()
+    evaluate_parser()
+    if args.llm:
+        print()
+        asyncio.run(evaluate_llm())
+
+
+if __name__ == "__main__":
+    main()
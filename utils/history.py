@@ -0,0 +1,154 @@
+import os
+from typing import Any, Dict, List, Optional
+
+Message = Dict[str, Any]
+
+ROLE_LABELS = {"user": "Usuário", "assistant": "Assistente"}
+
+SUMMARY_PROMPT = """Atualize o resumo de uma conversa entre o usuário e o assistente Icarus incluindo os novos trechos.
+Mantenha fatos sobre o usuário, pedidos feitos e o que foi respondido (nomes, datas, compromissos, e-mails).
+Responda apenas com o resumo atualizado, em português, com no máximo {palavras} palavras.
+
+Resumo atual:
+{resumo}
+
+Novos trechos:
+{trechos}
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    #aproximação barata (~4 caracteres por token em português), sem carregar o tokenizer do modelo
+    return len(text) // 4 + 1
+
+
+def split_turns(messages: List[Message]) -> List[List[Message]]:
+    """Agrupa as mensagens em turnos: cada mensagem do usuário e as respostas que vieram depois dela."""
+    turns: List[List[Message]] = []
+    for message in messages:
+        if message["role"] == "user" or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def format_messages(messages: List[Message]) -> str:
+    return "".join(f"{ROLE_LABELS.get(m['role'], m['role'])}: {m['content']}\n" for m in messages)
+
+
+class ConversationHistory:
+    """
+    Histórico de conversa com orçamento de tokens.
+
+    O prompt leva o resumo da conversa (state["history_summary"]) e só os últimos
+    `recent_turns` turnos na íntegra, cortados para caber em `token_budget`; o custo de
+    montar o prompt não cresce com a conversa. Depois de cada resposta, `compact` tira de
+    state["messages"] os turnos mais antigos e os incorpora ao resumo (pelo LLM, ou
+    recortando os trechos se ele falhar ou com HISTORY_SUMMARIZER=extract); o app roda a
+    compactação em background e só espera por ela se a próxima mensagem chegar antes.
+
+    Args:
+        recent_turns: Turnos mantidos na íntegra (padrão: HISTORY_RECENT_TURNS ou 3)
+        token_budget: Tokens do histórico no prompt, resumo incluído (padrão: HISTORY_TOKEN_BUDGET ou 600)
+        summary_tokens: Tamanho máximo do resumo (padrão: HISTORY_SUMMARY_TOKENS ou 200)
+        summarizer: "llm" ou "extract" (padrão: HISTORY_SUMMARIZER ou "llm")
+    """
+
+    def __init__(self, recent_turns: Optional[int] = None, token_budget: Optional[int] = None,
+                 summary_tokens: Optional[int] = None, summarizer: Optional[str] = None):
+        self.recent_turns = recent_turns or int(os.environ.get("HISTORY_RECENT_TURNS", 3))
+        self.token_budget = token_budget or int(os.environ.get("HISTORY_TOKEN_BUDGET", 600))
+        self.summary_tokens = summary_tokens or int(os.environ.get("HISTORY_SUMMARY_TOKENS", 200))
+        self.summarizer = (summarizer or os.environ.get("HISTORY_SUMMARIZER", "llm")).lower()
+
+    def prompt_context(self, messages: Optional[List[Message]], summary: Optional[str] = None) -> str:
+        """Texto do histórico para o prompt: resumo + últimos turnos, dentro de token_budget."""
+        parts = []
+        budget = self.token_budget
+        if summary:
+            summary = self._clip_start(summary, self.summary_tokens)
+            parts.append(f"Resumo da conversa até aqui: {summary}\n")
+            budget -= estimate_tokens(parts[0])
+        recent = [m for turn in split_turns(messages or [])[-self.recent_turns:] for m in turn]
+        lines = [format_messages([m]) for m in recent]
+        # sem espaço para tudo: saem as mensagens mais antigas; a mais recente é cortada se sozinha não couber
+        while lines and sum(estimate_tokens(line) for line in lines) > budget:
+            if len(lines) == 1:
+                lines[0] = self._clip_end(lines[0], max(budget, 0))
+                break
+            lines.pop(0)
+        return "".join(parts + lines)
+
+    async def compact(self, state: Dict[str, Any]):
+        """Incorpora ao resumo os turnos além dos `recent_turns` mais recentes e os remove de state["messages"]."""
+        messages = state.get("messages", [])
+        turns = split_turns(messages)
+        if len(turns) <= self.recent_turns:
+            return
+        old = [m for turn in turns[:-self.recent_turns] for m in turn]
+        summary = state.get("history_summary", "")
+        new_summary = None
+        if self.summarizer == "llm":
+            try:
+                new_summary = await self._summarize_llm(summary, old)
+            except Exception as e:
+                print(f"[HISTORY] Erro ao resumir com o LLM, usando recorte: {e}")
+        if not new_summary:
+            new_summary = self._summarize_extract(summary, old)
+        del messages[:len(old)]
+        state["history_summary"] = self._clip_start(new_summary, self.summary_tokens)
+
+    async def compact_stored(self, store, session_id: str, state: Dict[str, Any]):
+        """
+        Compacta `state` (já gravado em `store`) sem sobrescrever o que outro worker gravou depois.
+
+        O resumo é feito numa cópia; no store entram só o novo resumo e a remoção dos turnos
+        resumidos, aplicados atomicamente (`store.aupdate`) ao estado gravado no momento. Se
+        ele não começar mais por esses turnos com o mesmo resumo (outro worker já compactou),
+        nada é gravado: a próxima resposta compacta de novo.
+        """
+        messages = list(state.get("messages", []))
+        previous = state.get("history_summary", "")
+        compacted = {"messages": list(messages), "history_summary": previous}
+        await self.compact(compacted)
+        removed = messages[:len(messages) - len(compacted["messages"])]
+        if not removed:
+            return None
+
+        def apply(current):
+            if current.get("history_summary", "") != previous or current.get("messages", [])[:len(removed)] != removed:
+                return None
+            current["messages"] = current["messages"][len(removed):]
+            current["history_summary"] = compacted["history_summary"]
+            return current
+
+        return await store.aupdate(session_id, apply)
+
+    async def _summarize_llm(self, summary: str, old: List[Message]) -> str:
+        from .llm_utils import llm_complete
+
+        prompt = SUMMARY_PROMPT.format(
+            palavras=int(self.summary_tokens * 0.6),
+            resumo=summary or "(vazio)",
+            trechos=self._clip_end(format_messages(old), self.token_budget),
+        )
+        return (await llm_complete(prompt, purpose="extraction")).strip()
+
+    def _summarize_extract(self, summary: str, old: List[Message]) -> str:
+        #cada mensagem vira uma linha curta; o começo do resumo é o que sai quando passar do tamanho
+        lines = [f"{ROLE_LABELS.get(m['role'], m['role'])}: {self._clip_end(' '.join(str(m['content']).split()), 30)}"
+                 for m in old]
+        return " | ".join(([summary] if summary else []) + lines)
+
+    @staticmethod
+    def _clip_end(text: str, tokens: int) -> str:
+        max_chars = tokens * 4
+        return text if len(text) <= max_chars else text[:max_chars].rstrip() + "…"
+
+    @staticmethod
+    def _clip_start(text: str, tokens: int) -> str:
+        max_chars = tokens * 4
+        return text if len(text) <= max_chars else "…" + text[-max_chars:].lstrip()
+
+
+conversation_history = ConversationHistory()
@@ -1,24 +1,89 @@
 from langchain_core.messages import HumanMessage
 from langchain_huggingface import ChatHuggingFace, HuggingFaceEndpoint
+import asyncio
 import os
 from dotenv import load_dotenv
-from faiss_memory.memory import long_term_memory
+from faiss_memory.shards import memory_shards
+from .history import conversation_history
 
 load_dotenv()
 hf_token = os.environ["HUGGINGFACEHUB_API_TOKEN"]
 
-hf_llm = HuggingFaceEndpoint(
-    repo_id="meta-llama/Meta-Llama-3-8B-Instruct",
-    task="text-generation",
-    max_new_tokens=512,
-    do_sample=True,
-    temperature=0.7,
-    huggingfacehub_api_token=hf_token
-)
+LLM_REPO_ID = "meta-llama/Meta-Llama-3-8B-Instruct"
 
-llm = ChatHuggingFace(llm=hf_llm, verbose=True)
+#configuração por finalidade: conversa com amostragem; extração (decisor, datas, e-mail) determinística
+LLM_PURPOSES = {
+    "chat": {"max_new_tokens": 512, "do_sample": True, "temperature": 0.7},
+    "extraction": {"max_new_tokens": int(os.environ.get("LLM_EXTRACTION_MAX_TOKENS", 256)), "do_sample": False, "temperature": None},
+}
 
-async def llm_ask(prompt, hist=None, store_in_memory=True, user_input=None):
+def build_llm(purpose):
+    endpoint = HuggingFaceEndpoint(
+        repo_id=LLM_REPO_ID,
+        task="text-generation",
+        huggingfacehub_api_token=hf_token,
+        **LLM_PURPOSES[purpose]
+    )
+    return ChatHuggingFace(llm=endpoint, verbose=True)
+
+llms = {purpose: build_llm(purpose) for purpose in LLM_PURPOSES}
+llm = llms["chat"]
+
+#limita as chamadas simultâneas ao endpoint: acima disso as sessões esperam a vez sem bloquear o event loop
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", 8))
+_llm_slots = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+def warmup_llm():
+    """
+    Faz uma chamada curta ao endpoint na inicialização: o modelo sai do cold start e a
+    conexão já está aberta quando chega a primeira mensagem. LLM_WARMUP=off desliga.
+    """
+    if os.environ.get("LLM_WARMUP", "on").lower() == "off":
+        return
+    llm.invoke([HumanMessage(content="Responda apenas: ok")])
+
+async def llm_complete(full_prompt, on_token=None, purpose="chat"):
+    """
+    Chamada assíncrona ao LLM (ainvoke/astream), limitada a LLM_MAX_CONCURRENCY em paralelo.
+
+    Args:
+        full_prompt: Prompt completo
+        on_token: Corrotina chamada com cada pedaço da resposta assim que ele chega (ativa o streaming)
+        purpose: Configuração do modelo (LLM_PURPOSES): "chat" ou "extraction" (sem amostragem)
+    """
+    messages = [HumanMessage(content=full_prompt)]
+    model = llms[purpose]
+    async with _llm_slots:
+        if on_token is None:
+            response = await model.ainvoke(messages)
+            return response.content
+        parts = []
+        async for chunk in model.astream(messages):
+            if chunk.content:
+                parts.append(chunk.content)
+                await on_token(chunk.content)
+        return "".join(parts)
+
+async def get_long_term_context(user_input, user_id=None, retrieval=None):
+    """
+    Busca na memória de longo prazo o contexto da mensagem do usuário.
+
+    Se `retrieval` (state["retrieval"]) já tiver o resultado para esta mesma mensagem,
+    reaproveita; senão faz a busca e guarda nele para os próximos nós do turno.
+    """
+    if retrieval is None:
+        retrieval = {}
+    if retrieval.get("query") == user_input:
+        return retrieval["context"]
+    async with memory_shards.ause(user_id) as long_term_memory:
+        memories = await long_term_memory.aretrieve_relevant_memory(user_input, n_results=long_term_memory.context_results)
+        long_term_context = long_term_memory.format_context(memories)
+    retrieval["query"] = user_input
+    retrieval["context"] = long_term_context
+    retrieval["memory_ids"] = [m["id"] for m in memories]
+    return long_term_context
+
+async def llm_ask(prompt, hist=None, store_in_memory=True, user_input=None, user_id=None, retrieval=None, on_token=None, summary=None, purpose="chat"):
     """
     Faz uma pergunta ao LLM com suporte à memória de longo prazo
     
@@ -27,11 +92,18 @@ async def llm_ask(prompt, hist=None, store_in_memory=True, user_input=None):
         hist: Histórico de conversa (opcional)
         store_in_memory: Se deve armazenar na memória de longo prazo
         user_input: Entrada original do usuário (para armazenar na memória)
+        user_id: Dono da memória (None = memória compartilhada padrão)
+        retrieval: Contexto de recuperação do turno (state["retrieval"]); evita repetir a busca a cada nó
+        on_token: Corrotina que recebe os tokens da resposta conforme chegam (ex.: cl.Message.stream_token)
+        summary: Resumo dos turnos antigos (state["history_summary"]); do histórico só entram os últimos turnos
+        purpose: "chat" ou "extraction" (respostas estruturadas, sem amostragem)
     """
     # Recupera contexto relevante da memória de longo prazo
     long_term_context = ""
+    if retrieval is None:
+        retrieval = {}
     if user_input:
-        long_term_context = long_term_memory.get_conversation_context(user_input)
+        long_term_context = await get_long_term_context(user_input, user_id, retrieval)
         print(f"[DEBUG] Contexto recuperado para '{user_input}': {len(long_term_context)} chars")
         if long_term_context:
             print(f"[DEBUG] Contexto: {long_term_context[:300]}...")
@@ -43,13 +115,9 @@ async def llm_ask(prompt, hist=None, store_in_memory=True, user_input=None):
     if long_term_context:
         context += f"Contexto de conversas anteriores:\n{long_term_context}\n\n"
     
-    # Adiciona histórico recente se disponível
-    if hist:
-        for msg in hist:
-            if msg["role"] == "user":
-                context += f"Usuário: {msg['content']}\n"
-            elif msg["role"] == "assistant":
-                context += f"Assistente: {msg['content']}\n"
+    # Adiciona o resumo e os últimos turnos, dentro do orçamento de tokens (ver utils.history)
+    if hist or summary:
+        context += conversation_history.prompt_context(hist, summary)
     
     # Combina o contexto com o prompt de forma mais clara
     if context:
@@ -66,24 +134,26 @@ IMPORTANTE: Se a pergunta for sobre algo mencionado nas conversas anteriores, us
         full_prompt = prompt
     
     # Faz a chamada ao LLM
-    response = llm.invoke([HumanMessage(content=full_prompt)])
-    response_content = response.content
+    response_content = await llm_complete(full_prompt, on_token, purpose)
     
     # Armazena na memória de longo prazo se solicitado
     if store_in_memory and user_input:
         try:
-            long_term_memory.store_conversation(
-                user_input=user_input,
-                assistant_response=response_content,
-                context=context if context else None
-            )
+            # reservado até o fim da gravação: o shard não é descarregado com o log aberto
+            async with memory_shards.ause(user_id) as long_term_memory:
+                # guarda só o turno; as memórias usadas como contexto ficam referenciadas por id
+                await long_term_memory.astore_conversation(
+                    user_input=user_input,
+                    assistant_response=response_content,
+                    source_ids=retrieval.get("memory_ids")
+                )
         except Exception as e:
             print(f"Erro ao armazenar na memória: {e}")
     
     return response_content
 
-async def llm_ask_with_memory(prompt, user_input, hist=None):
+async def llm_ask_with_memory(prompt, user_input, hist=None, user_id=None):
     """
     Versão simplificada que sempre usa memória
     """
-    return await llm_ask(prompt, hist, store_in_memory=True, user_input=user_input) 
\ No newline at end of file
+    return await llm_ask(prompt, hist, store_in_memory=True, user_input=user_input, user_id=user_id) 
\ No newline at end of file
@@ -0,0 +1,88 @@
+import copy
+import hashlib
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Optional, Tuple
+
+
+def normalize_input(texto: str, keep_case: bool = False) -> str:
+    """
+    Forma canônica da entrada: "Leia meus e-mails!" e "leia  meus e-mails" viram a mesma chave.
+    Com keep_case só espaços e pontuação final são ignorados (para extrações que copiam o texto).
+    """
+    texto = " ".join(texto.split()).strip(" .!?")
+    if keep_case:
+        return texto
+    sem_acento = unicodedata.normalize("NFD", texto.lower())
+    sem_acento = "".join(c for c in sem_acento if unicodedata.category(c) != "Mn")
+    return " ".join(re.sub(r"[^\w@.\-/: ]", " ", sem_acento).split())
+
+
+class ResponseCache:
+    """
+    Cache das respostas do LLM em tarefas de extração (decisor, datas, e-mail).
+
+    A chave é o id do template + a entrada normalizada (+ o dia, nos prompts que dependem
+    da data de hoje, + um digest do histórico, nos prompts que recebem a conversa), então
+    pedidos repetidos ou quase iguais saem na hora e com a mesma resposta. É por igualdade
+    da entrada normalizada, não por semelhança. Só respostas válidas entram (quem chama
+    decide); entradas vencem após `ttl` segundos e as menos usadas saem quando passa de
+    `max_entries`. Guarda e devolve cópias: quem altera o valor recebido não altera o cache.
+
+    Args:
+        ttl: Validade em segundos (padrão: LLM_CACHE_TTL ou 3600)
+        max_entries: Tamanho máximo (padrão: LLM_CACHE_SIZE ou 1024)
+        enabled: Liga/desliga (padrão: LLM_CACHE diferente de "off")
+    """
+
+    def __init__(self, ttl: Optional[float] = None, max_entries: Optional[int] = None,
+                 enabled: Optional[bool] = None):
+        self.ttl = ttl if ttl is not None else float(os.environ.get("LLM_CACHE_TTL", 3600))
+        self.max_entries = max_entries or int(os.environ.get("LLM_CACHE_SIZE", 1024))
+        if enabled is None:
+            enabled = os.environ.get("LLM_CACHE", "on").lower() != "off"
+        self.enabled = enabled
+        self._entries: "OrderedDict[Tuple, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(template_id: str, texto: str, dia: Optional[date] = None, keep_case: bool = False,
+            contexto: str = "") -> Tuple:
+        #contexto: o histórico que entra no prompt; "manda pra ele também" depende de quem é "ele"
+        digest = hashlib.sha1(contexto.encode("utf-8")).hexdigest() if contexto else None
+        return template_id, normalize_input(texto, keep_case), dia.isoformat() if dia else None, digest
+
+    def get(self, key: Tuple) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return copy.deepcopy(entry[1])
+
+    def put(self, key: Tuple, value: Any):
+        if not self.enabled:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, copy.deepcopy(value))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+response_cache = ResponseCache()
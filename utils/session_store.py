@@ -0,0 +1,267 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+State = Dict[str, Any]
+#recebe o estado gravado e devolve o novo (ou None para não gravar nada)
+Updater = Callable[[State], Optional[State]]
+
+
+class SessionStore(ABC):
+    """
+    Onde fica o estado (IcarusState) de cada sessão de chat entre uma mensagem e outra.
+
+    Três implementações, escolhidas por SESSION_STORE (ver `get_session_store`):
+    "memory" (LRU + TTL no processo), "sqlite" (arquivo local, sobrevive a reinícios e é
+    compartilhado pelos workers da mesma máquina) e "redis" (qualquer cliente com
+    get/set(ex=)/delete/transaction, compartilhado entre máquinas). Sessões sem uso por `ttl`
+    segundos expiram em todas.
+    """
+
+    def __init__(self, ttl: Optional[float] = None):
+        self.ttl = ttl if ttl is not None else float(os.environ.get("SESSION_TTL", 7 * 24 * 3600))
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[State]:
+        ...
+
+    @abstractmethod
+    def set(self, session_id: str, state: State):
+        ...
+
+    @abstractmethod
+    def delete(self, session_id: str):
+        ...
+
+    @abstractmethod
+    def update(self, session_id: str, fn: Updater) -> Optional[State]:
+        """
+        Lê o estado gravado, aplica `fn` e grava o resultado de uma vez só: nenhuma gravação
+        de outro worker no meio do caminho se perde. Sessão inexistente: `fn` não é chamada.
+        """
+
+    async def aget(self, session_id: str) -> Optional[State]:
+        return await asyncio.to_thread(self.get, session_id)
+
+    async def aset(self, session_id: str, state: State):
+        await asyncio.to_thread(self.set, session_id, state)
+
+    async def adelete(self, session_id: str):
+        await asyncio.to_thread(self.delete, session_id)
+
+    async def aupdate(self, session_id: str, fn: Updater) -> Optional[State]:
+        return await asyncio.to_thread(self.update, session_id, fn)
+
+    @staticmethod
+    def dumps(state: State) -> str:
+        #datas e outros valores que não são JSON viram texto
+        return json.dumps(state, ensure_ascii=False, default=str)
+
+    @staticmethod
+    def loads(data) -> State:
+        return json.loads(data)
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    Sessões no próprio processo, com limite de `max_sessions` (sai a usada há mais tempo)
+    e expiração após `ttl` segundos sem uso. Não sobrevive a reinícios.
+
+    Args:
+        ttl: Segundos sem uso até a sessão expirar (padrão: SESSION_TTL ou 7 dias)
+        max_sessions: Máximo de sessões guardadas (padrão: SESSION_MAX_SESSIONS ou 1000)
+    """
+
+    def __init__(self, ttl: Optional[float] = None, max_sessions: Optional[int] = None):
+        super().__init__(ttl)
+        self.max_sessions = max_sessions or int(os.environ.get("SESSION_MAX_SESSIONS", 1000))
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, session_id: str) -> Optional[State]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._sessions[session_id]
+                return None
+            self._sessions[session_id] = (time.monotonic() + self.ttl, entry[1])
+            self._sessions.move_to_end(session_id)
+            return entry[1]
+
+    def set(self, session_id: str, state: State):
+        with self._lock:
+            self._sessions[session_id] = (time.monotonic() + self.ttl, state)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def update(self, session_id: str, fn: Updater) -> Optional[State]:
+        with self._lock:
+            state = self.get(session_id)
+            if state is None:
+                return None
+            state = fn(state)
+            if state is not None:
+                self.set(session_id, state)
+            return state
+
+    # no processo não há E/S: evita o custo de ir para uma thread
+    async def aget(self, session_id: str) -> Optional[State]:
+        return self.get(session_id)
+
+    async def aset(self, session_id: str, state: State):
+        self.set(session_id, state)
+
+    async def adelete(self, session_id: str):
+        self.delete(session_id)
+
+    async def aupdate(self, session_id: str, fn: Updater) -> Optional[State]:
+        return self.update(session_id, fn)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Sessões num arquivo SQLite (modo WAL): sobrevivem a reinícios e podem ser usadas por
+    vários workers na mesma máquina. Sessões expiradas são apagadas a cada
+    `purge_every` gravações.
+
+    Args:
+        path: Arquivo (padrão: SESSION_DB_PATH ou ./sessions.sqlite3)
+        ttl: Segundos sem uso até a sessão expirar (padrão: SESSION_TTL ou 7 dias)
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl: Optional[float] = None, purge_every: int = 200):
+        super().__init__(ttl)
+        self.path = path or os.environ.get("SESSION_DB_PATH", "./sessions.sqlite3")
+        self.purge_every = purge_every
+        self._writes = 0
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, state TEXT, expires_at REAL)"
+        )
+        self._conn.commit()
+
+    def get(self, session_id: str) -> Optional[State]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state FROM sessions WHERE id = ? AND expires_at > ?", (session_id, time.time())
+            ).fetchone()
+        return self.loads(row[0]) if row else None
+
+    def set(self, session_id: str, state: State):
+        data = self.dumps(state)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)", (session_id, data, time.time() + self.ttl)
+            )
+            self._writes += 1
+            if self._writes % self.purge_every == 0:
+                self._conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),))
+            self._conn.commit()
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._conn.commit()
+
+    def update(self, session_id: str, fn: Updater) -> Optional[State]:
+        with self._lock:
+            #BEGIN IMMEDIATE trava as gravações dos outros processos até o commit
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                state = self.get(session_id)
+                if state is not None:
+                    state = fn(state)
+                if state is not None:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)",
+                        (session_id, self.dumps(state), time.time() + self.ttl)
+                    )
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        return state
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Sessões num Redis (ou serviço compatível), compartilhadas por workers em várias máquinas.
+    A expiração fica com o próprio Redis (SET com EX); `update` usa WATCH/MULTI (transaction
+    do redis-py), que refaz a leitura se outro worker gravar a sessão no meio.
+
+    Args:
+        client: Cliente com get(key), set(key, value, ex=segundos), delete(key) e
+            transaction(func, *keys, value_from_callable=True); padrão:
+            redis.Redis.from_url(REDIS_URL). Em testes, qualquer objeto com essa interface.
+        ttl: Segundos sem uso até a sessão expirar (padrão: SESSION_TTL ou 7 dias)
+        prefix: Prefixo das chaves
+    """
+
+    def __init__(self, client=None, ttl: Optional[float] = None, prefix: str = "icarus:session:"):
+        super().__init__(ttl)
+        if client is None:
+            import redis  # importado só com SESSION_STORE=redis
+            client = redis.Redis.from_url(os.environ.get("REDIS_URL", "redis://localhost:6379/0"))
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, session_id: str) -> Optional[State]:
+        data = self.client.get(self.prefix + session_id)
+        return self.loads(data) if data is not None else None
+
+    def set(self, session_id: str, state: State):
+        self.client.set(self.prefix + session_id, self.dumps(state), ex=int(self.ttl))
+
+    def delete(self, session_id: str):
+        self.client.delete(self.prefix + session_id)
+
+    def update(self, session_id: str, fn: Updater) -> Optional[State]:
+        key = self.prefix + session_id
+
+        def transaction(pipe):
+            data = pipe.get(key)
+            state = fn(self.loads(data)) if data is not None else None
+            pipe.multi()
+            if state is not None:
+                pipe.set(key, self.dumps(state), ex=int(self.ttl))
+            return state
+
+        return self.client.transaction(transaction, key, value_from_callable=True)
+
+
+_session_store = None
+_session_store_lock = threading.Lock()
+
+def get_session_store() -> SessionStore:
+    """Store do processo, conforme SESSION_STORE: "sqlite" (padrão), "memory" ou "redis"."""
+    global _session_store
+    with _session_store_lock:
+        if _session_store is None:
+            backend = os.environ.get("SESSION_STORE", "sqlite").lower()
+            if backend == "memory":
+                _session_store = InMemorySessionStore()
+            elif backend == "redis":
+                _session_store = RedisSessionStore()
+            elif backend == "sqlite":
+                _session_store = SQLiteSessionStore()
+            else:
+                raise ValueError(f"SESSION_STORE inválido: {backend} (use sqlite, memory ou redis)")
+        return _session_store